@@ -1,16 +1,35 @@
 # ==========================
 # IMPORTACIONES Y CONFIGURACIÓN
 # ==========================
-from flask import Flask, request, redirect, session, jsonify
+from flask import Flask, request, redirect, session, jsonify, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 import sqlglot
 import time
 import json
 import os
 import re
 import csv
+import operator
+import functools
+import itertools
+import copy
+import weakref
+import bisect
+import heapq
+from decimal import Decimal, InvalidOperation
+import sys
+import struct
+from array import array
 from io import StringIO
 import datetime
 import shutil
+import tempfile
+import pickle
+import threading
+import queue
+import uuid
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
 from flask_cors import CORS
 import unicodedata
 from google_auth_oauthlib.flow import Flow
@@ -22,88 +41,2984 @@ from google.auth.transport import requests as grequests
 # ==========================
 # CONSTANTES Y APP FLASK
 # ==========================
+class QueryCraftJSONProvider(DefaultJSONProvider):
+    """Serializa fechas en ISO 8601 y DECIMAL sin perder precisión."""
+    @staticmethod
+    def default(o):
+        if isinstance(o, (datetime.date, Decimal)):
+            return json_default(o)
+        return DefaultJSONProvider.default(o)
+
 app = Flask(__name__)
+app.json = QueryCraftJSONProvider(app)
 CORS(app, supports_credentials=True)
 DATA_DIR = "data"
 app.secret_key = "una_clave_secreta_segura"
 
-os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+
+CLIENT_SECRETS_FILE = "credentials.json"
+SCOPES = ["https://www.googleapis.com/auth/drive.file"]
+
+# Formato columnar de tablas: "<tabla>.qct" reemplaza al antiguo "<tabla>.json"
+TABLE_EXT = ".qct"
+LEGACY_TABLE_EXT = ".json"
+# Índices persistidos en cada checkpoint: "<tabla>.<índice>.idx"
+INDEX_EXT = ".idx"
+# Catálogo de cada base (tablas, esquemas, filas y tamaños); no es un nombre de tabla válido
+CATALOG_FILE = ".catalog.json"
+TABLE_MAGIC = b"QCT1"
+TABLE_FORMAT_VERSION = 2
+# Filas por grupo (segmento) del archivo; cada grupo guarda min/máx/nulos por columna
+ROW_GROUP_SIZE = 2048
+# Log de escritura (redo) por tabla ("<tabla>.log"): se hace checkpoint (se incorpora al
+# archivo base) en segundo plano al llegar a LOG_COMPACT_RECORDS registros o cada
+# CHECKPOINT_INTERVAL segundos; eso acota el trabajo de recuperación al iniciar
+LOG_EXT = ".log"
+LOG_COMPACT_RECORDS = 1000
+CHECKPOINT_INTERVAL = 60
+# Commit en grupo del log: el primer escritor espera hasta COMMIT_DELAY_MS a que
+# se sumen otros (o a juntar COMMIT_BATCH_SIZE registros) y los escribe con un solo fsync
+COMMIT_DELAY_MS = 2
+COMMIT_BATCH_SIZE = 64
+# Presupuesto de memoria del buffer pool de tablas decodificadas
+BUFFER_POOL_BYTES = 256 * 1024 * 1024
+# Versiones de respaldo que se conservan por tabla antes de consolidar la base
+BACKUP_MAX_VERSIONS = 20
+# Estadísticas por tabla ("<tabla>.stats.json"): cubetas del histograma y filas
+# modificadas tras las que se vuelve a analizar la tabla en segundo plano
+STATS_EXT = ".stats.json"
+HISTOGRAM_BUCKETS = 32
+AUTO_ANALYZE_CHANGES = 1000
+# Los DELETE solo marcan filas como borradas; al superar esta fracción de filas
+# muertas, el vacuum reescribe la tabla sin ellas en segundo plano
+VACUUM_DEAD_RATIO = 0.2
+# ORDER BY: hasta SORT_MEMORY_ROWS filas se ordenan en memoria; una entrada mayor
+# se ordena en tramos de ese tamaño que se escriben a archivos temporales (en
+# bloques de SORT_SPILL_BLOCK filas) y luego se mezclan
+SORT_MEMORY_ROWS = 2000000
+SORT_SPILL_BLOCK = 8192
+# ==========================
+# ALMACENAMIENTO COLUMNAR
+# ==========================
+class DictColumn:
+    """
+    Columna codificada con diccionario: cada valor distinto se guarda una sola
+    vez en `dictionary` y cada fila guarda solo su código entero en `codes`.
+    Se usa para columnas de texto de baja cardinalidad y se comporta como una
+    lista de valores (índices, slices, iteración, append).
+    """
+    __slots__ = ("dictionary", "codes", "_index")
+
+    def __init__(self, values=()):
+        self.dictionary = []
+        self.codes = array("I")
+        self._index = {}
+        self.extend(values)
+
+    def code_of(self, value):
+        """Código del valor, agregándolo al diccionario si es nuevo."""
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.dictionary)
+            self.dictionary.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        dictionary = self.dictionary
+        return (dictionary[c] for c in self.codes)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            dictionary = self.dictionary
+            return [dictionary[c] for c in self.codes[i]]
+        return self.dictionary[self.codes[i]]
+
+    def __setitem__(self, i, value):
+        self.codes[i] = self.code_of(value)
+
+    def __sizeof__(self):
+        return (object.__sizeof__(self) + sys.getsizeof(self.codes) + sys.getsizeof(self.dictionary)
+                + sys.getsizeof(self._index) + sum(sys.getsizeof(v) for v in self.dictionary))
+
+    def append(self, value):
+        self.codes.append(self.code_of(value))
+
+    def extend(self, values):
+        code_of = self.code_of
+        self.codes.extend(code_of(v) for v in values)
+
+    def extend_codes(self, dictionary, codes):
+        """Agrega filas codificadas con otro diccionario (un grupo de filas del archivo)."""
+        remap = [self.code_of(v) for v in dictionary]
+        self.codes.extend(remap[c] for c in codes)
+
+    def copy(self):
+        """Copia independiente (diccionario y códigos)."""
+        column = DictColumn()
+        column.dictionary = list(self.dictionary)
+        column._index = dict(self._index)
+        column.codes = array("I", self.codes)
+        return column
+
+    def take(self, row_ids):
+        """Nueva columna con las filas indicadas; comparte los valores del diccionario."""
+        column = DictColumn()
+        column.dictionary = list(self.dictionary)
+        column._index = dict(self._index)
+        codes = self.codes
+        column.codes = array("I", (codes[i] for i in row_ids))
+        return column
+
+    def matching_codes(self, predicate):
+        """Códigos cuyo valor cumple el predicado (se evalúa una vez por valor distinto)."""
+        return {code for code, value in enumerate(self.dictionary) if predicate(value)}
+
+def column_keys(values, key_fn):
+    """
+    Aplica `key_fn` a cada valor de una columna; en columnas con diccionario
+    se calcula una sola vez por código.
+    """
+    if isinstance(values, DictColumn):
+        keys = [key_fn(v) for v in values.dictionary]
+        return [keys[c] for c in values.codes]
+    memo = {}
+    return [memo[v] if v in memo else memo.setdefault(v, key_fn(v)) for v in values]
+
+def group_keys(values):
+    """Claves de agrupación de una columna: los códigos si tiene diccionario, si no los valores."""
+    return values.codes if isinstance(values, DictColumn) else values
+
+class HashIndex:
+    """
+    Índice hash de una columna: valor -> índices de fila, en orden. Se
+    construye al primer uso (o se carga del archivo del último checkpoint) y
+    luego INSERT/UPDATE lo mantienen fila a fila. Las filas borradas se
+    filtran con el bitmap hasta que el vacuum las elimina y el índice se rehace.
+    En columnas con collation las entradas se indexan por la clave de comparación.
+    """
+    kind = "hash"
+
+    def __init__(self, name, column, unique=False):
+        self.name = name
+        self.column = column
+        # Respalda una restricción PRIMARY KEY o UNIQUE de la columna
+        self.unique = unique
+        # Clave de comparación de la collation de la columna (None: binaria); la asigna la tabla
+        self.key = None
+        # None: aún no construido (no hace falta mantenerlo)
+        self.entries = None
+
+    def definition(self):
+        definition = {"name": self.name, "column": self.column, "kind": self.kind}
+        if self.unique:
+            definition["unique"] = True
+        return definition
+
+    def load(self, entries):
+        """Usa las entradas guardadas en el archivo del índice."""
+        self.entries = entries
+
+    def entry_key(self, value):
+        return value if self.key is None or value is None else self.key(value)
+
+    def build(self, values):
+        entries = {}
+        entry_key = self.entry_key
+        if isinstance(values, DictColumn):
+            by_code = {}
+            for i, code in enumerate(values.codes):
+                by_code.setdefault(code, []).append(i)
+            for code, ids in by_code.items():
+                entries.setdefault(entry_key(values.dictionary[code]), []).extend(ids)
+            if self.key is not None:
+                # Varios valores del diccionario pueden compartir clave
+                for ids in entries.values():
+                    ids.sort()
+        else:
+            for i, value in enumerate(values):
+                entries.setdefault(entry_key(value), []).append(i)
+        self.entries = entries
+
+    def copy(self):
+        """Copia independiente (con sus listas de filas), para modificarla sin tocar la original."""
+        index = copy.copy(self)
+        if self.entries is not None:
+            index.entries = {value: list(ids) for value, ids in self.entries.items()}
+        return index
+
+    def add(self, value, i):
+        self.entries.setdefault(self.entry_key(value), []).append(i)
+
+    def replace(self, old_values, row_ids, value):
+        """Mueve las filas `row_ids` de sus valores anteriores a `value`."""
+        moved = {}
+        for i, old in zip(row_ids, old_values):
+            moved.setdefault(self.entry_key(old), set()).add(i)
+        for old, ids in moved.items():
+            remaining = [i for i in self.entries.get(old, ()) if i not in ids]
+            if remaining:
+                self.entries[old] = remaining
+            else:
+                self.entries.pop(old, None)
+        target = self.entries.setdefault(self.entry_key(value), [])
+        target.extend(row_ids)
+        target.sort()
+
+    def lookup(self, value):
+        return self.entries.get(self.entry_key(value), ())
+
+    def range_lookup(self, op, literal):
+        """Un índice hash no sirve para rangos."""
+        return None
+
+class OrderedIndex(HashIndex):
+    """
+    Índice ordenado (USING BTREE): además de valor -> filas mantiene la lista
+    ordenada de valores distintos, así los rangos, el orden de ORDER BY y
+    MIN/MAX se resuelven con búsqueda binaria en lugar de recorrer la columna.
+    Los NULL quedan fuera de la lista (no cumplen ningún rango).
+    """
+    kind = "btree"
+
+    def __init__(self, name, column, unique=False):
+        super().__init__(name, column, unique)
+        # None también si los valores no son comparables entre sí (datos antiguos mezclados)
+        self.keys = None
+
+    def _sort_keys(self):
+        try:
+            self.keys = sorted(value for value in self.entries if value is not None)
+        except TypeError:
+            self.keys = None
+
+    def build(self, values):
+        super().build(values)
+        self._sort_keys()
+
+    def load(self, entries):
+        super().load(entries)
+        self._sort_keys()
+
+    def _insert_key(self, value):
+        if self.keys is not None and value is not None:
+            try:
+                bisect.insort(self.keys, value)
+            except TypeError:
+                self.keys = None
+
+    def _remove_key(self, value):
+        if self.keys is not None and value is not None:
+            pos = bisect.bisect_left(self.keys, value)
+            if pos < len(self.keys) and self.keys[pos] == value:
+                del self.keys[pos]
+
+    def copy(self):
+        index = super().copy()
+        if self.keys is not None:
+            index.keys = list(self.keys)
+        return index
+
+    def add(self, value, i):
+        key = self.entry_key(value)
+        if key not in self.entries:
+            self._insert_key(key)
+        super().add(value, i)
+
+    def replace(self, old_values, row_ids, value):
+        before = {self.entry_key(old) for old in old_values}
+        key = self.entry_key(value)
+        new_key = key not in self.entries
+        super().replace(old_values, row_ids, value)
+        for old in before:
+            if old not in self.entries:
+                self._remove_key(old)
+        if new_key:
+            self._insert_key(key)
+
+    def range_lookup(self, op, literal):
+        """Filas con `columna op literal` (en orden de fila), o None si el índice no sirve."""
+        keys = self.keys
+        if keys is None:
+            return None
+        literal = self.entry_key(literal)
+        try:
+            if op == "<":
+                selected = keys[:bisect.bisect_left(keys, literal)]
+            elif op == "<=":
+                selected = keys[:bisect.bisect_right(keys, literal)]
+            elif op == ">":
+                selected = keys[bisect.bisect_right(keys, literal):]
+            elif op == ">=":
+                selected = keys[bisect.bisect_left(keys, literal):]
+            else:
+                return None
+        except TypeError:
+            return None
+        entries = self.entries
+        if len(selected) == 1:
+            return list(entries[selected[0]])
+        return sorted(i for value in selected for i in entries[value])
+
+    def ordered_row_ids(self, descending=False):
+        """Filas en orden de la columna, a medida que se piden; los NULL van primero en orden ascendente."""
+        nulls = self.entries.get(None, [])
+        keys = reversed(self.keys) if descending else self.keys
+        if not descending:
+            yield from nulls
+        for value in keys:
+            yield from self.entries[value]
+        if descending:
+            yield from nulls
+
+    def extreme_value(self, largest, is_deleted=None):
+        """MIN (o MAX) de la columna: el primer valor de la lista con alguna fila viva."""
+        for value in (reversed(self.keys) if largest else self.keys):
+            if is_deleted is None or not all(is_deleted(i) for i in self.entries[value]):
+                return value
+        return None
+
+INDEX_KINDS = {"hash": HashIndex, "btree": OrderedIndex}
+
+def column_constraint(col):
+    """"PRIMARY KEY", "UNIQUE" o None según la restricción declarada en la columna."""
+    if col.get("primary_key"):
+        return "PRIMARY KEY"
+    if col.get("unique"):
+        return "UNIQUE"
+    return None
+
+def index_usable(literal):
+    """
+    Un literal de texto numérico sobre una columna de texto se compara como
+    número (ver make_predicate), así que no sirve una búsqueda exacta.
+    """
+    return not (isinstance(literal, str) and _as_number(literal) is not None)
+
+def count_deleted(deleted, start, end):
+    """Filas marcadas en el bitmap de borradas entre `start` (múltiplo de 8) y `end`."""
+    return bin(int.from_bytes(deleted[start >> 3:(end + 7) >> 3], "little")).count("1")
+
+class TableData:
+    """
+    Tabla decodificada en memoria, organizada por columnas.
+    `columns` es el esquema ([{"name", "type"}]) y `data` guarda una lista de
+    valores por columna (None representa NULL), todas de la misma longitud.
+    Las filas borradas siguen en `data` hasta el vacuum: `deleted` es un
+    bitmap (un bit por fila) que los recorridos respetan.
+    """
+    def __init__(self, columns, data=None, lsn=0, table_id=None, zones=None, deleted=None):
+        self.columns = columns
+        self.data = data if data is not None else {col["name"]: [] for col in columns}
+        # Último registro del log incorporado a estos datos
+        self.lsn = lsn
+        # Identidad de la tabla (cambia si se borra y se vuelve a crear con el mismo nombre)
+        self.table_id = table_id
+        # Zone maps por columna: una entrada por grupo de ROW_GROUP_SIZE filas
+        self.zones = zones if zones is not None else {}
+        self.deleted = deleted if deleted is not None else bytearray()
+        self.dead_count = sum(bin(b).count("1") for b in self.deleted)
+        # Índices por nombre (ver HashIndex)
+        self.indexes = {}
+        # Filas visibles de una vista de lectura (ver snapshot); None: todas las de las columnas
+        self.frozen_rows = None
+        # Vistas abiertas que comparten columnas e índices con esta tabla
+        self._views = weakref.WeakSet()
+
+    @classmethod
+    def from_rows(cls, columns, rows):
+        """Construye la tabla a partir del formato antiguo (lista de diccionarios con texto)."""
+        return cls(columns, {col["name"]: coerce_column(col, [row.get(col["name"]) for row in rows]) for col in columns})
+
+    @property
+    def column_names(self):
+        return [col["name"] for col in self.columns]
+
+    def column_schema(self, name):
+        for col in self.columns:
+            if col["name"] == name:
+                return col
+        return None
+
+    @property
+    def row_count(self):
+        if self.frozen_rows is not None:
+            return self.frozen_rows
+        for values in self.data.values():
+            return len(values)
+        return 0
+
+    @property
+    def live_count(self):
+        return self.row_count - self.dead_count
+
+    def is_deleted(self, i):
+        byte = i >> 3
+        return byte < len(self.deleted) and bool(self.deleted[byte] & (1 << (i & 7)))
+
+    def has_deleted(self, start, end):
+        """Indica si hay filas borradas en [inicio, fin), con inicio múltiplo de 8."""
+        return self.dead_count > 0 and any(self.deleted[start >> 3:(end + 7) >> 3])
+
+    def drop_deleted(self, row_ids):
+        """Los ids de `row_ids` que no están borrados (el bitmap se consulta sin llamadas por fila)."""
+        deleted = self.deleted
+        size = len(deleted)
+        return [i for i in row_ids if (i >> 3) >= size or not deleted[i >> 3] & (1 << (i & 7))]
+
+    def mark_deleted(self, row_ids):
+        """Marca filas como borradas en el bitmap (sin moverlas)."""
+        deleted = self.deleted
+        for i in row_ids:
+            byte, bit = i >> 3, 1 << (i & 7)
+            if byte >= len(deleted):
+                deleted.extend(bytes(byte + 1 - len(deleted)))
+            if not deleted[byte] & bit:
+                deleted[byte] |= bit
+                self.dead_count += 1
+
+    def live_row_ids(self):
+        """Índices de las filas no borradas."""
+        if not self.dead_count:
+            return range(self.row_count)
+        return list(self.iter_live_row_ids())
+
+    def iter_live_row_ids(self, skip=0):
+        """
+        Índices de las filas no borradas, uno a la vez (scan sin materializar
+        la lista). `skip` salta las primeras filas vivas (OFFSET): los grupos
+        de filas que quedan enteros antes se descartan contando sus borradas
+        en el bitmap, sin recorrerlos.
+        """
+        row_count = self.row_count
+        if not self.dead_count:
+            yield from range(skip, row_count)
+            return
+        first = 0
+        while skip and first < row_count:
+            end = min(first + ROW_GROUP_SIZE, row_count)
+            live = end - first - count_deleted(self.deleted, first, end)
+            if live > skip:
+                break
+            skip -= live
+            first = end
+        yield from itertools.islice(self._live_ids_from(first), skip, None)
+
+    def _live_ids_from(self, first):
+        """Filas vivas desde `first` (múltiplo de 8) hasta el final."""
+        row_count = self.row_count
+        deleted = self.deleted
+        for byte in range(first >> 3, (row_count + 7) >> 3):
+            start = byte << 3
+            end = min(start + 8, row_count)
+            mask = deleted[byte] if byte < len(deleted) else 0
+            if not mask:
+                yield from range(start, end)
+            else:
+                yield from (i for i in range(start, end) if not mask & (1 << (i - start)))
+
+    def live_values(self, name):
+        """Valores de una columna sin las filas borradas."""
+        values = self.data[name]
+        if not self.dead_count:
+            return values
+        return [values[i] for i in self.live_row_ids()]
+
+    def row(self, i):
+        return {name: values[i] for name, values in self.data.items()}
+
+    def iter_rows(self):
+        """Materializa las filas no borradas como diccionarios, una a la vez."""
+        names = list(self.data)
+        if self.dead_count:
+            columns = list(self.data.values())
+            for i in self.live_row_ids():
+                yield {name: values[i] for name, values in zip(names, columns)}
+            return
+        for values in zip(*self.data.values()):
+            yield dict(zip(names, values))
+
+    def index_on(self, name):
+        """Índice (construido) de la columna, o None si no tiene."""
+        for index in self.indexes.values():
+            if index.column == name:
+                if index.entries is None:
+                    index.build(self.data[name])
+                return index
+        return None
+
+    def attach_index(self, index):
+        """Registra un índice (sin construirlo) con la collation de su columna."""
+        index.key = collation_key_fn(self.column_schema(index.column))
+        self.indexes[index.name] = index
+
+    def add_index(self, index):
+        self.attach_index(index)
+        index.build(self.data[index.column])
+
+    def _live_matches(self, name, value):
+        index = self.index_on(name)
+        ids = index.lookup(value) if index is not None else self._matching_rows(name, "=", value)
+        return [i for i in ids if not self.is_deleted(i)]
+
+    def check_unique(self, rows):
+        """
+        Valida PRIMARY KEY/UNIQUE para filas nuevas: cada valor es una búsqueda
+        en el índice de la restricción. UNIQUE admite varios NULL.
+        """
+        for col in self.columns:
+            constraint = column_constraint(col)
+            if constraint is None:
+                continue
+            name = col["name"]
+            key = collation_key_fn(col)
+            seen = set()
+            for row in rows:
+                value = row.get(name)
+                if value is None:
+                    if constraint == "PRIMARY KEY":
+                        raise ValueError(f'La columna {name} (PRIMARY KEY) no admite NULL')
+                    continue
+                if (key(value) if key else value) in seen or self._live_matches(name, value):
+                    raise ValueError(f'Valor duplicado {value} en la columna {name} ({constraint})')
+                seen.add(key(value) if key else value)
+
+    def check_unique_update(self, name, row_ids, value):
+        """Valida que asignar `value` a las filas `row_ids` no repita una clave."""
+        constraint = column_constraint(self.column_schema(name))
+        if constraint is None or not row_ids:
+            return
+        if value is None:
+            if constraint == "PRIMARY KEY":
+                raise ValueError(f'La columna {name} (PRIMARY KEY) no admite NULL')
+            return
+        updating = set(row_ids)
+        if len(updating) > 1 or any(i not in updating for i in self._live_matches(name, value)):
+            raise ValueError(f'Valor duplicado {value} en la columna {name} ({constraint})')
+
+    def snapshot(self):
+        """
+        Vista de solo lectura del estado actual, para un resultado que se
+        consume después (streaming). Comparte columnas e índices, copia el
+        bitmap de borradas y los zone maps y fija la cantidad de filas: los
+        INSERT agregan al final (fuera de la vista), el vacuum reemplaza las
+        columnas y los índices, y un UPDATE copia antes la columna o el
+        índice que una vista comparte. Se toma con la tabla bloqueada.
+        """
+        for index in self.indexes.values():
+            if index.entries is None:
+                index.build(self.data[index.column])
+        view = copy.copy(self)
+        view.data = dict(self.data)
+        view.zones = {name: list(zones) for name, zones in self.zones.items()}
+        view.deleted = bytearray(self.deleted)
+        view.indexes = dict(self.indexes)
+        view.frozen_rows = self.row_count
+        view._views = weakref.WeakSet()
+        self._views.add(view)
+        return view
+
+    def _own_column(self, name):
+        """Columna para modificar en su lugar; si una vista la comparte, antes se copia."""
+        values = self.data[name]
+        if any(view.data.get(name) is values for view in self._views):
+            values = self.data[name] = values.copy()
+        return values
+
+    def _own_index(self, name):
+        """Índice para modificar en su lugar; si una vista lo comparte, antes se copia."""
+        index = self.indexes[name]
+        if any(view.indexes.get(name) is index for view in self._views):
+            index = self.indexes[name] = index.copy()
+        return index
+
+    def append(self, row):
+        for name, values in self.data.items():
+            value = row.get(name)
+            values.append(value)
+            zones = self.zones.get(name)
+            if zones is not None:
+                if (len(values) - 1) % ROW_GROUP_SIZE == 0:
+                    zones.append(compute_zone([]))
+                widen_zone(zones[-1], value)
+        for index_name, index in list(self.indexes.items()):
+            if index.entries is not None:
+                self._own_index(index_name).add(row.get(index.column), self.row_count - 1)
+
+    def update_rows(self, name, row_ids, value):
+        values = self._own_column(name)
+        for index_name, index in list(self.indexes.items()):
+            if index.column == name and index.entries is not None:
+                self._own_index(index_name).replace([values[i] for i in row_ids], row_ids, value)
+        zones = self.zones.get(name)
+        for i in row_ids:
+            values[i] = value
+            if zones is not None:
+                widen_zone(zones[i // ROW_GROUP_SIZE], value)
+
+    def keep_rows(self, row_ids):
+        """Conserva solo las filas indicadas (en el orden dado)."""
+        dead = [new for new, old in enumerate(row_ids) if self.is_deleted(old)] if self.dead_count else []
+        for name, values in self.data.items():
+            if isinstance(values, DictColumn):
+                self.data[name] = values.take(row_ids)
+            else:
+                self.data[name] = [values[i] for i in row_ids]
+        # Las filas cambiaron de posición: el bitmap se rehace y los zone maps se recalculan al usarse
+        self.deleted = bytearray()
+        self.dead_count = 0
+        self.mark_deleted(dead)
+        self.zones = {}
+        # Índices nuevos (se construyen al usarse): los anteriores pueden seguir en uso por una vista
+        indexes, self.indexes = self.indexes, {}
+        for index in indexes.values():
+            self.attach_index(type(index)(index.name, index.column, index.unique))
+
+    def vacuum(self):
+        """Elimina físicamente las filas marcadas como borradas."""
+        if self.dead_count:
+            self.keep_rows(self.live_row_ids())
+
+    def delete_rows(self, row_ids):
+        deleted = set(row_ids)
+        self.keep_rows([i for i in range(self.row_count) if i not in deleted])
+
+    def to_dict(self):
+        return {"columns": self.columns, "rows": list(self.iter_rows())}
+
+    def zone_maps(self, name):
+        """Zone map (mín/máx/nulos) de cada grupo de filas de una columna."""
+        zones = self.zones.get(name)
+        if zones is None:
+            values = self.data[name]
+            zones = self.zones[name] = [
+                compute_zone(values[start:start + ROW_GROUP_SIZE])
+                for start in range(0, len(values), ROW_GROUP_SIZE)
+            ]
+        return zones
+
+    def candidate_ranges(self, name, op, literal):
+        """Rangos [inicio, fin) de los grupos cuyo zone map admite `columna op literal`."""
+        row_count = self.row_count
+        for g, zone in enumerate(self.zone_maps(name)):
+            if zone_may_match(zone, op, literal):
+                start = g * ROW_GROUP_SIZE
+                yield start, min(start + ROW_GROUP_SIZE, row_count)
+
+    def _matching_rows(self, name, op, literal):
+        """
+        Índices de las filas que cumplen `columna op literal`. Una igualdad
+        sobre una columna con índice (o un rango, si el índice es ordenado) es
+        una búsqueda en el índice; si no, solo
+        se recorren los grupos que admite el zone map y, en columnas con
+        diccionario, se compara el código de cada fila contra los que cumplen.
+        En columnas con collation se comparan las claves (en caché) de los
+        valores y el zone map no se usa, porque guarda los valores originales.
+        """
+        matched = self.index_rows(name, op, literal)
+        if matched is not None:
+            return matched
+        key = collation_key_fn(self.column_schema(name))
+        kernel = comparison_kernel(self, name, op, literal)
+        if kernel is not None:
+            # Cada grupo que admite el zone map se filtra como un lote (ver comparison_kernel)
+            if key is None:
+                ranges = self.candidate_ranges(name, op, literal)
+            else:
+                ranges = ((start, min(start + ROW_GROUP_SIZE, self.row_count)) for start in range(0, self.row_count, ROW_GROUP_SIZE))
+            return [i for start, end in ranges for i in kernel(start, end, None)]
+        values = self.data[name]
+        predicate = comparison_predicate(self.column_schema(name), op, literal)
+        ranges = list(self.candidate_ranges(name, op, literal)) if key is None else [(0, self.row_count)]
+        return [i for start, end in ranges for i in range(start, end) if predicate(values[i])]
+
+    def index_rows(self, name, op, literal):
+        """Filas de `columna op literal` según el índice de la columna, o None si no tiene uno que sirva."""
+        if op in ("=", "<", ">", "<=", ">=") and literal is not None and index_usable(literal):
+            index = self.index_on(name)
+            if index is not None:
+                if op == "=":
+                    return list(index.lookup(literal))
+                return index.range_lookup(op, literal)
+        return None
+
+    def matching_rows(self, name, op, literal):
+        """Índices de las filas no borradas que cumplen `columna op literal`."""
+        matched = self._matching_rows(name, op, literal)
+        if self.dead_count:
+            return [i for i in matched if not self.is_deleted(i)]
+        return matched
+
+
+# ==========================
+# TIPOS DE DATOS
+# ==========================
+# Los valores se guardan ya convertidos al tipo declarado de la columna:
+# INT/BIGINT -> int, DECIMAL/NUMERIC -> Decimal, FLOAT -> float, BIT -> bool,
+# DATE -> date, DATETIME/TIMESTAMP -> datetime y el resto como str.
+INT_TYPES = ('INT', 'BIGINT')
+DECIMAL_TYPES = ('DECIMAL', 'NUMERIC')
+DATE_TYPES = ('DATE', 'DATETIME', 'TIMESTAMP')
+TEXT_TYPES = ('VARCHAR', 'CHAR', 'NVARCHAR')
+NATIVE_TYPES = INT_TYPES + DECIMAL_TYPES + DATE_TYPES + ('FLOAT', 'BIT')
+
+def base_type(col_type):
+    match = re.match(r'^([A-Z]+)', col_type.upper())
+    return match.group(1) if match else ''
+
+# Collations de columnas de texto (VARCHAR(50) COLLATE ci_ai): cada una es la
+# función que da la clave de comparación de un valor. Sin collation declarada
+# la comparación es binaria (cs_as). Las claves se guardan en caché, así cada
+# valor distinto se normaliza una sola vez.
+@functools.lru_cache(maxsize=65536)
+def _ci_as_key(text):
+    return text.strip().lower()
+
+@functools.lru_cache(maxsize=65536)
+def _ci_ai_key(text):
+    return normalizar(text)
+
+COLLATIONS = {"cs_as": None, "ci_as": _ci_as_key, "ci_ai": _ci_ai_key}
+# Los JOIN entre columnas sin collation declarada comparan como siempre: sin acentos ni mayúsculas
+JOIN_DEFAULT_COLLATION = "ci_ai"
+
+def collation_key_fn(col):
+    """Clave de comparación de la columna según su collation, o None si es binaria."""
+    return COLLATIONS.get(col.get("collation")) if col else None
+
+def json_default(o):
+    """Representación JSON de los tipos nativos que json no conoce."""
+    if isinstance(o, (datetime.date, datetime.datetime)):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return str(o)
+    raise TypeError(f'Tipo no serializable: {type(o).__name__}')
+
+def coerce_value(col, val):
+    """
+    Valida un valor contra el tipo declarado de la columna y lo convierte al
+    tipo nativo. Acepta tanto texto (sentencias SQL, CSV) como valores ya
+    convertidos (logs y respaldos).
+    """
+    if val is None:
+        return None
+    col_name = col["name"]
+    col_type = col["type"].upper()
+    base = base_type(col_type)
+    if base in INT_TYPES:
+        if isinstance(val, int) and not isinstance(val, bool):
+            return val
+        if not re.match(r'^-?\d+$', str(val)):
+            raise ValueError(f'El valor para {col_name} debe ser un entero')
+        return int(val)
+    if base in DECIMAL_TYPES or base == 'FLOAT':
+        if isinstance(val, bool) or not isinstance(val, (int, float, Decimal)):
+            if not re.match(r'^-?\d+(\.\d+)?$', str(val)):
+                raise ValueError(f'El valor para {col_name} debe ser numérico')
+        return float(val) if base == 'FLOAT' else Decimal(str(val))
+    if base == 'BIT':
+        if isinstance(val, bool):
+            return val
+        if str(val) not in ['0', '1', 'True', 'False', 'true', 'false']:
+            raise ValueError(f'El valor para {col_name} debe ser booleano (0/1 o True/False)')
+        return str(val) in ['1', 'True', 'true']
+    if base in DATE_TYPES:
+        if isinstance(val, datetime.date):
+            parsed = val
+        else:
+            try:
+                parsed = datetime.datetime.fromisoformat(str(val))
+            except Exception:
+                raise ValueError(f'El valor para {col_name} debe ser una fecha válida (YYYY-MM-DD o similar)')
+        if base == 'DATE':
+            return parsed.date() if isinstance(parsed, datetime.datetime) else parsed
+        if not isinstance(parsed, datetime.datetime):
+            return datetime.datetime.combine(parsed, datetime.time())
+        return parsed
+    val = str(val)
+    if base in TEXT_TYPES:
+        # Extraer longitud si existe, por ejemplo VARCHAR(20)
+        length_match = re.search(r'\((\d+)\)', col_type)
+        if length_match:
+            max_len = int(length_match.group(1))
+            if len(val) > max_len:
+                raise ValueError(f'El valor para {col_name} excede la longitud máxima de {max_len} caracteres')
+            if base == 'CHAR' and len(val) != max_len:
+                raise ValueError(f'El valor para {col_name} debe tener exactamente {max_len} caracteres')
+    return val
+
+def coerce_lenient(col, val):
+    """Como coerce_value, pero conserva el valor original si no es convertible (datos antiguos)."""
+    try:
+        return coerce_value(col, val)
+    except (ValueError, InvalidOperation):
+        return val
+
+def coerce_column(col, values):
+    """Convierte una columna completa de datos antiguos (texto) a su tipo nativo."""
+    if base_type(col["type"]) not in NATIVE_TYPES:
+        return values
+    memo = {}
+    result = []
+    for v in values:
+        if v not in memo:
+            memo[v] = coerce_lenient(col, v)
+        result.append(memo[v])
+    return result
+
+def parse_literal(col, raw):
+    """Convierte una sola vez el literal de un WHERE al tipo de la columna."""
+    if base_type(col["type"]) in NATIVE_TYPES:
+        return coerce_value(col, raw)
+    return raw
+
+COMPARISON_OPS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge
+}
+
+def make_predicate(op, literal):
+    """
+    Compila `valor op literal` en una función sobre valores nativos. Como en
+    SQL, una comparación con NULL (valor o literal) es desconocida y no se
+    cumple, tampoco `!=`. En columnas de texto con un literal numérico se
+    conserva la comparación numérica de los valores que sean números.
+    """
+    if op not in COMPARISON_OPS:
+        raise ValueError("Operador desconocido")
+    compare = COMPARISON_OPS[op]
+    if literal is None:
+        return lambda v: False
+    number = _as_number(literal) if isinstance(literal, str) else None
+    if number is None:
+        return lambda v: v is not None and compare(v, literal)
+    memo = {}
+    def predicate(v):
+        if v is None:
+            return False
+        if v not in memo:
+            memo[v] = _as_number(v)
+        n = memo[v]
+        return compare(n, number) if n is not None else compare(v, literal)
+    return predicate
+
+def coerce_csv_value(col, raw):
+    """Valor de una celda CSV: vacío es NULL en columnas tipadas; el texto se guarda tal cual."""
+    if base_type(col["type"]) in NATIVE_TYPES:
+        return coerce_value(col, raw) if raw not in (None, '') else None
+    return raw
+
+def numeric_value(v):
+    """Valor numérico para agregados; el texto numérico (columnas VARCHAR) se convierte."""
+    if isinstance(v, (int, float, Decimal)):
+        return v
+    return float(v)
+
+def infer_column_type(values):
+    """Tipo SQL más específico que admite todos los valores (texto) de una columna CSV."""
+    present = [v for v in values if v not in (None, '')]
+    if present and all(re.match(r'^-?\d{1,18}$', v) for v in present):
+        return "INT"
+    if present and all(re.match(r'^-?\d+(\.\d+)?$', v) for v in present):
+        return "FLOAT"
+    if present and all(re.match(r'^\d{4}-\d{2}-\d{2}$', v) for v in present):
+        try:
+            for v in set(present):
+                datetime.date.fromisoformat(v)
+            return "DATE"
+        except ValueError:
+            pass
+    return "VARCHAR(255)"
+
+# ==========================
+# ZONE MAPS
+# ==========================
+# Un zone map resume un grupo de filas de una columna: cantidad de nulos y de
+# valores, y el rango [min, max] de los valores si todos son del mismo tipo
+# (número, texto, fecha o fecha-hora). Para columnas de texto con números se
+# guarda además el rango numérico. Si un literal cae fuera del rango, el grupo
+# completo se puede saltar sin mirar sus filas.
+def _as_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        return value if value == value else None
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return None
+        return number if number == number else None
+    return None
+
+def value_kind(value):
+    if isinstance(value, (int, float, Decimal)):
+        return "number" if value == value else None
+    if isinstance(value, str):
+        return "text"
+    if isinstance(value, datetime.datetime):
+        return "datetime"
+    if isinstance(value, datetime.date):
+        return "date"
+    return None
+
+def compute_zone(values):
+    zone = {"nulls": 0, "values": 0, "kind": None, "min": None, "max": None, "nmin": None, "nmax": None}
+    for value in values:
+        widen_zone(zone, value)
+    return zone
+
+def widen_zone(zone, value):
+    """Amplía un zone map para que cubra `value` (nunca se encoge)."""
+    if value is None:
+        zone["nulls"] += 1
+        return
+    zone["values"] += 1
+    kind = value_kind(value)
+    if zone["values"] == 1:
+        zone["kind"] = kind
+        zone["min"] = zone["max"] = value if kind else None
+        if kind == "text":
+            zone["nmin"] = zone["nmax"] = _as_number(value)
+        return
+    if zone["kind"] is None:
+        return
+    if kind != zone["kind"]:
+        zone["kind"] = zone["min"] = zone["max"] = zone["nmin"] = zone["nmax"] = None
+        return
+    if value < zone["min"]:
+        zone["min"] = value
+    elif value > zone["max"]:
+        zone["max"] = value
+    if kind == "text" and zone["nmin"] is not None:
+        number = _as_number(value)
+        if number is None:
+            zone["nmin"] = zone["nmax"] = None
+        elif number < zone["nmin"]:
+            zone["nmin"] = number
+        elif number > zone["nmax"]:
+            zone["nmax"] = number
+
+def zone_to_json(zone):
+    return {k: json_default(v) if isinstance(v, (Decimal, datetime.date)) else v for k, v in zone.items()}
+
+def zone_from_json(zone):
+    parse = {
+        "number": lambda v: Decimal(v) if isinstance(v, str) else v,
+        "date": datetime.date.fromisoformat,
+        "datetime": datetime.datetime.fromisoformat
+    }.get(zone.get("kind"))
+    if parse and zone.get("min") is not None:
+        zone = {**zone, "min": parse(zone["min"]), "max": parse(zone["max"])}
+    return zone
+
+def zone_may_match(zone, op, literal):
+    """
+    Indica si algún valor del grupo podría cumplir `valor op literal` con la
+    misma semántica de make_predicate(). `literal` ya viene convertido.
+    """
+    if literal is None or zone["values"] == 0:
+        return False
+    kind = value_kind(literal)
+    number = _as_number(literal) if kind == "text" else None
+    if number is not None and zone["kind"] == "text" and zone["nmin"] is not None:
+        low, high, literal = zone["nmin"], zone["nmax"], number
+    elif kind is not None and kind == zone["kind"] and number is None:
+        low, high = zone["min"], zone["max"]
+    else:
+        return True
+    if op == "=":
+        return low <= literal <= high
+    if op == "!=":
+        return not (low == high == literal)
+    if op == ">":
+        return high > literal
+    if op == ">=":
+        return high >= literal
+    if op == "<":
+        return low < literal
+    if op == "<=":
+        return low <= literal
+    return True
+
+
+def _array_bytes(arr):
+    # El archivo siempre se escribe en little-endian
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+def _array_from(typecode, buf):
+    arr = array(typecode)
+    arr.frombytes(buf)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+def _is_int_text(v):
+    return isinstance(v, str) and re.match(r'^-?[1-9]\d{0,17}$|^0$', v) is not None
+
+def _is_float_text(v):
+    if not isinstance(v, str) or not re.match(r'^-?\d+\.\d+$', v):
+        return False
+    return repr(float(v)) == v
+
+def _encode_column(values):
+    """
+    Elige la codificación física más compacta para una columna sin perder
+    información y la serializa. Devuelve (metadatos, bytes).
+    Codificaciones: "null", "i64", "f64", "dict" (diccionario + códigos) y "json";
+    "logical" indica el tipo nativo a reconstruir al leer.
+    """
+    null_ids = array("I", (i for i, v in enumerate(values) if v is None))
+    present = [v for v in values if v is not None]
+    meta = {"nulls": len(null_ids), "logical": None}
+    if not present:
+        meta["encoding"] = "null"
+        return meta, b""
+    payload = b""
+    kinds = {type(v) for v in present}
+    if kinds == {int} and all(-2**63 <= v < 2**63 for v in present):
+        meta.update(encoding="i64", logical="int")
+        payload = _array_bytes(array("q", (0 if v is None else v for v in values)))
+    elif kinds == {bool}:
+        meta.update(encoding="i64", logical="bool")
+        payload = _array_bytes(array("q", (0 if v is None else int(v) for v in values)))
+    elif kinds == {datetime.date}:
+        # Fechas como número de día (ordinal)
+        meta.update(encoding="i64", logical="date")
+        payload = _array_bytes(array("q", (0 if v is None else v.toordinal() for v in values)))
+    elif kinds == {Decimal} or kinds == {datetime.datetime}:
+        meta.update(encoding="json", logical="decimal" if kinds == {Decimal} else "datetime")
+        payload = json.dumps(values, default=json_default).encode("utf-8")
+    elif kinds != {str} and kinds != {float}:
+        # Tipos mezclados (datos antiguos): se reconvierten con el tipo declarado al leer
+        meta["encoding"] = "json"
+        payload = json.dumps(values, default=json_default).encode("utf-8")
+    elif all(_is_int_text(v) for v in present):
+        # Texto numérico canónico: se guarda como entero y se reconstruye el texto al leer
+        meta.update(encoding="i64", logical="str")
+        payload = _array_bytes(array("q", (0 if v is None else int(v) for v in values)))
+    elif kinds == {float}:
+        meta.update(encoding="f64", logical="float")
+        payload = _array_bytes(array("d", (0.0 if v is None else v for v in values)))
+    elif all(_is_float_text(v) for v in present):
+        meta.update(encoding="f64", logical="str")
+        payload = _array_bytes(array("d", (0.0 if v is None else float(v) for v in values)))
+    else:
+        distinct = {}
+        if all(isinstance(v, str) for v in present):
+            for v in present:
+                distinct.setdefault(v, len(distinct))
+                if len(distinct) * 2 > len(values):
+                    break
+        if distinct and len(distinct) * 2 <= len(values):
+            # Baja cardinalidad: diccionario de valores + un código entero por fila
+            typecode = "B" if len(distinct) < 256 else "H" if len(distinct) < 65536 else "I"
+            dictionary = json.dumps(list(distinct)).encode("utf-8")
+            codes = array(typecode, (0 if v is None else distinct[v] for v in values))
+            meta.update(encoding="dict", logical="str", typecode=typecode, dict_size=len(dictionary))
+            payload = dictionary + _array_bytes(codes)
+        else:
+            meta.update(encoding="json", logical="str")
+            payload = json.dumps(values).encode("utf-8")
+    nulls = _array_bytes(null_ids)
+    meta["nulls_size"] = len(nulls)
+    return meta, nulls + payload
+
+def _decode_column(meta, buf, row_count):
+    """Reconstruye la lista de valores de una columna a partir de su bloque físico."""
+    encoding = meta["encoding"]
+    if encoding == "null":
+        return [None] * row_count
+    nulls_size = meta["nulls_size"]
+    null_ids = _array_from("I", buf[:nulls_size])
+    buf = buf[nulls_size:]
+    logical = meta["logical"]
+    if encoding in ("i64", "f64"):
+        values = _array_from("q" if encoding == "i64" else "d", buf).tolist()
+        if logical == "str":
+            # Un solo objeto str por valor distinto
+            memo = {}
+            values = [memo[v] if v in memo else memo.setdefault(v, str(v)) for v in values]
+        elif logical == "bool":
+            values = [bool(v) for v in values]
+        elif logical == "date":
+            values = [datetime.date.fromordinal(v) if v > 0 else None for v in values]
+    elif encoding == "dict":
+        dictionary, codes = _decode_dict_chunk(meta, buf, null_ids)
+        return [dictionary[c] for c in codes]
+    else:
+        values = json.loads(bytes(buf).decode("utf-8"))
+        if logical == "decimal":
+            return [None if v is None else Decimal(v) for v in values]
+        if logical == "datetime":
+            return [None if v is None else datetime.datetime.fromisoformat(v) for v in values]
+        return values
+    for i in null_ids:
+        values[i] = None
+    return values
+
+def _decode_dict_chunk(meta, buf, null_ids):
+    """Diccionario y códigos de un bloque "dict"; los NULL usan un código extra al final."""
+    dictionary = json.loads(bytes(buf[:meta["dict_size"]]).decode("utf-8"))
+    codes = _array_from(meta["typecode"], buf[meta["dict_size"]:])
+    if null_ids:
+        codes = array("I", codes)
+        null_code = len(dictionary)
+        dictionary.append(None)
+        for i in null_ids:
+            codes[i] = null_code
+    return dictionary, codes
+
+def write_table_file(path, data, lsn=0):
+    """
+    Serializa una tabla: cabecera con esquema y metadatos, seguida de los
+    grupos de filas; cada grupo tiene un bloque por columna y su zone map.
+    """
+    row_groups = []
+    blocks = []
+    offset = 0
+    row_count = data.row_count
+    for start in range(0, row_count, ROW_GROUP_SIZE):
+        end = min(start + ROW_GROUP_SIZE, row_count)
+        chunks = []
+        for col in data.columns:
+            values = data.data[col["name"]][start:end]
+            meta, block = _encode_column(values)
+            meta.update(name=col["name"], offset=offset, size=len(block), zone=zone_to_json(compute_zone(values)))
+            offset += len(block)
+            chunks.append(meta)
+            blocks.append(block)
+        row_groups.append({"rows": end - start, "chunks": chunks})
+    # Bitmap de filas borradas (aún no eliminadas por el vacuum), al final del archivo
+    deleted = {"offset": offset, "size": len(data.deleted), "count": data.dead_count}
+    blocks.append(bytes(data.deleted))
+    header = json.dumps({
+        "version": TABLE_FORMAT_VERSION,
+        "columns": data.columns,
+        "rows": row_count,
+        "lsn": lsn,
+        "table_id": data.table_id,
+        "row_groups": row_groups,
+        "deleted": deleted,
+        "indexes": [index.definition() for index in data.indexes.values()]
+    }).encode("utf-8")
+    # Se escribe en un temporal, se sincroniza y se renombra: un corte a mitad deja el archivo anterior intacto
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(TABLE_MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for block in blocks:
+            f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(os.path.dirname(path))
+
+def fsync_dir(path):
+    """Hace durable un rename dentro del directorio (no disponible en Windows)."""
+    try:
+        fd = os.open(path or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def read_table_header(path):
+    """Lee solo la cabecera (esquema y metadatos) sin decodificar columnas."""
+    with open(path, "rb") as f:
+        prefix = f.read(8)
+        if prefix[:4] != TABLE_MAGIC:
+            raise ValueError(f'Archivo de tabla inválido: {path}')
+        (header_len,) = struct.unpack("<I", prefix[4:8])
+        return json.loads(f.read(header_len).decode("utf-8"))
+
+def read_table_file(path):
+    with open(path, "rb") as f:
+        raw = f.read()
+    if raw[:4] != TABLE_MAGIC:
+        raise ValueError(f'Archivo de tabla inválido: {path}')
+    (header_len,) = struct.unpack("<I", raw[4:8])
+    header = json.loads(raw[8:8 + header_len].decode("utf-8"))
+    body = memoryview(raw)[8 + header_len:]
+    # Los archivos de la versión 1 tienen un único bloque por columna, sin zone maps
+    row_groups = header.get("row_groups") or [{"rows": header["rows"], "chunks": header.get("chunks", [])}]
+    # Las columnas de texto guardadas con diccionario se mantienen codificadas en memoria
+    dict_names = {meta["name"] for group in row_groups for meta in group["chunks"] if meta["encoding"] == "dict"}
+    data = {
+        col["name"]: DictColumn() if col["name"] in dict_names and base_type(col["type"]) not in NATIVE_TYPES else []
+        for col in header["columns"]
+    }
+    zones = {col["name"]: [] for col in header["columns"]}
+    untyped = set()
+    for group in row_groups:
+        for meta in group["chunks"]:
+            block = body[meta["offset"]:meta["offset"] + meta["size"]]
+            column = data[meta["name"]]
+            if meta["encoding"] == "dict" and isinstance(column, DictColumn):
+                nulls_size = meta["nulls_size"]
+                null_ids = _array_from("I", block[:nulls_size])
+                column.extend_codes(*_decode_dict_chunk(meta, block[nulls_size:], null_ids))
+            else:
+                column.extend(_decode_column(meta, block, group["rows"]))
+            if "zone" in meta:
+                zones[meta["name"]].append(zone_from_json(meta["zone"]))
+            if meta["encoding"] != "null" and meta["logical"] in (None, "str"):
+                untyped.add(meta["name"])
+    # Archivos escritos antes de los tipos nativos: se convierten una sola vez al cargar
+    for col in header["columns"]:
+        if col["name"] in untyped:
+            converted = coerce_column(col, data[col["name"]])
+            if converted is not data[col["name"]]:
+                data[col["name"]] = converted
+                zones[col["name"]] = []
+    zones = {name: z for name, z in zones.items() if len(z) == len(row_groups) and "row_groups" in header}
+    deleted = bytearray()
+    if header.get("deleted"):
+        deleted = bytearray(body[header["deleted"]["offset"]:header["deleted"]["offset"] + header["deleted"]["size"]])
+    table = TableData(header["columns"], data, header.get("lsn", 0), header.get("table_id"), zones, deleted)
+    for definition in header.get("indexes", []):
+        index_class = INDEX_KINDS.get(definition.get("kind"), HashIndex)
+        table.attach_index(index_class(definition["name"], definition["column"], definition.get("unique", False)))
+    return table
+
+# ==========================
+# LOG DE ESCRITURA (WAL) POR TABLA
+# ==========================
+# Los INSERT, UPDATE y DELETE se agregan al final de "<tabla>.log" (una línea
+# JSON por registro) en lugar de reescribir la tabla. Cada registro lleva un número de secuencia
+# (lsn); la cabecera del archivo base guarda el último lsn ya incorporado, así
+# que al leer solo se aplican los registros posteriores.
+_table_locks = {}
+_table_locks_guard = threading.Lock()
+_log_states = {}
+_maintenance_queue = queue.Queue()
+_maintenance_pending = set()
+
+class GroupCommit:
+    """
+    Commit en grupo del log de una tabla. Cada escritor deja sus líneas
+    pendientes (bajo el lock de la tabla, en orden de lsn) y espera su turno;
+    el primero que espera se vuelve líder, aguarda hasta COMMIT_DELAY_MS (o
+    hasta juntar COMMIT_BATCH_SIZE registros) y escribe todas las líneas
+    pendientes con un único fsync. Los demás solo esperan a que su ticket
+    quede durable.
+    """
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.cond = threading.Condition()
+        # Serializa las escrituras al log (líder, cargas y save_table)
+        self.io_lock = threading.Lock()
+        self.pending = []
+        self.pending_records = 0
+        self.enqueued = 0
+        self.flushed = 0
+        self.leader = False
+        self.commits = 0
+        self.fsyncs = 0
+
+    def enqueue(self, lines, count):
+        """Deja líneas pendientes y devuelve el ticket a esperar."""
+        with self.cond:
+            self.pending.append(lines)
+            self.pending_records += count
+            self.enqueued += 1
+            self.commits += 1
+            if self.pending_records >= COMMIT_BATCH_SIZE:
+                self.cond.notify_all()
+            return self.enqueued
+
+    def flush(self):
+        """Escribe y sincroniza todo lo pendiente."""
+        with self.io_lock:
+            with self.cond:
+                lines = "".join(self.pending)
+                ticket = self.enqueued
+                self.pending = []
+                self.pending_records = 0
+            if lines:
+                with open(log_path(self.db, self.table), "a", encoding="utf-8") as f:
+                    f.write(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.fsyncs += 1
+            with self.cond:
+                self.flushed = max(self.flushed, ticket)
+                self.cond.notify_all()
+
+    def discard(self):
+        """Lo pendiente ya quedó en el archivo base (save_table) o la tabla se borró."""
+        with self.io_lock:
+            with self.cond:
+                self.pending = []
+                self.pending_records = 0
+                self.flushed = self.enqueued
+                self.cond.notify_all()
+
+    def wait(self, ticket):
+        with self.cond:
+            while self.flushed < ticket:
+                if self.leader:
+                    self.cond.wait()
+                    continue
+                self.leader = True
+                try:
+                    # Si hay otros escritores en curso se espera a que se sumen (o a que el
+                    # lote se llene); un escritor solo no paga la demora
+                    deadline = time.monotonic() + COMMIT_DELAY_MS / 1000
+                    concurrent = self.enqueued - self.flushed > 1
+                    while concurrent and self.pending_records < COMMIT_BATCH_SIZE and self.flushed < ticket:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.cond.wait(remaining)
+                    self.cond.release()
+                    try:
+                        self.flush()
+                    finally:
+                        self.cond.acquire()
+                finally:
+                    self.leader = False
+                    self.cond.notify_all()
+
+_group_commits = {}
+
+def group_commit(db, table):
+    with _table_locks_guard:
+        commit = _group_commits.get((db, table))
+        if commit is None:
+            commit = _group_commits[(db, table)] = GroupCommit(db, table)
+        return commit
+
+def group_commit_stats():
+    with _table_locks_guard:
+        commits = list(_group_commits.values())
+    total = sum(c.commits for c in commits)
+    fsyncs = sum(c.fsyncs for c in commits)
+    return {
+        "commit_delay_ms": COMMIT_DELAY_MS,
+        "batch_size": COMMIT_BATCH_SIZE,
+        "commits": total,
+        "fsyncs": fsyncs,
+        "commits_per_fsync": total / fsyncs if fsyncs else 0.0
+    }
+
+def table_lock(db, table):
+    """Lock reentrante por tabla: serializa escrituras, compactación y lecturas del log."""
+    with _table_locks_guard:
+        return _table_locks.setdefault((db, table), threading.RLock())
+
+def log_path(db, table):
+    return os.path.join(DATA_DIR, db, f"{table}{LOG_EXT}")
+
+def new_table_id():
+    return uuid.uuid4().hex[:12]
+
+def read_log(db, table):
+    return read_json_lines(log_path(db, table))
+
+def read_json_lines(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return []
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # Última línea incompleta (escritura interrumpida): se descarta
+            break
+    return records
+
+def _log_state(db, table):
+    """Último lsn y cantidad de registros pendientes del log (se calcula una vez por proceso)."""
+    state = _log_states.get((db, table))
+    if state is None:
+        lsn = 0
+        table_id = None
+        path = table_path(db, table)
+        if os.path.exists(path):
+            header = read_table_header(path)
+            lsn = header.get("lsn", 0)
+            table_id = header.get("table_id")
+        records = [rec for rec in read_log(db, table) if rec["lsn"] > lsn]
+        if records:
+            lsn = records[-1]["lsn"]
+        state = _log_states[(db, table)] = {"lsn": lsn, "records": len(records), "table_id": table_id}
+    return state
+
+def forget_table_state(db, table=None):
+    """Olvida el estado en memoria tras DROP/RENAME de una tabla o base de datos."""
+    for key in list(_log_states):
+        if key[0] == db and (table is None or key[1] == table):
+            _log_states.pop(key, None)
+    buffer_pool.invalidate(db, table)
+    _backup_states.clear()
+    for key in list(_table_stats):
+        if key[0] == db and (table is None or key[1] == table):
+            _table_stats.pop(key, None)
+    if table is None:
+        forget_catalog(db)
+        for key, commit in list(_group_commits.items()):
+            if key[0] == db:
+                commit.discard()
+
+def append_log(db, table, records):
+    """Agrega registros al log de la tabla: O(1) en E/S, sin tocar el archivo base."""
+    with table_lock(db, table):
+        state = _log_state(db, table)
+        previous = table_version(db, table)
+        records = [{"lsn": state["lsn"] + i, **rec} for i, rec in enumerate(records, 1)]
+        state["lsn"] += len(records)
+        lines = "".join(json.dumps(rec, default=json_default) + "\n" for rec in records)
+        commit = group_commit(db, table)
+        ticket = commit.enqueue(lines, len(records))
+        state["records"] += len(records)
+        catalog_log_appended(db, table, records, len(lines.encode("utf-8")))
+        note_changes(db, table, records)
+        journal_changes(db, table, records)
+        # Si la tabla está en el buffer pool se actualiza en memoria en vez de invalidarla
+        cached = buffer_pool.get(db, table, previous, count=False)
+        if cached is not None:
+            for rec in records:
+                apply_log_record(cached, rec)
+                cached.lsn = rec["lsn"]
+            buffer_pool.put(db, table, table_version(db, table), cached)
+        if state["records"] >= LOG_COMPACT_RECORDS:
+            schedule_compaction(db, table)
+    # Fuera del lock de la tabla: así otros escritores se suman al mismo commit
+    commit.wait(ticket)
+
+def decode_log_record(columns, rec):
+    """Convierte los valores de un registro leído del log (JSON) a sus tipos nativos."""
+    by_name = {col["name"]: col for col in columns}
+    if rec["op"] == "insert":
+        row = {k: coerce_lenient(by_name[k], v) if k in by_name else v for k, v in rec["row"].items()}
+        return {**rec, "row": row}
+    if rec["op"] == "update" and rec["col"] in by_name:
+        return {**rec, "value": coerce_lenient(by_name[rec["col"]], rec["value"])}
+    return rec
+
+def apply_log_record(data, rec):
+    """Aplica un registro (con valores nativos) sobre la tabla en memoria."""
+    if rec["op"] == "insert":
+        data.append(rec["row"])
+    elif rec["op"] == "update":
+        data.update_rows(rec["col"], rec["ids"], rec["value"])
+    elif rec["op"] == "delete":
+        # Borrado físico (registros anteriores a los tombstones)
+        data.delete_rows(rec["ids"])
+    elif rec["op"] == "tombstone":
+        data.mark_deleted(rec["ids"])
+    elif rec["op"] == "vacuum":
+        data.vacuum()
+    else:
+        raise ValueError(f'Registro de log desconocido: {rec["op"]}')
+
+def replay_log(db, table, data):
+    """Aplica sobre `data` los registros del log posteriores a su lsn."""
+    group_commit(db, table).flush()
+    for rec in read_log(db, table):
+        if rec["lsn"] > data.lsn:
+            apply_log_record(data, decode_log_record(data.columns, rec))
+            data.lsn = rec["lsn"]
+    return data
+
+def schedule_maintenance(task, db, table):
+    """Encola una tarea (compactación, ANALYZE) para el hilo de fondo, sin repetir las pendientes."""
+    key = (task.__name__, db, table)
+    if key not in _maintenance_pending:
+        _maintenance_pending.add(key)
+        _maintenance_queue.put((task, db, table))
+
+def schedule_compaction(db, table):
+    schedule_maintenance(compact_table, db, table)
+
+def vacuum_table(db, table):
+    """Reescribe la tabla sin las filas borradas; el diario de respaldos lo registra para reproducirlo."""
+    with table_lock(db, table):
+        data = load_table(db, table)
+        if data is None or not data.dead_count:
+            return
+        change = {"op": "vacuum"}
+        apply_log_record(data, change)
+        save_table(db, table, data)
+        journal_changes(db, table, [change])
+
+def schedule_vacuum(db, table, data):
+    if data.dead_count > VACUUM_DEAD_RATIO * data.row_count:
+        schedule_maintenance(vacuum_table, db, table)
+
+def compact_table(db, table):
+    """Incorpora el log al archivo base y lo vacía."""
+    with table_lock(db, table):
+        data = load_table(db, table)
+        if data is not None:
+            save_table(db, table, data)
+
+def _maintenance_worker():
+    while True:
+        task, db, table = _maintenance_queue.get()
+        _maintenance_pending.discard((task.__name__, db, table))
+        try:
+            task(db, table)
+        except Exception as e:
+            print(f"Error en {task.__name__} de {db}.{table}: {e}")
+
+threading.Thread(target=_maintenance_worker, name="mantenimiento", daemon=True).start()
+
+def _checkpoint_worker():
+    """Checkpoint periódico de las tablas con registros pendientes en el log."""
+    while True:
+        time.sleep(CHECKPOINT_INTERVAL)
+        for (db, table), state in list(_log_states.items()):
+            if state["records"]:
+                schedule_compaction(db, table)
+
+threading.Thread(target=_checkpoint_worker, name="checkpoints", daemon=True).start()
+
+# ==========================
+# RECUPERACIÓN AL INICIAR
+# ==========================
+# El archivo base de cada tabla es su último checkpoint (la cabecera guarda el
+# lsn incorporado) y el log tiene los cambios posteriores. Al iniciar se
+# borran los temporales de escrituras interrumpidas y se descarta la cola
+# incompleta de cada log. Los registros posteriores al checkpoint no se
+# reaplican al iniciar: load_table los aplica al cargar la tabla y la
+# compactación los incorpora al archivo base en segundo plano. El arranque
+# depende solo del largo de los logs, no del tamaño de las tablas.
+recovery_stats = {"duration_ms": 0.0, "tables": 0, "records": 0, "truncated_bytes": 0, "temp_files": 0}
+
+def repair_log(path):
+    """Trunca la cola incompleta o ilegible de un log; devuelve los bytes descartados."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    valid = 0
+    for line in raw.splitlines(keepends=True):
+        if not line.endswith(b"\n"):
+            break
+        try:
+            json.loads(line)
+        except ValueError:
+            break
+        valid += len(line)
+    if valid < len(raw):
+        with open(path, "r+b") as f:
+            f.truncate(valid)
+            f.flush()
+            os.fsync(f.fileno())
+    return len(raw) - valid
+
+def recover_table(db, table):
+    """
+    Deja válido el log de una tabla y devuelve sus registros posteriores al
+    checkpoint; su incorporación al archivo base queda encolada.
+    """
+    path = log_path(db, table)
+    recovery_stats["truncated_bytes"] += repair_log(path)
+    if not os.path.exists(table_path(db, table)):
+        if not os.path.exists(legacy_table_path(db, table)):
+            # Log huérfano: la tabla se borró antes del corte
+            os.remove(path)
+        return 0
+    records = _log_state(db, table)["records"]
+    if records:
+        schedule_compaction(db, table)
+    else:
+        os.remove(path)
+    return records
+
+def recover_storage():
+    """Recuperación de todas las bases al iniciar la app."""
+    start = time.perf_counter()
+    if not os.path.isdir(DATA_DIR):
+        return
+    for db in sorted(os.listdir(DATA_DIR)):
+        db_dir = os.path.join(DATA_DIR, db)
+        if not os.path.isdir(db_dir):
+            continue
+        for f in os.listdir(db_dir):
+            if f.endswith(".tmp"):
+                os.remove(os.path.join(db_dir, f))
+                recovery_stats["temp_files"] += 1
+        # Diarios de respaldo: solo se descarta su cola incompleta
+        for table in os.listdir(os.path.join(db_dir, "backups")) if os.path.isdir(os.path.join(db_dir, "backups")) else []:
+            for chain in _chain_dirs(db, table):
+                journal = os.path.join(chain, "journal.log")
+                if os.path.exists(journal):
+                    recovery_stats["truncated_bytes"] += repair_log(journal)
+        for f in sorted(os.listdir(db_dir)):
+            table = f[:-len(LOG_EXT)]
+            if not f.endswith(LOG_EXT) or not is_valid_name(table):
+                continue
+            try:
+                recovery_stats["records"] += recover_table(db, table)
+                recovery_stats["tables"] += 1
+            except Exception as e:
+                print(f"Error recuperando {db}.{table}: {e}")
+    recovery_stats["duration_ms"] = (time.perf_counter() - start) * 1000
+    print(f"Recuperación: {recovery_stats['records']} registros de {recovery_stats['tables']} tablas "
+          f"en {recovery_stats['duration_ms']:.1f} ms")
+
+# ==========================
+# BUFFER POOL DE TABLAS DECODIFICADAS
+# ==========================
+def estimate_table_size(data):
+    """Estimación (por muestreo) de la memoria que ocupa una tabla decodificada."""
+    total = sys.getsizeof(data.data)
+    for values in data.data.values():
+        total += sys.getsizeof(values)
+        if isinstance(values, DictColumn):
+            continue
+        if values:
+            step = max(1, len(values) // 64)
+            sample = values[::step]
+            total += sum(sys.getsizeof(v) for v in sample) * len(values) // len(sample)
+    return total
+
+class BufferPool:
+    """
+    Caché compartida de tablas decodificadas, con desalojo LRU según un
+    presupuesto de memoria. Cada entrada guarda la versión del archivo de la
+    que proviene; si la versión en disco cambió, la entrada se descarta.
+    """
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()  # (db, tabla) -> (versión, TableData, bytes)
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, db, table, version, count=True):
+        with self.lock:
+            entry = self.entries.get((db, table))
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end((db, table))
+                if count:
+                    self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._remove((db, table))
+            if count:
+                self.misses += 1
+            return None
+
+    def put(self, db, table, version, data):
+        size = estimate_table_size(data)
+        with self.lock:
+            self._remove((db, table))
+            if size > self.budget_bytes:
+                return
+            self.entries[(db, table)] = (version, data, size)
+            self.used_bytes += size
+            while self.used_bytes > self.budget_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, db, table=None):
+        with self.lock:
+            for key in list(self.entries):
+                if key[0] == db and (table is None or key[1] == table):
+                    self._remove(key)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.used_bytes -= entry[2]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "tables": len(self.entries),
+                "used_bytes": self.used_bytes,
+                "budget_bytes": self.budget_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+buffer_pool = BufferPool(BUFFER_POOL_BYTES)
+
+def table_version(db, table):
+    """Versión de una tabla: identidad del archivo base más el último lsn del log."""
+    try:
+        st = os.stat(table_path(db, table))
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, _log_state(db, table)["lsn"])
+
+# ==========================
+# FUNCIONES UTILITARIAS
+# ==========================
+def table_path(db, table):
+    return os.path.join(DATA_DIR, db, f"{table}{TABLE_EXT}")
+
+def legacy_table_path(db, table):
+    return os.path.join(DATA_DIR, db, f"{table}{LEGACY_TABLE_EXT}")
+
+def index_path(db, table, index_name):
+    return os.path.join(DATA_DIR, db, f"{table}.{index_name}{INDEX_EXT}")
+
+def index_files(db, table):
+    """Archivos de índice de una tabla: {nombre del índice: ruta}."""
+    prefix = f"{table}."
+    db_dir = os.path.join(DATA_DIR, db)
+    return {
+        f[len(prefix):-len(INDEX_EXT)]: os.path.join(db_dir, f)
+        for f in os.listdir(db_dir)
+        if f.startswith(prefix) and f.endswith(INDEX_EXT) and is_valid_name(f[len(prefix):-len(INDEX_EXT)])
+    } if os.path.isdir(db_dir) else {}
+
+def write_index_files(db, table, data):
+    """Guarda los índices junto al checkpoint (marcados con su lsn) y borra los de índices eliminados."""
+    for name, path in index_files(db, table).items():
+        if name not in data.indexes:
+            os.remove(path)
+    for index in data.indexes.values():
+        if index.entries is None:
+            index.build(data.data[index.column])
+        path = index_path(db, table, index.name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "lsn": data.lsn,
+                "table_id": data.table_id,
+                "column": index.column,
+                "entries": [[value, ids] for value, ids in index.entries.items()]
+            }, f, default=json_default)
+        os.replace(path + ".tmp", path)
+
+def load_index_files(db, table, data):
+    """Carga los índices guardados si corresponden a este checkpoint; si no, se reconstruyen al usarse."""
+    for index in data.indexes.values():
+        try:
+            with open(index_path(db, table, index.name), "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue
+        if saved["lsn"] != data.lsn or saved["table_id"] != data.table_id or saved["column"] != index.column:
+            continue
+        col = data.column_schema(index.column)
+        index.load({coerce_lenient(col, value): ids for value, ids in saved["entries"]})
+
+def table_exists(db, table):
+    return os.path.exists(table_path(db, table)) or os.path.exists(legacy_table_path(db, table))
+
+def list_table_names(db):
+    """Tablas de una base según los archivos del directorio (el catálogo evita este recorrido)."""
+    names = []
+    for f in sorted(os.listdir(os.path.join(DATA_DIR, db))):
+        for ext in (TABLE_EXT, LEGACY_TABLE_EXT):
+            if f.endswith(ext) and is_valid_name(f[:-len(ext)]) and f[:-len(ext)] not in names:
+                names.append(f[:-len(ext)])
+    return names
+
+def drop_table_files(db, table):
+    with table_lock(db, table):
+        group_commit(db, table).discard()
+        for path in (table_path(db, table), legacy_table_path(db, table), log_path(db, table), stats_path(db, table),
+                     *index_files(db, table).values()):
+            if os.path.exists(path):
+                os.remove(path)
+        forget_table_state(db, table)
+        catalog_remove(db, table)
+
+def rename_table_files(db, table, new_table):
+    with table_lock(db, table):
+        group_commit(db, table).flush()
+        for path, new_path in ((table_path(db, table), table_path(db, new_table)),
+                               (legacy_table_path(db, table), legacy_table_path(db, new_table)),
+                               (log_path(db, table), log_path(db, new_table)),
+                               (stats_path(db, table), stats_path(db, new_table)),
+                               *((path, index_path(db, new_table, name)) for name, path in index_files(db, table).items())):
+            if os.path.exists(path):
+                os.rename(path, new_path)
+        forget_table_state(db, table)
+        forget_table_state(db, new_table)
+        catalog_rename(db, table, new_table)
+
+def save_table(db, table, data):
+    """
+    Escribe la tabla completa. `data` se considera el estado vigente, por lo que
+    el log pendiente queda incorporado y se elimina.
+    """
+    os.makedirs(os.path.join(DATA_DIR, db), exist_ok=True)
+    with table_lock(db, table):
+        state = _log_state(db, table)
+        if data.table_id is None:
+            data.table_id = state["table_id"] or new_table_id()
+        state["table_id"] = data.table_id
+        write_table_file(table_path(db, table), data, state["lsn"])
+        data.lsn = state["lsn"]
+        write_index_files(db, table, data)
+        # El archivo base ya es durable e incluye los registros pendientes del log
+        group_commit(db, table).discard()
+        if os.path.exists(log_path(db, table)):
+            os.remove(log_path(db, table))
+        state["records"] = 0
+        buffer_pool.put(db, table, table_version(db, table), data)
+        catalog_put(db, table, data.columns, data.live_count, state["lsn"],
+                    [index.definition() for index in data.indexes.values()])
+        # Una vez escrita en formato columnar, la versión JSON antigua sobra
+        legacy_path = legacy_table_path(db, table)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+def is_valid_name(name):
+    return re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', name) is not None
+
+def load_table(db, table):
+    """
+    Carga una tabla como TableData (archivo base + log pendiente), o None si no existe.
+    La instancia devuelta es compartida a través del buffer pool: quien la
+    modifique debe hacerlo dentro de table_write() y guardarla con save_table().
+    """
+    with table_lock(db, table):
+        path = table_path(db, table)
+        version = table_version(db, table)
+        if version is not None:
+            data = buffer_pool.get(db, table, version)
+            if data is None:
+                data = read_table_file(path)
+                load_index_files(db, table, data)
+                data = replay_log(db, table, data)
+                buffer_pool.put(db, table, version, data)
+            return data
+        try:
+            with open(legacy_table_path(db, table), "r") as f:
+                legacy = json.load(f)
+        except FileNotFoundError:
+            return None
+        # Migración: las tablas JSON se convierten al formato columnar la primera vez que se leen
+        data = TableData.from_rows(legacy["columns"], legacy["rows"])
+        save_table(db, table, data)
+        return data
+
+def load_table_snapshot(db, table):
+    """
+    Tabla para un SELECT: una vista fija (TableData.snapshot) tomada con la
+    tabla bloqueada, o None si no existe. Las filas del resultado se producen
+    mientras se envía la respuesta, ya sin el lock; la vista las mantiene
+    consistentes aunque entre tanto lleguen INSERT, UPDATE, DELETE o un vacuum.
+    """
+    with table_lock(db, table):
+        data = load_table(db, table)
+        return data.snapshot() if data is not None else None
+
+def read_table_page(db, table, column_names, limit, offset=0):
+    """
+    LIMIT/OFFSET leído directo del archivo base, sin cargar la tabla: solo se
+    leen los grupos de filas que caen en la página (los anteriores se saltan
+    contando sus filas vivas en el bitmap) y solo las columnas pedidas.
+    Devuelve (columnas, filas), o None si conviene load_table: la tabla ya
+    está en el buffer pool, tiene registros pendientes en el log o su archivo
+    no tiene grupos de filas.
+    """
+    with table_lock(db, table):
+        version = table_version(db, table)
+        if version is None or _log_state(db, table)["records"] or buffer_pool.get(db, table, version, count=False) is not None:
+            return None
+        with open(table_path(db, table), "rb") as f:
+            prefix = f.read(8)
+            if prefix[:4] != TABLE_MAGIC:
+                raise ValueError(f'Archivo de tabla inválido: {table_path(db, table)}')
+            (header_len,) = struct.unpack("<I", prefix[4:8])
+            header = json.loads(f.read(header_len).decode("utf-8"))
+            if not header.get("row_groups"):
+                return None
+            body = 8 + header_len
+            schema = {col["name"]: col for col in header["columns"]}
+            if column_names == ["*"]:
+                column_names = list(schema)
+            deleted = b""
+            if header.get("deleted") and header["deleted"]["count"]:
+                f.seek(body + header["deleted"]["offset"])
+                deleted = f.read(header["deleted"]["size"])
+            rows = []
+            start = 0
+            for group in header["row_groups"]:
+                if len(rows) >= limit:
+                    break
+                end = start + group["rows"]
+                live = group["rows"] - count_deleted(deleted, start, end) if deleted else group["rows"]
+                if live <= offset:
+                    offset -= live
+                    start = end
+                    continue
+                ids = [i - start for i in range(start, end)
+                       if (i >> 3) >= len(deleted) or not deleted[i >> 3] & (1 << (i & 7))]
+                ids = ids[offset:offset + limit - len(rows)]
+                offset = 0
+                chunks = {meta["name"]: meta for meta in group["chunks"]}
+                columns = []
+                for name in column_names:
+                    meta = chunks.get(name)
+                    if meta is None:
+                        columns.append(itertools.repeat(None, len(ids)))
+                        continue
+                    f.seek(body + meta["offset"])
+                    values = _decode_column(meta, f.read(meta["size"]), group["rows"])
+                    if meta["encoding"] != "null" and meta["logical"] in (None, "str"):
+                        # Archivos escritos antes de los tipos nativos, como en read_table_file
+                        values = coerce_column(schema[name], values)
+                    columns.append([values[i] for i in ids])
+                rows.extend(dict(zip(column_names, values)) for values in zip(*columns))
+                start = end
+    return column_names, rows
+
+@contextmanager
+def table_write(db, table):
+    """Bloquea la tabla para modificarla; si algo falla, descarta la copia en memoria."""
+    with table_lock(db, table):
+        try:
+            yield
+        except Exception:
+            buffer_pool.invalidate(db, table)
+            raise
+
+def load_table_schema(db, table):
+    """Devuelve solo el esquema de la tabla (del catálogo o la cabecera), o None si no existe."""
+    entry = catalog_entry(db, table)
+    if entry is not None and not entry.get("legacy"):
+        return entry["columns"]
+    with table_lock(db, table):
+        path = table_path(db, table)
+        if os.path.exists(path):
+            return read_table_header(path)["columns"]
+        data = load_table(db, table)
+        return data.columns if data else None
+
+
+# ==========================
+# CATÁLOGO POR BASE DE DATOS
+# ==========================
+# Cada base guarda en ".catalog.json" el esquema, la cantidad de filas y el
+# tamaño en disco de sus tablas. Se actualiza con cada escritura y DDL; la
+# copia en memoria responde a /databases, /tables y /columns sin leer datos ni
+# recorrer directorios. Los INSERT del log solo actualizan la copia en memoria:
+# cada entrada guarda el lsn hasta el que cuenta filas y, al cargar el
+# catálogo, se suman los registros del log posteriores.
+_catalogs = {}
+_catalog_guard = threading.RLock()
+_database_names = None
+
+def catalog_path(db):
+    return os.path.join(DATA_DIR, db, CATALOG_FILE)
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+def log_row_delta(rec):
+    """Filas que agrega (o quita) un registro del log."""
+    if rec["op"] == "insert":
+        return 1
+    if rec["op"] in ("delete", "tombstone"):
+        return -len(rec["ids"])
+    return 0
+
+def _scan_table_entry(db, table):
+    """Entrada de catálogo a partir de los archivos (cabecera y log, sin decodificar columnas)."""
+    path = table_path(db, table)
+    if os.path.exists(path):
+        header = read_table_header(path)
+        dead = header.get("deleted", {}).get("count", 0)
+        entry = {"columns": header["columns"], "rows": header["rows"] - dead, "lsn": header.get("lsn", 0),
+                 "indexes": header.get("indexes", [])}
+    else:
+        path = legacy_table_path(db, table)
+        with open(path, "r") as f:
+            legacy = json.load(f)
+        # Tabla JSON aún sin migrar: se migra al leerla por primera vez
+        entry = {"columns": legacy["columns"], "rows": len(legacy["rows"]), "lsn": 0, "legacy": True}
+    entry["size"] = _file_size(path)
+    return entry
+
+def _catch_up_log(db, table, entry):
+    """Suma a la entrada los registros del log que aún no cuenta."""
+    if not os.path.exists(log_path(db, table)):
+        return
+    for rec in read_log(db, table):
+        if rec["lsn"] > entry["lsn"]:
+            entry["rows"] += log_row_delta(rec)
+            entry["lsn"] = rec["lsn"]
+    entry["size"] = _file_size(table_path(db, table)) + _file_size(log_path(db, table))
+
+def _write_catalog(db, tables):
+    path = catalog_path(db)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"tables": tables}, f)
+    os.replace(tmp_path, path)
+
+def database_catalog(db):
+    """Catálogo en memoria de una base ({tabla: entrada}), o None si la base no existe."""
+    with _catalog_guard:
+        tables = _catalogs.get(db)
+        if tables is not None:
+            return tables
+        if not os.path.isdir(os.path.join(DATA_DIR, db)):
+            return None
+        try:
+            with open(catalog_path(db), "r", encoding="utf-8") as f:
+                tables = json.load(f)["tables"]
+        except (FileNotFoundError, ValueError, KeyError):
+            # Bases creadas antes del catálogo (o catálogo dañado): se reconstruye una vez
+            tables = {table: _scan_table_entry(db, table) for table in list_table_names(db)}
+        for table, entry in tables.items():
+            _catch_up_log(db, table, entry)
+        _write_catalog(db, tables)
+        _catalogs[db] = tables
+        return tables
+
+def catalog_entry(db, table):
+    tables = database_catalog(db)
+    return tables.get(table) if tables is not None else None
+
+def catalog_put(db, table, columns, rows, lsn, indexes=()):
+    """Registra el estado de una tabla recién escrita en el archivo base."""
+    with _catalog_guard:
+        tables = database_catalog(db)
+        changes = tables[table].get("changes", 0) if table in tables else 0
+        tables[table] = {
+            "columns": columns,
+            "rows": rows,
+            "lsn": lsn,
+            "size": _file_size(table_path(db, table)),
+            "changes": changes,
+            "indexes": list(indexes)
+        }
+        _write_catalog(db, tables)
+        register_database(db)
+
+def catalog_log_appended(db, table, records, size):
+    """Actualiza (solo en memoria) la entrada tras agregar registros al log."""
+    with _catalog_guard:
+        entry = catalog_entry(db, table)
+        if entry is None:
+            return
+        # Si el catálogo se acaba de cargar, ya incluye estos registros
+        pending = [rec for rec in records if rec["lsn"] > entry["lsn"]]
+        if pending:
+            entry["rows"] += sum(log_row_delta(rec) for rec in pending)
+            entry["lsn"] = pending[-1]["lsn"]
+            entry["size"] += size
+
+def catalog_remove(db, table):
+    with _catalog_guard:
+        tables = database_catalog(db)
+        if tables is not None and tables.pop(table, None) is not None:
+            _write_catalog(db, tables)
+
+def catalog_rename(db, table, new_table):
+    with _catalog_guard:
+        tables = database_catalog(db)
+        if tables is not None and table in tables:
+            tables[new_table] = tables.pop(table)
+            _write_catalog(db, tables)
+
+def forget_catalog(db):
+    """Descarta el catálogo en memoria tras DROP/RENAME de la base."""
+    global _database_names
+    with _catalog_guard:
+        _catalogs.pop(db, None)
+        _database_names = None
+
+def database_names():
+    """Bases de datos existentes (se recorre DATA_DIR solo la primera vez)."""
+    global _database_names
+    with _catalog_guard:
+        if _database_names is None:
+            _database_names = sorted(d for d in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, d)))
+        return list(_database_names)
+
+def register_database(db):
+    with _catalog_guard:
+        if _database_names is not None and db not in _database_names:
+            _database_names.append(db)
+            _database_names.sort()
+
+
+# ==========================
+# ESTADÍSTICAS DE TABLAS (ANALYZE)
+# ==========================
+# "ANALYZE db.tabla" guarda junto a la tabla la cantidad de filas y, por
+# columna, la fracción de nulos, la cantidad de valores distintos, el mínimo,
+# el máximo y un histograma de igual profundidad (límites de HISTOGRAM_BUCKETS
+# cubetas con aproximadamente las mismas filas). El catálogo cuenta las filas
+# modificadas desde el último análisis; al llegar a AUTO_ANALYZE_CHANGES la
+# tabla se vuelve a analizar en segundo plano. El optimizer lee estas
+# estadísticas para planificar.
+_table_stats = {}
+
+def stats_path(db, table):
+    return os.path.join(DATA_DIR, db, f"{table}{STATS_EXT}")
+
+def _stats_sort_key(value):
+    # Agrupa por tipo para poder ordenar columnas con valores mezclados
+    return (value_kind(value) or "", value)
+
+def column_statistics(values):
+    """Nulos, distintos, mínimo, máximo e histograma de igual profundidad de una columna."""
+    if isinstance(values, DictColumn):
+        # Se cuenta por código y se decodifica una vez por valor distinto
+        counts = {}
+        for code, count in Counter(values.codes).items():
+            value = values.dictionary[code]
+            counts[value] = counts.get(value, 0) + count
+    else:
+        counts = Counter(values)
+    nulls = counts.pop(None, 0)
+    present = len(values) - nulls
+    ordered = sorted(counts, key=_stats_sort_key)
+    histogram = []
+    if ordered:
+        # Límites en las posiciones 0, n/B, 2n/B, ..., n-1 de los valores ordenados
+        buckets = min(HISTOGRAM_BUCKETS, present)
+        targets = [(present - 1) * i // buckets for i in range(buckets + 1)]
+        seen = 0
+        t = 0
+        for value in ordered:
+            seen += counts[value]
+            while t < len(targets) and targets[t] < seen:
+                histogram.append(value)
+                t += 1
+    return {
+        "null_frac": nulls / len(values) if len(values) else 0.0,
+        "distinct": len(ordered),
+        "min": ordered[0] if ordered else None,
+        "max": ordered[-1] if ordered else None,
+        "histogram": histogram
+    }
+
+def analyze_table(db, table):
+    """Calcula y guarda las estadísticas de la tabla; devuelve None si no existe."""
+    with table_lock(db, table):
+        data = load_table(db, table)
+        if data is None:
+            return None
+        stats = {
+            "rows": data.live_count,
+            "lsn": data.lsn,
+            "analyzed_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "columns": {name: column_statistics(data.live_values(name)) for name in data.data}
+        }
+        path = stats_path(db, table)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(stats, f, default=json_default)
+        os.replace(path + ".tmp", path)
+        _table_stats[(db, table)] = stats
+        with _catalog_guard:
+            entry = catalog_entry(db, table)
+            if entry is not None:
+                entry["changes"] = 0
+        return stats
+
+def table_stats(db, table):
+    """Estadísticas guardadas de la tabla (con valores nativos), o None si nunca se analizó."""
+    if not db or not is_valid_name(db) or not is_valid_name(table):
+        return None
+    key = (db, table)
+    if key not in _table_stats:
+        try:
+            with open(stats_path(db, table), "r", encoding="utf-8") as f:
+                stats = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        # Mínimos, máximos y límites del histograma vuelven al tipo de la columna
+        for col in load_table_schema(db, table) or []:
+            col_stats = stats["columns"].get(col["name"])
+            if col_stats:
+                for field in ("min", "max"):
+                    col_stats[field] = coerce_lenient(col, col_stats[field])
+                col_stats["histogram"] = [coerce_lenient(col, v) for v in col_stats["histogram"]]
+        _table_stats[key] = stats
+    return _table_stats[key]
+
+def changed_rows(rec):
+    """Filas que toca un registro de cambios."""
+    if rec["op"] == "vacuum":
+        return 0
+    return 1 if rec["op"] == "insert" else len(rec.get("ids", ()))
+
+def note_changes(db, table, records):
+    """Suma filas modificadas desde el último ANALYZE y agenda uno automático al superar el umbral."""
+    with _catalog_guard:
+        entry = catalog_entry(db, table)
+        if entry is None:
+            return
+        entry["changes"] = entry.get("changes", 0) + sum(changed_rows(rec) for rec in records)
+        due = entry["changes"] >= AUTO_ANALYZE_CHANGES
+    if due:
+        schedule_maintenance(analyze_table, db, table)
+
+
+# ==========================
+# RESPALDOS INCREMENTALES
+# ==========================
+# Cada tabla tiene una cadena de respaldo en "backups/<tabla>/<table_id>/":
+# una foto completa ("base.qct") tomada una sola vez y un diario ("journal.log")
+# con los cambios posteriores (los mismos registros del log de escritura) y
+# marcas de versión. Una versión se reconstruye aplicando sobre la base los
+# cambios anteriores a su marca, así que crear una versión cuesta O(1).
+# El diario repite también el contenido de cada INSERT: el log se vacía en
+# cada checkpoint y el archivo de la tabla solo guarda el estado actual (las
+# filas pueden actualizarse, borrarse o eliminarse en un vacuum después), así
+# que sin esa copia una versión anterior no podría reconstruirse.
+# Cuando una cadena acumula más de 2 * BACKUP_MAX_VERSIONS versiones, el hilo
+# de mantenimiento la consolida en una base nueva (ver rebase_backups).
+_backup_states = {}
+
+def backup_root(db, table):
+    return os.path.join(DATA_DIR, db, "backups", table)
+
+def _chain_dirs(db, table):
+    root = backup_root(db, table)
+    if not os.path.isdir(root):
+        return []
+    return [os.path.join(root, d) for d in sorted(os.listdir(root)) if os.path.isdir(os.path.join(root, d))]
+
+def _chain_versions(chain):
+    """Marcas de versión de una cadena (se leen del diario una vez y se cachean)."""
+    versions = _backup_states.get(chain)
+    if versions is None:
+        versions = [rec for rec in read_json_lines(os.path.join(chain, "journal.log")) if rec["op"] == "version"]
+        _backup_states[chain] = versions
+    return versions
+
+def _append_journal(chain, records):
+    with open(os.path.join(chain, "journal.log"), "a", encoding="utf-8") as f:
+        f.write("".join(json.dumps(rec, default=json_default) + "\n" for rec in records))
+
+def journal_changes(db, table, records):
+    """
+    Registra cambios en la cadena de respaldo de la tabla, si tiene una.
+    Se copian completos (también las filas insertadas) porque el log se vacía en cada checkpoint.
+    """
+    table_id = _log_state(db, table)["table_id"]
+    if not table_id:
+        return
+    chain = os.path.join(backup_root(db, table), table_id)
+    if os.path.exists(os.path.join(chain, "journal.log")):
+        _append_journal(chain, [{k: v for k, v in rec.items() if k != "lsn"} for rec in records])
+
+def backup_table(db, table, data):
+    """
+    Marca una nueva versión restaurable con el estado actual de la tabla.
+    Solo la primera versión de una cadena copia la tabla completa.
+    """
+    if data.table_id is None:
+        data.table_id = _log_state(db, table)["table_id"] or new_table_id()
+    chain = os.path.join(backup_root(db, table), data.table_id)
+    os.makedirs(chain, exist_ok=True)
+    if not os.path.exists(os.path.join(chain, "journal.log")):
+        write_table_file(os.path.join(chain, "base.qct"), data)
+        open(os.path.join(chain, "journal.log"), "w").close()
+        _backup_states.pop(chain, None)
+    versions = _chain_versions(chain)
+    version = 1 + max((v["version"] for c in _chain_dirs(db, table) for v in _chain_versions(c)), default=0)
+    marker = {
+        "op": "version",
+        "version": version,
+        "timestamp": datetime.datetime.now().strftime("%Y%m%d_%H%M%S"),
+        "rows": data.live_count
+    }
+    _append_journal(chain, [marker])
+    versions.append(marker)
+    if len(versions) > 2 * BACKUP_MAX_VERSIONS:
+        # La consolidación reescribe la base: se hace en segundo plano, fuera de esta escritura
+        schedule_maintenance(rebase_backups, db, table)
+    return version
+
+def _read_chain(db, table, chain):
+    """Base y diario de una cadena, leídos con la tabla bloqueada (el rebase los reemplaza juntos)."""
+    with table_lock(db, table):
+        return read_table_file(os.path.join(chain, "base.qct")), read_json_lines(os.path.join(chain, "journal.log"))
+
+def _replay_chain(chain, data, journal, stop_version=None):
+    """Aplica sobre la base `data` el diario hasta justo antes de la marca `stop_version`."""
+    for i, rec in enumerate(journal):
+        if rec["op"] == "version":
+            if rec["version"] == stop_version:
+                return data, i
+        elif rec["op"] == "load":
+            # Restauración completa registrada en el diario
+            data = read_table_file(os.path.join(chain, rec["file"]))
+        else:
+            apply_log_record(data, decode_log_record(data.columns, rec))
+    return (None, None) if stop_version is not None else (data, None)
+
+def _rebase_chain(db, table, chain, version):
+    """
+    Descarta las versiones anteriores a `version`, que pasa a ser la nueva base.
+    La reconstrucción y la escritura de la base nueva se hacen sin bloquear la tabla;
+    solo el reemplazo de los archivos (con lo que se agregó al diario mientras tanto) la bloquea.
+    """
+    base, journal = _read_chain(db, table, chain)
+    data, position = _replay_chain(chain, base, journal, version)
+    if data is None:
+        return
+    write_table_file(os.path.join(chain, "base.tmp"), data)
+    with table_lock(db, table):
+        tail = read_json_lines(os.path.join(chain, "journal.log"))[len(journal):]
+        journal = journal[position:] + tail
+        with open(os.path.join(chain, "journal.tmp"), "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(rec) + "\n" for rec in journal))
+        os.replace(os.path.join(chain, "base.tmp"), os.path.join(chain, "base.qct"))
+        os.replace(os.path.join(chain, "journal.tmp"), os.path.join(chain, "journal.log"))
+        referenced = {rec["file"] for rec in journal if rec["op"] == "load"}
+        for f in os.listdir(chain):
+            if f.startswith("load_") and f not in referenced:
+                os.remove(os.path.join(chain, f))
+        _backup_states.pop(chain, None)
+
+def rebase_backups(db, table):
+    """Tarea de mantenimiento: consolida las cadenas con más de 2 * BACKUP_MAX_VERSIONS versiones."""
+    for chain in _chain_dirs(db, table):
+        with table_lock(db, table):
+            versions = list(_chain_versions(chain))
+        if len(versions) > 2 * BACKUP_MAX_VERSIONS:
+            _rebase_chain(db, table, chain, versions[-BACKUP_MAX_VERSIONS]["version"])
+
+def list_backup_versions(db, table):
+    versions = []
+    for chain in _chain_dirs(db, table):
+        for marker in _chain_versions(chain):
+            versions.append({**marker, "name": f'{table}_v{marker["version"]}_{marker["timestamp"]}'})
+    return sorted(versions, key=lambda v: v["version"])
+
+def rebuild_backup_version(db, table, version):
+    """Reconstruye una versión a partir de la base de su cadena más los cambios registrados."""
+    for chain in _chain_dirs(db, table):
+        if any(marker["version"] == version for marker in _chain_versions(chain)):
+            base, journal = _read_chain(db, table, chain)
+            data, _ = _replay_chain(chain, base, journal, version)
+            if data is not None:
+                data.table_id = os.path.basename(chain)
+            return data
+    return None
+
+def journal_restore(db, table, data):
+    """Registra en la cadena una restauración completa (la tabla cambia de golpe)."""
+    chain = os.path.join(backup_root(db, table), data.table_id)
+    if os.path.exists(os.path.join(chain, "journal.log")):
+        file_name = f"load_{uuid.uuid4().hex[:8]}.qct"
+        write_table_file(os.path.join(chain, file_name), data)
+        _append_journal(chain, [{"op": "load", "file": file_name}])
+
+def parse_db_table(full_name):
+    # Elimina alias si existe (por ejemplo: "tienda.clientes AS c" -> "tienda.clientes")
+    full_name = full_name.split(" AS ")[0].split(" as ")[0].strip()
+    parts = full_name.split('.')
+    if len(parts) == 2:
+        return parts[0], parts[1]
+    return None, parts[0]
+
+def normalizar(texto):
+    if texto is None:
+        return ""
+    # Quita acentos, pasa a minúsculas y elimina espacios extra
+    texto = str(texto).strip().lower()
+    texto = ''.join(c for c in unicodedata.normalize('NFD', texto)
+                    if unicodedata.category(c) != 'Mn')
+    return texto
+
+def join_collation(left_col, right_col):
+    """
+    Collation con la que se comparan las columnas de un JOIN: la declarada
+    en alguna de las dos (la izquierda primero); None si ambas son de un tipo
+    nativo (se compara el valor mismo); si no, la de los JOIN por defecto.
+    """
+    for col in (left_col, right_col):
+        if col and col.get("collation"):
+            return col["collation"]
+    if left_col and right_col and base_type(left_col["type"]) in NATIVE_TYPES and base_type(right_col["type"]) in NATIVE_TYPES:
+        return None
+    return JOIN_DEFAULT_COLLATION
+
+def join_key_fn(left_col, right_col):
+    """Clave de comparación de un JOIN según join_collation (None: el valor nativo)."""
+    collation = join_collation(left_col, right_col)
+    if collation is None:
+        return None
+    key = COLLATIONS[collation]
+    if key is None:
+        return lambda v: v if v is None else str(v)
+    return lambda v: v if v is None else key(str(v))
+
+JOIN_KINDS = ("INNER", "LEFT", "RIGHT", "FULL", "CROSS")
+
+def join_column(relations, ref):
+    """
+    Columna `alias.col` (o `col`) de las tablas de un JOIN: devuelve
+    (valores, posición de la tabla) o (None, None). Un nombre sin calificar
+    se busca desde la última tabla, así las de la derecha pisan a las de la
+    izquierda como en el resultado combinado.
+    """
+    parts = ref.split(".")
+    name = parts[-1]
+    qualifier = parts[-2] if len(parts) > 1 else None
+    for pos in range(len(relations) - 1, -1, -1):
+        alias, table, data = relations[pos]
+        if qualifier is not None and qualifier not in (alias, table):
+            continue
+        if name in data.data:
+            return data.data[name], pos
+    return None, None
+
+def _join_keys(data, name, key_fn):
+    values = data.data[name]
+    return column_keys(values, key_fn) if key_fn is not None else values
+
+def _row_key_getter(sources):
+    """Clave de join de una fila (tupla de ids por tabla, o un id): None si algún componente es NULL."""
+    if len(sources) == 1:
+        ((pos, keys),) = sources
+        if pos is None:
+            return keys.__getitem__
+        return lambda row: None if row[pos] is None else keys[row[pos]]
+    def key(row):
+        parts = []
+        for pos, keys in sources:
+            i = row if pos is None else row[pos]
+            value = None if i is None else keys[i]
+            if value is None:
+                return None
+            parts.append(value)
+        return tuple(parts)
+    return key
+
+def hash_join(rows, relations, right, conditions, kind="INNER"):
+    """
+    Une las filas ya combinadas (`rows`: tuplas con un id de fila por tabla
+    de `relations`, None si la tabla no aportó fila) con la tabla `right`.
+    `conditions` son pares ((posición, columna izquierda), columna derecha)
+    de un equi-join, con claves según la collation (ver join_key_fn). La
+    tabla hash se construye sobre el lado con menos filas y se recorre el
+    otro; el resultado queda en el orden de la izquierda y las filas sin
+    pareja se completan con None según INNER/LEFT/RIGHT/FULL.
+    """
+    left_sources, right_sources = [], []
+    for (pos, left_name), right_name in conditions:
+        left_data = relations[pos][2]
+        key_fn = join_key_fn(left_data.column_schema(left_name), right.column_schema(right_name))
+        left_sources.append((pos, _join_keys(left_data, left_name, key_fn)))
+        right_sources.append((None, _join_keys(right, right_name, key_fn)))
+    if conditions:
+        left_key, right_key = _row_key_getter(left_sources), _row_key_getter(right_sources)
+    else:
+        # CROSS JOIN: todas las filas comparten la clave vacía
+        left_key = right_key = lambda row: ()
+    keep_left = kind in ("LEFT", "FULL")
+    keep_right = kind in ("RIGHT", "FULL")
+    width = len(relations)
+    right_ids = right.live_row_ids()
+    if len(right_ids) <= len(rows):
+        # Construye sobre la derecha y recorre la izquierda (ya en orden)
+        table = {}
+        for r in right_ids:
+            key = right_key(r)
+            if key is not None:
+                table.setdefault(key, []).append(r)
+        result = []
+        matched_right = set()
+        for row in rows:
+            key = left_key(row)
+            matches = table.get(key) if key is not None else None
+            if matches:
+                result.extend(row + (r,) for r in matches)
+                if keep_right:
+                    matched_right.update(matches)
+            elif keep_left:
+                result.append(row + (None,))
+        unmatched_right = [r for r in right_ids if r not in matched_right] if keep_right else []
+    else:
+        # Construye sobre la izquierda y recorre la derecha; luego se reordena por la izquierda
+        table = {}
+        for position, row in enumerate(rows):
+            key = left_key(row)
+            if key is not None:
+                table.setdefault(key, []).append(position)
+        pairs = []
+        unmatched_right = []
+        for r in right_ids:
+            key = right_key(r)
+            positions = table.get(key) if key is not None else None
+            if positions:
+                pairs.extend((position, r) for position in positions)
+            elif keep_right:
+                unmatched_right.append(r)
+        if keep_left:
+            matched_left = {position for position, _ in pairs}
+            pairs.extend((position, None) for position in range(len(rows)) if position not in matched_left)
+        pairs.sort(key=lambda pair: pair[0])
+        result = [rows[position] + (r,) for position, r in pairs]
+    result.extend((None,) * width + (r,) for r in unmatched_right)
+    return result
+
+def index_serves_join(left_col, right_col):
+    """
+    Un índice de la columna derecha sirve para buscar valores de la izquierda
+    si indexa con la misma comparación que usa el JOIN.
+    """
+    collation = join_collation(left_col, right_col)
+    if collation is None:
+        return True
+    return (right_col.get("collation") == collation and left_col is not None
+            and base_type(left_col["type"]) not in NATIVE_TYPES)
+
+def merge_serves_join(left_col, right_col):
+    """
+    El merge join compara directamente las claves de los dos índices ordenados:
+    solo sirve si las columnas tienen el mismo tipo base (INT con DATE o TEXT
+    no se pueden ordenar juntos) y, si son de texto, la misma collation.
+    """
+    if left_col is None or right_col is None or base_type(left_col["type"]) != base_type(right_col["type"]):
+        return False
+    return left_col.get("collation") == right_col.get("collation")
+
+def index_nested_loop_join(rows, relations, right, condition, index, kind="INNER"):
+    """
+    Para cada fila de la izquierda busca sus parejas en el índice de la
+    columna derecha: no construye tabla hash ni recorre la tabla derecha.
+    Solo INNER y LEFT (las filas derechas sin pareja no se visitan).
+    """
+    (pos, left_name), _ = condition
+    left_values = relations[pos][2].data[left_name]
+    is_deleted = right.is_deleted if right.dead_count else None
+    result = []
+    for row in rows:
+        i = row[pos]
+        value = None if i is None else left_values[i]
+        matches = index.lookup(value) if value is not None else ()
+        if is_deleted is not None:
+            matches = [r for r in matches if not is_deleted(r)]
+        if matches:
+            result.extend(row + (r,) for r in matches)
+        elif kind == "LEFT":
+            result.append(row + (None,))
+    return result
+
+def merge_join(left, left_index, right, right_index, kind="INNER"):
+    """
+    Une dos tablas recorriendo a la vez sus índices ordenados sobre la clave
+    del JOIN: solo avanza por las dos listas de valores, sin tabla hash. El
+    resultado sale en el orden de la clave. Solo INNER y LEFT.
+    """
+    left_keys, right_keys = left_index.keys, right_index.keys
+    left_live = (lambda ids: [i for i in ids if not left.is_deleted(i)]) if left.dead_count else list
+    right_live = (lambda ids: [i for i in ids if not right.is_deleted(i)]) if right.dead_count else list
+    result = []
+    if kind == "LEFT":
+        result.extend((i, None) for i in left_live(left_index.entries.get(None, ())))
+    j = 0
+    for value in left_keys:
+        while j < len(right_keys) and right_keys[j] < value:
+            j += 1
+        left_ids = left_live(left_index.entries[value])
+        matches = right_live(right_index.entries[value]) if j < len(right_keys) and right_keys[j] == value else []
+        if matches:
+            result.extend((l, r) for l in left_ids for r in matches)
+        elif kind == "LEFT":
+            result.extend((l, None) for l in left_ids)
+    return result
+
+def join_conditions(relations, right_alias, right_table, right_data, on):
+    """Resuelve los pares de columnas del ON: uno de cada lado, en cualquier orden."""
+    conditions = []
+    right_relation = [(right_alias, right_table, right_data)]
+    for a, b in on:
+        for left_ref, right_ref in ((a, b), (b, a)):
+            _, pos = join_column(relations, left_ref)
+            values, _ = join_column(right_relation, right_ref)
+            if pos is not None and values is not None:
+                conditions.append(((pos, left_ref.split(".")[-1]), right_ref.split(".")[-1]))
+                break
+        else:
+            raise ValueError(f'Columnas del JOIN no encontradas: {a} = {b}')
+    return conditions
 
-CLIENT_SECRETS_FILE = "credentials.json"
-SCOPES = ["https://www.googleapis.com/auth/drive.file"]
 # ==========================
-# FUNCIONES UTILITARIAS
+# AGREGACIÓN
 # ==========================
-def save_table(db, table, data):
-    os.makedirs(os.path.join(DATA_DIR, db), exist_ok=True)
-    with open(os.path.join(DATA_DIR, db, f"{table}.json"), "w") as f:
-        json.dump(data, f)
+AGGREGATE_FUNCS = ("SUM", "COUNT", "AVG", "MIN", "MAX")
 
-def is_valid_name(name):
-    return re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', name) is not None
+def aggregate_name(agg):
+    """Nombre de la columna de un agregado en el resultado: su alias o func_columna."""
+    if agg["alias"]:
+        return agg["alias"]
+    func = agg["func"].lower() + ("_distinct" if agg.get("distinct") else "")
+    return f"{func}_{agg['col'].split('.')[-1]}"
 
-def load_table(db, table):
-    try:
-        with open(os.path.join(DATA_DIR, db, f"{table}.json"), "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+def _aggregate_ops(agg, key=None):
+    """
+    (estado inicial, paso, paso por lote, resultado) del acumulador de un
+    agregado; `key` es la collation de la columna. El paso por lote recibe
+    la lista de valores de un grupo en un lote.
+    """
+    func = agg["func"]
+    if func == "COUNT" and agg.get("distinct"):
+        def step(state, v):
+            if v is not None:
+                state.add(v if key is None else key(v))
+        def batch(state, values):
+            present = [v for v in values if v is not None]
+            state.update(present if key is None else map(key, present))
+        return set, step, batch, len
+    if agg.get("distinct"):
+        raise ValueError(f'{func}(DISTINCT ...) no está soportado')
+    if func == "COUNT":
+        if agg["col"] == "*":
+            def step(state, v):
+                state[0] += 1
+            def batch(state, values):
+                state[0] += len(values)
+        else:
+            def step(state, v):
+                if v is not None:
+                    state[0] += 1
+            def batch(state, values):
+                state[0] += len(values) - values.count(None)
+        return lambda: [0], step, batch, lambda state: state[0]
+    if func in ("SUM", "AVG"):
+        def step(state, v):
+            if v is not None:
+                state[0] += numeric_value(v)
+                state[1] += 1
+        def batch(state, values):
+            present = [v for v in values if v is not None]
+            if present:
+                state[0] += sum(map(numeric_value, present)) if isinstance(present[0], str) else sum(present)
+                state[1] += len(present)
+        if func == "SUM":
+            # Sin valores no nulos (grupo vacío o todo NULL) la suma es NULL, no 0
+            return lambda: [0, 0], step, batch, lambda state: state[0] if state[1] else None
+        return lambda: [0, 0], step, batch, lambda state: state[0] / state[1] if state[1] else None
+    better = operator.lt if func == "MIN" else operator.gt
+    pick = min if func == "MIN" else max
+    def step(state, v):
+        if v is not None:
+            k = v if key is None else key(v)
+            if state[1] is None or better(k, state[1]):
+                state[0], state[1] = v, k
+    def batch(state, values):
+        present = [v for v in values if v is not None]
+        if present:
+            step(state, pick(present) if key is None else pick(present, key=key))
+    return lambda: [None, None], step, batch, lambda state: state[0]
 
-def backup_table(db, table, data):
-    backup_dir = os.path.join(DATA_DIR, db, "backups")
-    os.makedirs(backup_dir, exist_ok=True)
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_file = os.path.join(backup_dir, f"{table}_{timestamp}.json")
-    with open(backup_file, "w") as f:
-        json.dump(data, f)
+class HashAggregate:
+    """
+    Agregación hash en una sola pasada: cada grupo guarda la primera fila
+    (para las columnas del GROUP BY) y un acumulador por agregado (contador,
+    suma, mínimo...), nunca sus filas, así la memoria crece con la cantidad
+    de grupos y no con la de filas de entrada.
+    """
+    def __init__(self, aggregates, keys=None):
+        self.ops = [_aggregate_ops(agg, key) for agg, key in zip(aggregates, keys or [None] * len(aggregates))]
+        self.groups = {}
 
-def parse_db_table(full_name):
-    # Elimina alias si existe (por ejemplo: "tienda.clientes AS c" -> "tienda.clientes")
-    full_name = full_name.split(" AS ")[0].split(" as ")[0].strip()
-    parts = full_name.split('.')
-    if len(parts) == 2:
-        return parts[0], parts[1]
-    return None, parts[0]
+    def _entry(self, group, row):
+        entry = self.groups.get(group)
+        if entry is None:
+            entry = self.groups[group] = (row, [init() for init, _, _, _ in self.ops])
+        return entry
 
-def normalizar(texto):
-    if texto is None:
-        return ""
-    # Quita acentos, pasa a minúsculas y elimina espacios extra
-    texto = str(texto).strip().lower()
-    texto = ''.join(c for c in unicodedata.normalize('NFD', texto)
-                    if unicodedata.category(c) != 'Mn')
-    return texto
+    def add(self, group, row, values):
+        for (_, step, _, _), state, value in zip(self.ops, self._entry(group, row)[1], values):
+            step(state, value)
+
+    def add_batch(self, group, row, chunks):
+        """Acumula de una vez los valores de un grupo en un lote (una lista por agregado)."""
+        for (_, _, batch, _), state, chunk in zip(self.ops, self._entry(group, row)[1], chunks):
+            batch(state, chunk)
+
+    def ensure(self, group):
+        """Crea el grupo aunque no tenga filas (agregados sin GROUP BY sobre una entrada vacía)."""
+        self._entry(group, None)
+
+    def results(self):
+        for row, states in self.groups.values():
+            yield row, [final(state) for (_, _, _, final), state in zip(self.ops, states)]
+
+def having_predicate(having):
+    """Compila una vez por consulta las condiciones del HAVING en un predicado sobre las filas del resultado."""
+    checks = [(cond["name"], make_predicate(cond["op"], cond["value"])) for cond in having]
+    return lambda result_row: all(check(result_row.get(name)) for name, check in checks)
+
+def grouped_rows(rows, group_by, aggregates):
+    """
+    GROUP BY en streaming sobre `rows` (ids de fila o tuplas de ids de un JOIN).
+    `group_by`: (nombre, clave(fila), valor(fila)) por columna; la clave son
+    los códigos de diccionario o la clave de la collation. `aggregates`:
+    (agregado, valor(fila), collation).
+    """
+    aggregator = HashAggregate([agg for agg, _, _ in aggregates], [key for _, _, key in aggregates])
+    key_fns = [key for _, key, _ in group_by]
+    value_fns = [value for _, value, _ in aggregates]
+    add = aggregator.add
+    if len(key_fns) == 1:
+        group_of = key_fns[0]
+    else:
+        group_of = lambda row: tuple(key(row) for key in key_fns)
+    for row in rows:
+        add(group_of(row), row, [value(row) for value in value_fns])
+    if not group_by:
+        aggregator.ensure(())
+    return group_result_rows(aggregator, [(name, value) for name, _, value in group_by], aggregates)
+
+def grouped_batches(batches, group_by, aggregates):
+    """
+    GROUP BY por lotes de una tabla: como grouped_rows, pero consume lotes
+    (inicio, fin, selección). Cada lote reparte sus posiciones por grupo y
+    cada acumulador recibe de una vez la lista de valores de su grupo; si un
+    lote tiene casi tantos grupos como filas, se acumula fila por fila.
+    `group_by`: (nombre, claves, valores) por columna; `aggregates`:
+    (agregado, valores o None para COUNT(*), collation).
+    """
+    aggregator = HashAggregate([agg for agg, _, _ in aggregates], [key for _, _, key in aggregates])
+    key_readers = [batch_reader(keys) for _, keys, _ in group_by]
+    readers = [batch_reader(values) if values is not None else None for _, values, _ in aggregates]
+    for start, end, sel in batches:
+        ids = range(start, end) if sel is None else sel
+        chunks = [ids if read is None else read(start, end, sel) for read in readers]
+        if not key_readers:
+            aggregator.add_batch((), None, chunks)
+            continue
+        if len(key_readers) == 1:
+            keys = key_readers[0](start, end, sel)
+        else:
+            keys = list(zip(*(read(start, end, sel) for read in key_readers)))
+        positions = {}
+        for pos, key in enumerate(keys):
+            group = positions.get(key)
+            if group is None:
+                positions[key] = [pos]
+            else:
+                group.append(pos)
+        if len(positions) * 4 > len(keys):
+            for pos, key in enumerate(keys):
+                aggregator.add(key, ids[pos], [chunk[pos] for chunk in chunks])
+        elif len(positions) == 1:
+            aggregator.add_batch(keys[0], ids[0], chunks)
+        else:
+            for key, group in positions.items():
+                aggregator.add_batch(key, ids[group[0]], [[chunk[p] for p in group] for chunk in chunks])
+    if not group_by:
+        aggregator.ensure(())
+    return group_result_rows(aggregator, [(name, values.__getitem__) for name, _, values in group_by], aggregates)
 
-def join_tables(left_rows, right_rows, left_key, right_key):
+def group_result_rows(aggregator, group_values, aggregates):
+    """Filas del resultado: las columnas del GROUP BY (de la primera fila de cada grupo) y los agregados."""
     result = []
-    for l in left_rows:
-        for r in right_rows:
-            if normalizar(l.get(left_key)) == normalizar(r.get(right_key)):
-                combined = {**l, **r}
-                result.append(combined)
+    for first, values in aggregator.results():
+        result_row = {name: value(first) for name, value in group_values}
+        for (agg, _, _), value in zip(aggregates, values):
+            result_row[aggregate_name(agg)] = value
+        result.append(result_row)
     return result
 
-def group_by_agg(rows, group_col, agg_col, agg_func):
-    groups = {}
-    for row in rows:
-        key = row[group_col]
-        groups.setdefault(key, []).append(row)
+def apply_having(rows, aggregates, having):
+    """Filtra los grupos con HAVING y quita los agregados ocultos (solo usados por HAVING)."""
+    hidden = [aggregate_name(agg) for agg in aggregates if agg.get("hidden")]
+    matches = having_predicate(having) if having else None
     result = []
-    for key, group_rows in groups.items():
-        if agg_func == "SUM":
-            agg_value = sum(float(r[agg_col]) for r in group_rows)
-        elif agg_func == "COUNT":
-            agg_value = len(group_rows)
-        else:
-            agg_value = None
-        result.append({group_col: key, f"{agg_func.lower()}_{agg_col}": agg_value})
+    for row in rows:
+        if matches is not None and not matches(row):
+            continue
+        for name in hidden:
+            del row[name]
+        result.append(row)
     return result
 
+def _relation_getter(values, pos):
+    return lambda row: None if row[pos] is None else values[row[pos]]
+
+def _group_keys(data, name):
+    """Claves de agrupación de una columna: las de su collation, si tiene, o los códigos/valores."""
+    values = data.data[name]
+    key = collation_key_fn(data.column_schema(name))
+    if key is None:
+        return group_keys(values)
+    return column_keys(values, lambda v: v if v is None else key(v))
+
+def table_group_sources(table_data, group_by, aggregates):
+    """Entradas de grouped_batches para una sola tabla: las columnas de claves y de valores."""
+    group_sources = []
+    for ref in group_by:
+        name = ref.split(".")[-1]
+        if name not in table_data.data:
+            raise ValueError(f'Columna {name} no existe en la tabla')
+        group_sources.append((name, _group_keys(table_data, name), table_data.data[name]))
+    agg_sources = []
+    for agg in aggregates:
+        name = agg["col"].split(".")[-1]
+        if agg["col"] == "*":
+            agg_sources.append((agg, None, None))
+            continue
+        if name not in table_data.data:
+            raise ValueError(f'Columna {name} no existe en la tabla')
+        agg_sources.append((agg, table_data.data[name], collation_key_fn(table_data.column_schema(name))))
+    return group_sources, agg_sources
+
+def join_group_sources(relations, group_by, aggregates):
+    """Entradas de grouped_rows para el resultado de un JOIN (las filas son tuplas de ids)."""
+    group_sources = []
+    for ref in group_by:
+        values, pos = join_column(relations, ref)
+        if values is None:
+            raise ValueError(f'Columna {ref} no existe en el JOIN')
+        name = ref.split(".")[-1]
+        keys = _group_keys(relations[pos][2], name)
+        group_sources.append((name, _relation_getter(keys, pos), _relation_getter(values, pos)))
+    agg_sources = []
+    for agg in aggregates:
+        if agg["col"] == "*":
+            agg_sources.append((agg, lambda row: None, None))
+            continue
+        values, pos = join_column(relations, agg["col"])
+        if values is None:
+            raise ValueError(f'Columna {agg["col"]} no existe en el JOIN')
+        key = collation_key_fn(relations[pos][2].column_schema(agg["col"].split(".")[-1]))
+        agg_sources.append((agg, _relation_getter(values, pos), key))
+    return group_sources, agg_sources
+
+def sort_result_rows(rows, order_by, limit=None):
+    """ORDER BY sobre filas ya calculadas (GROUP BY), por nombre de columna del resultado."""
+    if not order_by:
+        return rows
+    return sort_rows(rows, sort_order([operator.methodcaller("get", item["col"]) for item in order_by], order_by), limit)
+
+
+# ==========================
+# OPERADORES DEL PIPELINE (modelo Volcano)
+# ==========================
+# Un SELECT es una cadena de operadores que piden filas al anterior:
+# scan (iter_live_row_ids o un índice) -> filtro (filtered_rows, join_where)
+# -> join -> agregación -> sort -> limit -> proyección. Las filas viajan
+# como ids (o tuplas de ids en un JOIN) y solo la proyección las convierte en
+# diccionarios, una a la vez, mientras se escribe la respuesta. Solo
+# materializan su entrada los operadores que lo necesitan: la tabla hash de
+# un JOIN, los grupos de una agregación y el sort.
+
+def project_rows(table_data, rows, column_names):
+    """
+    Proyección: cada id de fila como diccionario con las columnas pedidas.
+    Con `rows` None se recorren todas las filas vivas; sin filas borradas las
+    columnas se leen en paralelo, sin indexar fila por fila.
+    """
+    if rows is None and not table_data.dead_count:
+        columns = [
+            table_data.data[name] if name in table_data.data else itertools.repeat(None, table_data.row_count)
+            for name in column_names
+        ]
+        for values in zip(*columns):
+            yield dict(zip(column_names, values))
+        return
+    columns = [(name, table_data.data.get(name)) for name in column_names]
+    for i in (table_data.iter_live_row_ids() if rows is None else rows):
+        yield {name: values[i] if values is not None else None for name, values in columns}
+
+def join_projection(relations, columns, column_refs, aggregates):
+    """
+    Origen de cada columna del resultado de un JOIN: (nombre, valores,
+    posición de la tabla) y, para los agregados sin GROUP BY, (alias, función,
+    valores, posición). `*` son todas las columnas de todas las tablas (las
+    de la derecha pisan a las de la izquierda).
+    """
+    sources = []
+    for col, ref in zip(columns, column_refs):
+        if ref == "*":
+            for pos, (_, _, data) in enumerate(relations):
+                sources.extend((name, values, pos) for name, values in data.data.items())
+        else:
+            sources.append((col,) + join_column(relations, ref))
+    agg_sources = []
+    for agg in aggregates:
+        alias = agg["alias"] or f"{agg['func'].lower()}_{agg['col']}"
+        agg_sources.append((alias, agg["func"]) + (join_column(relations, agg["col"]) if agg["func"] == "SUM" else (None, None)))
+    return sources, agg_sources
+
+def project_join_rows(rows, sources, agg_sources):
+    """Proyección de las filas combinadas de un JOIN; los agregados sin GROUP BY son por fila (SUM del valor, COUNT 1)."""
+    for row in rows:
+        result_row = {}
+        for col, values, pos in sources:
+            result_row[col] = values[row[pos]] if values is not None and row[pos] is not None else None
+        for alias, func, values, pos in agg_sources:
+            if func == "SUM":
+                result_row[alias] = numeric_value((values[row[pos]] if values is not None and row[pos] is not None else None) or 0)
+            elif func == "COUNT":
+                result_row[alias] = 1
+        yield result_row
+
+def limit_rows(rows, limit=None, offset=0):
+    """LIMIT/OFFSET: deja de pedir filas al operador anterior en cuanto junta las suyas."""
+    if limit is None and not offset:
+        return rows
+    return itertools.islice(rows, offset, None if limit is None else offset + limit)
+
+def sort_limit(info):
+    """Filas que necesita un LIMIT con su OFFSET: tope del top-N del sort (None sin LIMIT)."""
+    return None if info["limit"] is None else info["limit"] + (info["offset"] or 0)
+
 
 # ==========================
 # CACHE DE RESULTADOS DE CONSULTAS
 # ==========================
-query_cache = {}
+class QueryCache(dict):
+    """Resultados de SELECT por texto de la consulta; toda escritura la vacía y avanza `generation`."""
+    generation = 0
+
+    def clear(self):
+        self.generation += 1
+        super().clear()
+
+query_cache = QueryCache()
+# Un resultado se guarda en caché solo si no supera estas filas: uno mayor se
+# transmite sin retenerlo, así la memoria no crece con el tamaño del resultado
+QUERY_CACHE_MAX_ROWS = 10000
+
+def cached_rows(query, columns, rows):
+    """
+    Deja pasar las filas del resultado y, si son pocas, las guarda en caché al
+    terminar; no si mientras tanto una escritura vació la caché (el resultado
+    ya no es el vigente).
+    """
+    generation = query_cache.generation
+    def stream():
+        kept = []
+        for row in rows:
+            if kept is not None:
+                kept.append(row)
+                if len(kept) > QUERY_CACHE_MAX_ROWS:
+                    kept = None
+            yield row
+        if kept is not None and query_cache.generation == generation:
+            query_cache[query] = {"columns": columns, "rows": kept}
+    return stream()
 
 # ==========================
 # CICLO DE VIDA DE UNA CONSULTA SQL
@@ -111,12 +3026,133 @@ query_cache = {}
 
 def parser(query):
     """Etapa 1: Parser - Analiza y valida la sintaxis SQL."""
+    if re.match(r"\s*drop index \w+ on ", query, re.IGNORECASE):
+        # sqlglot no acepta la forma de MySQL (DROP INDEX nombre ON tabla); la resuelve el executor
+        return sqlglot.exp.Command(this="DROP", expression=sqlglot.exp.Literal.string(query.strip()[5:]))
     parsed = sqlglot.parse(query)
     print(parsed[0].dump())
     if not parsed or len(parsed) == 0:
         raise ValueError("Consulta SQL vacía o inválida")
     return parsed[0]
 
+SQLGLOT_COMPARISONS = {"eq": "=", "neq": "!=", "lt": "<", "gt": ">", "lte": "<=", "gte": ">="}
+# Operador equivalente al invertir los lados (5 < col  ->  col > 5)
+FLIPPED_COMPARISONS = {"=": "=", "!=": "!=", "<": ">", ">": "<", "<=": ">=", ">=": "<="}
+
+def _literal_text(expr):
+    if isinstance(expr, sqlglot.exp.Neg) and isinstance(expr.this, sqlglot.exp.Literal):
+        return "-" + expr.this.this
+    if isinstance(expr, sqlglot.exp.Literal):
+        return expr.this
+    if isinstance(expr, sqlglot.exp.Null):
+        return None
+    raise ValueError('Solo se soportan comparaciones WHERE columna op valor')
+
+def simple_comparison(expr):
+    """Convierte `columna op literal` (o `literal op columna`) del AST en {"col", "op", "value"}."""
+    op = SQLGLOT_COMPARISONS.get(expr.key)
+    if op is None:
+        raise ValueError('Solo se soportan comparaciones WHERE columna op valor')
+    left, right = expr.this, expr.expression
+    if isinstance(right, sqlglot.exp.Column):
+        left, right, op = right, left, FLIPPED_COMPARISONS[op]
+    if not isinstance(left, sqlglot.exp.Column):
+        raise ValueError('Solo se soportan comparaciones WHERE columna op valor')
+    return {"col": left.name, "ref": str(left), "op": op, "value": _literal_text(right)}
+
+NEGATED_COMPARISONS = {"=": "!=", "!=": "=", "<": ">=", ">": "<=", "<=": ">", ">=": "<"}
+NEGATED_WHERE_OPS = {"in": "not_in", "not_in": "in", "like": "not_like", "not_like": "like",
+                     "is_null": "is_not_null", "is_not_null": "is_null"}
+WHERE_ERROR = 'Solo se soportan condiciones WHERE con comparaciones, IN, BETWEEN, IS NULL y LIKE unidas con AND/OR/NOT'
+
+def _where_column(expr):
+    if not isinstance(expr, sqlglot.exp.Column):
+        raise ValueError(WHERE_ERROR)
+    return {"col": expr.name, "ref": str(expr)}
+
+def where_condition(expr, negate=False):
+    """
+    Árbol de la condición WHERE del AST: {"op": "and"/"or", "args"} o una hoja
+    {"col", "ref", "op", ...}. Los NOT se empujan hasta las hojas (De Morgan)
+    y BETWEEN se escribe como dos comparaciones, así cada hoja es un solo
+    predicado y las comparaciones pueden usar índices y zone maps.
+    """
+    if isinstance(expr, sqlglot.exp.Paren):
+        return where_condition(expr.this, negate)
+    if isinstance(expr, sqlglot.exp.Not):
+        return where_condition(expr.this, not negate)
+    if isinstance(expr, (sqlglot.exp.And, sqlglot.exp.Or)):
+        op = "and" if isinstance(expr, sqlglot.exp.And) != negate else "or"
+        return {"op": op, "args": [where_condition(part, negate) for part in expr.flatten()]}
+    if isinstance(expr, sqlglot.exp.Between):
+        low = dict(_where_column(expr.this), op=">=", value=_literal_text(expr.args["low"]))
+        high = dict(_where_column(expr.this), op="<=", value=_literal_text(expr.args["high"]))
+        if negate:
+            return {"op": "or", "args": [dict(low, op="<"), dict(high, op=">")]}
+        return {"op": "and", "args": [low, high]}
+    if isinstance(expr, sqlglot.exp.In):
+        if expr.args.get("query") or not expr.expressions:
+            raise ValueError('Solo se soporta IN con una lista de valores')
+        leaf = dict(_where_column(expr.this), op="in", values=[_literal_text(value) for value in expr.expressions])
+    elif isinstance(expr, sqlglot.exp.Is):
+        if not isinstance(expr.expression, sqlglot.exp.Null):
+            raise ValueError(WHERE_ERROR)
+        leaf = dict(_where_column(expr.this), op="is_null")
+    elif isinstance(expr, (sqlglot.exp.Like, sqlglot.exp.ILike)):
+        leaf = dict(_where_column(expr.this), op="like", value=_literal_text(expr.expression),
+                    ignore_case=isinstance(expr, sqlglot.exp.ILike))
+    else:
+        leaf = simple_comparison(expr)
+        if negate:
+            leaf["op"] = NEGATED_COMPARISONS[leaf["op"]]
+        return leaf
+    if negate:
+        leaf["op"] = NEGATED_WHERE_OPS[leaf["op"]]
+    return leaf
+
+def where_leaves(where):
+    """Hojas (condiciones sobre una columna) del árbol del WHERE."""
+    if where["op"] in ("and", "or"):
+        for arg in where["args"]:
+            yield from where_leaves(arg)
+    else:
+        yield where
+
+def aggregate_spec(expr, alias=None):
+    """Agregado del AST: {"func", "col", "distinct", "alias"}."""
+    arg = expr.this
+    distinct = isinstance(arg, sqlglot.exp.Distinct)
+    if distinct:
+        arg = arg.expressions[0]
+    return {"func": expr.key.upper(), "col": str(arg), "distinct": distinct, "alias": alias or None}
+
+def having_conditions(expr, aggregates):
+    """
+    Condiciones del HAVING como {"name", "op", "value"} sobre las columnas del
+    resultado. Un agregado que no está en el SELECT se agrega como oculto.
+    """
+    conditions = []
+    for condition in (expr.flatten() if isinstance(expr, sqlglot.exp.And) else [expr]):
+        op = SQLGLOT_COMPARISONS.get(condition.key)
+        if op is None:
+            raise ValueError('Solo se soportan condiciones HAVING expresión op valor unidas con AND')
+        left, right = condition.this, condition.expression
+        if isinstance(left, (sqlglot.exp.Literal, sqlglot.exp.Neg, sqlglot.exp.Null)):
+            left, right, op = right, left, FLIPPED_COMPARISONS[op]
+        if left.key.upper() in AGGREGATE_FUNCS:
+            spec = aggregate_spec(left)
+            match = next((agg for agg in aggregates if all(agg[k] == spec[k] for k in ("func", "col", "distinct"))), None)
+            if match is None:
+                match = dict(spec, hidden=True)
+                aggregates.append(match)
+            name = aggregate_name(match)
+        elif isinstance(left, sqlglot.exp.Column):
+            name = left.name
+        else:
+            raise ValueError('Solo se soportan condiciones HAVING expresión op valor unidas con AND')
+        conditions.append({"name": name, "op": op, "value": _literal_text(right)})
+    return conditions
+
 def algebrizer(stmt):
     """
     Etapa 2: Algebrizer mejorado.
@@ -128,44 +3164,783 @@ def algebrizer(stmt):
         "columns": [],
         "joins": [],
         "group_by": [],
-        "aggregates": []
+        "aggregates": [],
+        "where": None,
+        "order_by": [],
+        # Expresión de origen de cada columna seleccionada (conserva el alias de tabla)
+        "column_refs": [],
+        "table_alias": None,
+        "having": [],
+        "limit": None,
+        "offset": 0
     }
     # Tablas principales
     if hasattr(stmt, "args") and "from" in stmt.args and stmt.args["from"]:
         main_table = stmt.args["from"].args["this"]
         info["tables"].append(str(main_table))
+        info["table_alias"] = main_table.alias_or_name
     # Columnas seleccionadas y agregaciones
     if hasattr(stmt, "args") and "expressions" in stmt.args and stmt.args["expressions"]:
         for expr in stmt.args["expressions"]:
-            if expr.key.upper() in ("SUM", "COUNT"):
-                info["aggregates"].append({
-                    "func": expr.key.upper(),
-                    "col": str(expr.args["this"]),
-                    "alias": getattr(expr, "alias", None)
-                })
+            target = expr.this if isinstance(expr, sqlglot.exp.Alias) else expr
+            if target.key.upper() in AGGREGATE_FUNCS:
+                info["aggregates"].append(aggregate_spec(target, expr.alias if target is not expr else None))
             else:
                 info["columns"].append(getattr(expr, "alias", None) or getattr(expr, "name", None) or str(expr))
+                info["column_refs"].append(str(expr.this) if isinstance(expr, sqlglot.exp.Alias) else str(expr))
     # Joins
     if hasattr(stmt, "args") and "joins" in stmt.args and stmt.args["joins"]:
         for join in stmt.args["joins"]:
             join_table = join.args["this"]
-            on_expr = join.args["on"]
+            kind = (join.args.get("side") or join.args.get("kind") or "INNER").upper()
+            if kind not in JOIN_KINDS:
+                raise ValueError(f'Tipo de JOIN no soportado: {kind}')
+            # ON a.x = b.x AND a.y = b.y: una lista de pares de columnas
+            on = []
+            on_expr = join.args.get("on")
+            for condition in (on_expr.flatten() if isinstance(on_expr, sqlglot.exp.And) else [on_expr] if on_expr else []):
+                if not (isinstance(condition, sqlglot.exp.EQ) and isinstance(condition.this, sqlglot.exp.Column)
+                        and isinstance(condition.expression, sqlglot.exp.Column)):
+                    raise ValueError('Solo se soportan JOIN con igualdades entre columnas (ON a.x = b.y AND ...)')
+                on.append((str(condition.this), str(condition.expression)))
+            if not on and kind != "CROSS":
+                raise ValueError('El JOIN necesita una condición ON')
             info["joins"].append({
                 "table": str(join_table),
-                "on_left": str(on_expr.args["this"]),
-                "on_right": str(on_expr.args["expression"])
+                "alias": join_table.alias_or_name,
+                "kind": kind,
+                "on": on
+            })
+    # Where (árbol de condiciones, ver where_condition)
+    if info["type"] in ("SELECT", "UPDATE", "DELETE") and stmt.args.get("where"):
+        info["where"] = where_condition(stmt.args["where"].this)
+    # Order by
+    if info["type"] == "SELECT" and stmt.args.get("order"):
+        for ordered in stmt.args["order"].expressions:
+            if not isinstance(ordered.this, sqlglot.exp.Column):
+                raise ValueError('Solo se soporta ORDER BY por columnas')
+            info["order_by"].append({
+                "col": ordered.this.name,
+                "ref": str(ordered.this),
+                "desc": bool(ordered.args.get("desc")),
+                "nulls_first": bool(ordered.args.get("nulls_first"))
             })
     # Group by
     if hasattr(stmt, "args") and "group" in stmt.args and stmt.args["group"]:
         for gexpr in stmt.args["group"].expressions:
             info["group_by"].append(str(gexpr))
+    # Having (comparaciones de agregados, alias o columnas agrupadas contra un valor)
+    if info["type"] == "SELECT" and stmt.args.get("having"):
+        info["having"] = having_conditions(stmt.args["having"].this, info["aggregates"])
+    # Limit / offset (enteros no negativos)
+    if info["type"] == "SELECT":
+        for key in ("limit", "offset"):
+            if stmt.args.get(key):
+                value = stmt.args[key].expression
+                if not (isinstance(value, sqlglot.exp.Literal) and value.is_int):
+                    raise ValueError(f'{key.upper()} debe ser un entero no negativo')
+                info[key] = int(value.this)
     return info
 
-def optimizer(stmt_type, query):
-    """Etapa 3: Optimizer/Planner - Usa caché para SELECT, plan simple para otros."""
+def where_literal(table_data, where):
+    """Literal del WHERE convertido al tipo de su columna."""
+    if where["value"] is None:
+        return None
+    return parse_literal(table_data.column_schema(where["col"]), where["value"])
+
+def like_pattern(pattern, ignore_case=False):
+    """Expresión regular equivalente a un patrón LIKE (% cualquier texto, _ un carácter)."""
+    regex = "".join(".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in pattern)
+    return re.compile(regex, re.DOTALL | (re.IGNORECASE if ignore_case else 0))
+
+def where_predicate(cond, col):
+    """
+    Compila una hoja del WHERE en una función valor -> bool para la columna
+    con esquema `col`: los literales se convierten una sola vez al tipo de la
+    columna y, con collation, se comparan las claves. NULL solo cumple
+    IS NULL: las demás hojas, negadas o no, son desconocidas para NULL (como
+    en make_predicate).
+    """
+    op = cond["op"]
+    key = collation_key_fn(col)
+    if op in ("is_null", "is_not_null"):
+        null_result = op == "is_null"
+        return lambda v: (v is None) == null_result
+    if op in ("like", "not_like"):
+        if cond["value"] is None:
+            return lambda v: False
+        pattern = like_pattern(key(cond["value"]) if key else cond["value"], cond.get("ignore_case"))
+        match = pattern.fullmatch
+        if key is None:
+            matches = lambda v: match(v if isinstance(v, str) else str(v)) is not None
+        else:
+            matches = lambda v: match(key(v if isinstance(v, str) else str(v))) is not None
+        if op == "like":
+            return lambda v: v is not None and matches(v)
+        return lambda v: v is not None and not matches(v)
+    if op in ("in", "not_in"):
+        literals = [parse_literal(col, value) for value in cond["values"] if value is not None]
+        if all(index_usable(literal) for literal in literals):
+            allowed = {key(literal) if key else literal for literal in literals}
+            contains = (lambda v: v in allowed) if key is None else (lambda v: key(v) in allowed)
+        else:
+            # Texto numérico contra una columna de texto: misma semántica que `=`
+            options = [where_predicate({"op": "=", "value": value}, col) for value in cond["values"] if value is not None]
+            contains = lambda v: any(option(v) for option in options)
+        if op == "in":
+            return lambda v: v is not None and contains(v)
+        if None in cond["values"]:
+            # `v NOT IN (..., NULL)` nunca es verdadero: a lo sumo desconocido
+            return lambda v: False
+        return lambda v: v is not None and not contains(v)
+    return comparison_predicate(col, op, parse_literal(col, cond["value"]) if cond["value"] is not None else None)
+
+def comparison_predicate(col, op, literal):
+    """`valor op literal` (literal ya convertido) con la collation de la columna."""
+    key = collation_key_fn(col)
+    if key is None:
+        return make_predicate(op, literal)
+    compare = make_predicate(op, key(literal) if literal is not None else None)
+    return lambda v: compare(key(v) if v is not None else None)
+
+def compile_where(where, leaf):
+    """
+    Compila el árbol del WHERE en un único predicado sobre filas; `leaf`
+    compila cada hoja. Se hace una vez por consulta, antes del recorrido.
+    """
+    if where["op"] not in ("and", "or"):
+        return leaf(where)
+    parts = [compile_where(arg, leaf) for arg in where["args"]]
+    if len(parts) == 2:
+        first, second = parts
+        if where["op"] == "and":
+            return lambda row: first(row) and second(row)
+        return lambda row: first(row) or second(row)
+    if where["op"] == "and":
+        return lambda row: all(part(row) for part in parts)
+    return lambda row: any(part(row) for part in parts)
+
+def table_row_predicate(table_data, cond):
+    """Hoja del WHERE sobre ids de fila; en columnas con diccionario se evalúa una vez por código."""
+    predicate = where_predicate(cond, table_data.column_schema(cond["col"]))
+    values = table_data.data[cond["col"]]
+    if isinstance(values, DictColumn):
+        codes = values.codes
+        wanted = values.matching_codes(predicate)
+        return lambda i: codes[i] in wanted
+    return lambda i: predicate(values[i])
+
+def where_rows(table_data, where):
+    """Ids de las filas vivas que cumplen el WHERE, como lista (UPDATE, DELETE, COUNT)."""
+    rows = filtered_rows(table_data, where)
+    return rows if isinstance(rows, list) else list(rows)
+
+def filtered_rows(table_data, where):
+    """
+    Operador de filtro: ids de las filas vivas que cumplen el WHERE. Si una
+    comparación (sola o en un AND) se resuelve con un índice, sus filas son
+    las candidatas y el resto de la condición se evalúa sobre ellas; si no,
+    se filtra por lotes (ver filtered_batches).
+    """
+    rows = _index_filter(table_data, where)
+    if rows is not None:
+        return rows
+    return itertools.chain.from_iterable(
+        range(start, end) if sel is None else sel for start, end, sel in filtered_batches(table_data, where)
+    )
+
+def _index_filter(table_data, where):
+    """Filas del WHERE si una de sus comparaciones (sola o en un AND) se resuelve con un índice; si no, None."""
+    conditions = where["args"] if where["op"] == "and" else [where]
+    for cond in conditions:
+        if cond["op"] in COMPARISON_OPS:
+            candidates = table_data.index_rows(cond["col"], cond["op"], where_literal(table_data, cond))
+            if candidates is not None:
+                break
+    else:
+        return None
+    if table_data.dead_count:
+        candidates = [i for i in candidates if not table_data.is_deleted(i)]
+    rest = [arg for arg in conditions if arg is not cond]
+    if not rest:
+        return candidates
+    predicate = compile_where(rest[0] if len(rest) == 1 else {"op": "and", "args": rest},
+                              lambda cond: table_row_predicate(table_data, cond))
+    return (i for i in candidates if predicate(i))
+
+
+# ==========================
+# EJECUCIÓN POR LOTES (vectorizada)
+# ==========================
+# Los operadores de una tabla intercambian lotes en vez de filas sueltas: un
+# lote es un grupo de filas [inicio, fin) (ROW_GROUP_SIZE, el mismo tamaño de
+# los zone maps) y un vector de selección con los ids que siguen en juego
+# tras los borrados y los filtros (None: todo el rango). Los filtros se
+# evalúan sobre la columna entera del lote con map/compress y los agregados
+# con sum/min/max sobre la lista de valores: el recorrido corre en C, sin
+# una llamada de Python por fila.
+
+# `valor op literal` sobre los valores de un lote (con la semántica de make_predicate)
+BATCH_COMPARISONS = {
+    "=": lambda ids, values, literal: [i for i, v in zip(ids, values) if v is not None and v == literal],
+    "!=": lambda ids, values, literal: [i for i, v in zip(ids, values) if v is not None and v != literal],
+    "<": lambda ids, values, literal: [i for i, v in zip(ids, values) if v is not None and v < literal],
+    ">": lambda ids, values, literal: [i for i, v in zip(ids, values) if v is not None and v > literal],
+    "<=": lambda ids, values, literal: [i for i, v in zip(ids, values) if v is not None and v <= literal],
+    ">=": lambda ids, values, literal: [i for i, v in zip(ids, values) if v is not None and v >= literal]
+}
+
+def scan_batches(table_data):
+    """Operador de scan por lotes; en un grupo con filas borradas la selección son las vivas."""
+    row_count = table_data.row_count
+    for start in range(0, row_count, ROW_GROUP_SIZE):
+        end = min(start + ROW_GROUP_SIZE, row_count)
+        if table_data.has_deleted(start, end):
+            sel = table_data.drop_deleted(range(start, end))
+            if sel:
+                yield start, end, sel
+        else:
+            yield start, end, None
+
+def batch_reader(values):
+    """Lector de una columna por lotes: (inicio, fin, selección) -> lista de valores."""
+    if isinstance(values, DictColumn):
+        codes, lookup = values.codes, values.dictionary.__getitem__
+        return lambda start, end, sel: list(map(lookup, codes[start:end] if sel is None else map(codes.__getitem__, sel)))
+    return lambda start, end, sel: values[start:end] if sel is None else list(map(values.__getitem__, sel))
+
+def code_kernel(values, predicate):
+    """Kernel de una columna con diccionario: el predicado se evalúa una vez por valor distinto y el lote compara códigos."""
+    wanted = values.matching_codes(predicate)
+    test = wanted.__contains__
+    codes = values.codes
+    def kernel(start, end, sel):
+        if not wanted:
+            return []
+        if sel is None:
+            return list(itertools.compress(range(start, end), map(test, codes[start:end])))
+        return list(itertools.compress(sel, map(test, map(codes.__getitem__, sel))))
+    return kernel
+
+def comparison_kernel(table_data, name, op, literal):
+    """
+    Kernel de `columna op literal` sobre un lote, o None si no se puede
+    vectorizar (collation sin diccionario, literal NULL o texto numérico).
+    El literal ya viene convertido al tipo de la columna y la comparación es
+    una sola comprensión sobre los valores del lote; el zone map del grupo
+    descarta el lote entero.
+    """
+    values = table_data.data[name]
+    col = table_data.column_schema(name)
+    if isinstance(values, DictColumn):
+        return code_kernel(values, comparison_predicate(col, op, literal))
+    if literal is None or collation_key_fn(col) is not None or not index_usable(literal):
+        return None
+    compare = BATCH_COMPARISONS[op]
+    read = batch_reader(values)
+    zones = table_data.zone_maps(name)
+    def kernel(start, end, sel):
+        if not zone_may_match(zones[start // ROW_GROUP_SIZE], op, literal):
+            return []
+        return compare(range(start, end) if sel is None else sel, read(start, end, sel), literal)
+    return kernel
+
+def leaf_kernel(table_data, cond):
+    """Kernel de una hoja del WHERE sobre un lote, o None si se evalúa fila por fila."""
+    name, op = cond["col"], cond["op"]
+    if op in COMPARISON_OPS:
+        return comparison_kernel(table_data, name, op, where_literal(table_data, cond))
+    values = table_data.data[name]
+    col = table_data.column_schema(name)
+    if isinstance(values, DictColumn):
+        return code_kernel(values, where_predicate(cond, col))
+    read = batch_reader(values)
+    if op in ("is_null", "is_not_null"):
+        test = operator.is_ if op == "is_null" else operator.is_not
+        return lambda start, end, sel: list(itertools.compress(
+            range(start, end) if sel is None else sel, map(test, read(start, end, sel), itertools.repeat(None))))
+    if op == "in" and collation_key_fn(col) is None:
+        literals = [parse_literal(col, value) for value in cond["values"] if value is not None]
+        if all(index_usable(literal) for literal in literals):
+            test = set(literals).__contains__
+            return lambda start, end, sel: list(itertools.compress(
+                range(start, end) if sel is None else sel, map(test, read(start, end, sel))))
+    return None
+
+def batch_filter(table_data, where):
+    """
+    Compila el WHERE en un filtro de lotes: (inicio, fin, selección) -> ids
+    que lo cumplen. Las hojas con kernel se evalúan sobre el lote entero y el
+    resto (LIKE, collations sin diccionario, texto numérico) fila por fila
+    sobre la selección. Un AND pasa a cada hoja la selección que dejó la
+    anterior; un OR une las de sus ramas.
+    """
+    if where["op"] in ("and", "or"):
+        parts = [batch_filter(table_data, arg) for arg in where["args"]]
+        if where["op"] == "and":
+            def conjunction(start, end, sel):
+                for part in parts:
+                    sel = part(start, end, sel)
+                    if not sel:
+                        break
+                return sel
+            return conjunction
+        def disjunction(start, end, sel):
+            chosen = set()
+            for part in parts:
+                chosen.update(part(start, end, sel))
+            return sorted(chosen)
+        return disjunction
+    kernel = leaf_kernel(table_data, where)
+    if kernel is not None:
+        return kernel
+    predicate = table_row_predicate(table_data, where)
+    return lambda start, end, sel: list(filter(predicate, range(start, end) if sel is None else sel))
+
+def filtered_batches(table_data, where=None):
+    """
+    Operador de scan y filtro por lotes: (inicio, fin, selección) de cada
+    grupo de filas con alguna fila viva que cumpla el WHERE. Un WHERE que se
+    resuelve con un índice da sus filas en lotes de ROW_GROUP_SIZE. El
+    filtro se compila aquí, antes de pedir el primer lote.
+    """
+    rows = _index_filter(table_data, where) if where is not None else None
+    if rows is not None:
+        rows = iter(rows)
+        chunks = iter(lambda: list(itertools.islice(rows, ROW_GROUP_SIZE)), [])
+        return ((0, 0, chunk) for chunk in chunks)
+    if where is None:
+        return scan_batches(table_data)
+    test = batch_filter(table_data, where)
+    def batches():
+        row_count = table_data.row_count
+        for start in range(0, row_count, ROW_GROUP_SIZE):
+            end = min(start + ROW_GROUP_SIZE, row_count)
+            # Se filtra el grupo entero y después se quitan las borradas, que suelen ser pocas
+            sel = test(start, end, None)
+            if sel and table_data.has_deleted(start, end):
+                sel = table_data.drop_deleted(sel)
+            if sel:
+                yield start, end, sel
+    return batches()
+
+def join_where(relations, joined, where):
+    """Filtro sobre las filas combinadas de un JOIN; una tabla sin pareja (JOIN externo) aporta NULL."""
+    def leaf(cond):
+        values, pos = join_column(relations, cond["ref"])
+        if values is None:
+            raise ValueError(f'Columna {cond["ref"]} no existe en las tablas del JOIN')
+        predicate = where_predicate(cond, relations[pos][2].column_schema(cond["col"]))
+        null_result = predicate(None)
+        return lambda row: predicate(values[row[pos]]) if row[pos] is not None else null_result
+    predicate = compile_where(where, leaf)
+    return (row for row in joined if predicate(row))
+
+def _ordered_index(table_data, name):
+    index = table_data.index_on(name)
+    if isinstance(index, OrderedIndex) and index.keys is not None:
+        return index
+    return None
+
+class _Descending:
+    """Valor con el orden invertido, para las columnas DESC de un ORDER BY con sentidos mezclados."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+def _descending(value):
+    """Valor DESC de un ORDER BY mezclado: los números (y rangos de diccionario) se niegan; el resto se envuelve."""
+    return -value if isinstance(value, (int, float, Decimal)) else _Descending(value)
+
+def _null_ranked(get, null_rank):
+    """Clave de una columna: los valores tienen rango 1 y el NULL, `null_rank` (0 antes, 2 después)."""
+    def key(row):
+        v = get(row)
+        return (null_rank, None) if v is None else (1, v)
+    return key
+
+def sort_order(getters, order_by):
+    """
+    Orden de un ORDER BY. `getters` da el valor comparable de cada columna de
+    una fila; los NULL van donde diga NULLS FIRST/LAST (por defecto primero
+    en ASC y al final en DESC). Devuelve (pasadas, clave, reverse):
+    - pasadas: (clave, reverse) por columna; ordenar de la última a la
+      primera con sorts estables da el orden completo, y cada sort compara
+      claves simples.
+    - clave y reverse: clave compuesta de la fila, para mezclar tramos ya
+      ordenados. Si las columnas van en distinto sentido, los valores DESC se
+      invierten con _descending.
+    """
+    passes = []
+    for get, item in zip(getters, order_by):
+        nulls_first = item.get("nulls_first", not item["desc"])
+        null_rank = (2 if nulls_first else 0) if item["desc"] else (0 if nulls_first else 2)
+        passes.append((_null_ranked(get, null_rank), item["desc"]))
+    reverse = all(item["desc"] for item in order_by)
+    if len(passes) == 1:
+        return passes, passes[0][0], reverse
+    parts = []
+    for get, item in zip(getters, order_by):
+        nulls_first = item.get("nulls_first", not item["desc"])
+        null_rank = (2 if nulls_first else 0) if reverse else (0 if nulls_first else 2)
+        parts.append((get, null_rank, _descending if item["desc"] and not reverse else None))
+    def key(row):
+        k = []
+        for get, null_rank, wrap in parts:
+            v = get(row)
+            if v is None:
+                k += (null_rank, None)
+            else:
+                k += (1, v if wrap is None else wrap(v))
+        return tuple(k)
+    return passes, key, reverse
+
+def _sort_passes(rows, passes):
+    """Ordena `rows` en su lugar con una pasada estable por columna, de la última a la primera."""
+    for key, reverse in reversed(passes):
+        rows.sort(key=key, reverse=reverse)
+
+def _order_getter(data, name):
+    """
+    Valor comparable de una columna por id de fila. En columnas con
+    diccionario es el rango del código en el orden de los valores (se
+    comparan enteros, no textos); con collation, la clave de la collation.
+    """
+    values = data.data[name]
+    key = collation_key_fn(data.column_schema(name))
+    if isinstance(values, DictColumn):
+        dictionary, codes = values.dictionary, values.codes
+        sort_key = (lambda code: key(dictionary[code])) if key is not None else dictionary.__getitem__
+        ranks = [None] * len(dictionary)
+        rank, previous = -1, None
+        for code in sorted((code for code, v in enumerate(dictionary) if v is not None), key=sort_key):
+            if rank < 0 or sort_key(code) != previous:
+                rank, previous = rank + 1, sort_key(code)
+            ranks[code] = rank
+        return lambda i: ranks[codes[i]]
+    if key is not None:
+        return column_keys(values, lambda v: v if v is None else key(v)).__getitem__
+    return values.__getitem__
+
+def _runs(rows, size, pending):
+    """Tramos de `size` filas de la entrada; `pending` trae el primero ya leído."""
+    while pending:
+        yield pending.pop()
+    while True:
+        run = list(itertools.islice(rows, size))
+        if not run:
+            return
+        yield run
+        del run
+
+def _read_run(spill):
+    """Filas de un tramo escrito por external_sort; el archivo temporal se cierra (y borra) al terminar."""
+    with spill:
+        while True:
+            try:
+                block = pickle.load(spill)
+            except EOFError:
+                return
+            yield from block
+
+def external_sort(runs, order):
+    """
+    External merge sort: cada tramo se ordena en memoria y se escribe a un
+    archivo temporal en bloques; el resultado es la mezcla (heapq.merge) de
+    los tramos, que se leen de a un bloque. En memoria queda un tramo a la vez.
+    """
+    passes, key, reverse = order
+    spills = []
+    for run in runs:
+        _sort_passes(run, passes)
+        spill = tempfile.TemporaryFile()
+        for start in range(0, len(run), SORT_SPILL_BLOCK):
+            pickle.dump(run[start:start + SORT_SPILL_BLOCK], spill, pickle.HIGHEST_PROTOCOL)
+        spill.seek(0)
+        spills.append(spill)
+        del run
+    return heapq.merge(*(_read_run(spill) for spill in spills), key=key, reverse=reverse)
+
+def sort_rows(rows, order, limit=None):
+    """
+    Operador de sort (estable) con un orden de sort_order. Con LIMIT (ya
+    sumado el OFFSET) es un top-N: guarda solo las `limit` primeras filas de
+    lo leído y las reordena con cada tramo nuevo, sin retener la entrada. Sin
+    LIMIT ordena en memoria si la entrada cabe en SORT_MEMORY_ROWS y, si no,
+    con external_sort.
+    """
+    passes = order[0]
+    rows = iter(rows)
+    if limit is not None:
+        top = []
+        step = max(limit, SORT_SPILL_BLOCK)
+        while True:
+            chunk = list(itertools.islice(rows, step))
+            if not chunk:
+                return top
+            top += chunk
+            _sort_passes(top, passes)
+            del top[limit:]
+    run = list(itertools.islice(rows, SORT_MEMORY_ROWS))
+    extra = next(rows, None) if len(run) == SORT_MEMORY_ROWS else None
+    if extra is None:
+        _sort_passes(run, passes)
+        return run
+    run.append(extra)
+    pending = [run]
+    del run
+    return external_sort(_runs(rows, SORT_MEMORY_ROWS, pending), order)
+
+def ordered_rows(table_data, order_by, row_ids=None, limit=None):
+    """
+    Filas (todas las vivas o `row_ids`) en el orden de ORDER BY. Sin filtro,
+    por una sola columna con índice ordenado y con los NULL en su lugar por
+    defecto, se recorre el índice; si no, se ordena con sort_rows (top-N si
+    hay LIMIT).
+    """
+    if row_ids is None and len(order_by) == 1 and order_by[0].get("nulls_first", not order_by[0]["desc"]) != order_by[0]["desc"]:
+        index = _ordered_index(table_data, order_by[0]["col"])
+        if index is not None:
+            ordered = index.ordered_row_ids(order_by[0]["desc"])
+            if table_data.dead_count:
+                ordered = (i for i in ordered if not table_data.is_deleted(i))
+            return ordered
+    order = sort_order([_order_getter(table_data, item["col"]) for item in order_by], order_by)
+    return sort_rows(table_data.iter_live_row_ids() if row_ids is None else row_ids, order, limit)
+
+def join_ordered_rows(relations, joined, order_by, limit=None):
+    """ORDER BY sobre las filas combinadas de un JOIN; una tabla sin pareja aporta NULL."""
+    getters = []
+    for item in order_by:
+        values, pos = join_column(relations, item["ref"])
+        if values is None:
+            raise ValueError(f'Columna {item["ref"]} no existe en las tablas del JOIN')
+        get = _order_getter(relations[pos][2], item["col"])
+        getters.append(lambda row, get=get, pos=pos: None if row[pos] is None else get(row[pos]))
+    return sort_rows(joined, sort_order(getters, order_by), limit)
+
+def table_aggregates(table_data, aggregates, where=None):
+    """
+    Agregados sin GROUP BY de una tabla sobre las filas vivas que cumplen el
+    WHERE: una fila. Sin WHERE, COUNT(*) sale del conteo de filas y MIN/MAX,
+    si la columna tiene índice ordenado, de los extremos de su lista de
+    valores; el resto se calcula en una pasada por lotes.
+    """
+    result_row = {}
+    pending = []
+    for agg in aggregates:
+        name = aggregate_name(agg)
+        if agg["func"] == "COUNT" and agg["col"] == "*" and where is None:
+            result_row[name] = table_data.live_count
+            continue
+        index = _ordered_index(table_data, agg["col"]) if where is None and agg["func"] in ("MIN", "MAX") else None
+        if index is not None and index.key is None:
+            result_row[name] = index.extreme_value(agg["func"] == "MAX", table_data.is_deleted if table_data.dead_count else None)
+            continue
+        result_row[name] = None
+        pending.append(agg)
+    if pending:
+        _, agg_sources = table_group_sources(table_data, [], pending)
+        result_row.update(grouped_batches(filtered_batches(table_data, where), [], agg_sources)[0])
+    return result_row
+
+# Costo relativo por fila de cada estrategia de JOIN
+JOIN_COSTS = {"hash_build": 1.0, "hash_probe": 1.0, "index_probe": 1.2, "merge": 0.5}
+
+def _catalog_column(relations, ref):
+    """Como join_column, pero sobre los esquemas del catálogo: (posición, esquema de la columna)."""
+    parts = ref.split(".")
+    qualifier = parts[-2] if len(parts) > 1 else None
+    for pos in range(len(relations) - 1, -1, -1):
+        alias, table, entry, _ = relations[pos]
+        if entry is None or (qualifier is not None and qualifier not in (alias, table)):
+            continue
+        for col in entry["columns"]:
+            if col["name"] == parts[-1]:
+                return pos, col
+    return None, None
+
+def _column_index(entry, column, kinds=("hash", "btree")):
+    for definition in entry.get("indexes", []):
+        if definition["column"] == column and definition.get("kind", "hash") in kinds:
+            return definition
+    return None
+
+def _join_selectivity(left, left_col, right, right_col):
+    """Fracción de pares que cumple `left_col = right_col`: 1 / max(valores distintos de cada lado)."""
+    rows = min(relation[2]["rows"] if relation[2] else 1 for relation in (left, right))
+    def distinct(relation, col):
+        table_stats_ = relation[3]
+        if table_stats_ and col in table_stats_["columns"]:
+            return table_stats_["columns"][col]["distinct"]
+        # Sin ANALYZE se supone que la tabla menor aporta la clave (JOIN por clave foránea)
+        return rows
+    return 1 / max(distinct(left, left_col), distinct(right, right_col), 1)
+
+def order_joins(relations, joins):
+    """
+    Orden de ejecución de una cadena de INNER JOIN: elige de forma voraz el
+    par de tablas unidas por una condición con menos filas estimadas y luego,
+    en cada paso, la tabla conectada que deja el resultado intermedio más
+    chico (las tablas sin condición, como un CROSS JOIN, quedan al final).
+    Devuelve la posición inicial y los pasos con las condiciones ON que
+    cada uno cierra (calificadas con el alias), o None si no se puede
+    reordenar (JOIN externos o columnas que no están en el catálogo).
+    """
+    if any(join["kind"] not in ("INNER", "CROSS") for join in joins) or any(entry is None for _, _, entry, _ in relations):
+        return None
+    # Cada igualdad del ON como (posición, columna, posición, columna)
+    predicates = []
+    for join in joins:
+        for a, b in join["on"]:
+            pos_a, col_a = _catalog_column(relations, a)
+            pos_b, col_b = _catalog_column(relations, b)
+            if col_a is None or col_b is None or pos_a == pos_b:
+                return None
+            predicates.append((pos_a, col_a["name"], pos_b, col_b["name"]))
+    rows = [entry["rows"] for _, _, entry, _ in relations]
+
+    def extend(joined, joined_rows, candidate):
+        """Filas estimadas y condiciones al agregar `candidate` a las tablas `joined`."""
+        estimate = joined_rows * rows[candidate]
+        closing = []
+        for pos_a, col_a, pos_b, col_b in predicates:
+            if pos_a == candidate and pos_b in joined:
+                pos_a, col_a, pos_b, col_b = pos_b, col_b, pos_a, col_a
+            elif not (pos_b == candidate and pos_a in joined):
+                continue
+            estimate *= _join_selectivity(relations[pos_a], col_a, relations[pos_b], col_b)
+            closing.append((f"{relations[pos_a][0]}.{col_a}", f"{relations[pos_b][0]}.{col_b}"))
+        return estimate, closing
+
+    best = None
+    for first in range(len(relations)):
+        for second in range(len(relations)):
+            if first != second:
+                estimate, closing = extend({first}, rows[first], second)
+                # Entre pares iguales se prefiere construir sobre la tabla menor
+                score = (not closing, estimate, rows[first] + rows[second], -rows[first])
+                if best is None or score < best[0]:
+                    best = (score, first)
+    start = best[1]
+    joined, joined_rows, steps = {start}, rows[start], []
+    while len(joined) < len(relations):
+        options = []
+        for candidate in range(len(relations)):
+            if candidate not in joined:
+                estimate, closing = extend(joined, joined_rows, candidate)
+                options.append(((not closing, estimate, rows[candidate]), candidate, estimate, closing))
+        _, candidate, estimate, closing = min(options)
+        steps.append({
+            "alias": relations[candidate][0],
+            "kind": "INNER" if closing else "CROSS",
+            "on": closing,
+            "position": candidate
+        })
+        joined.add(candidate)
+        joined_rows = max(int(estimate), 1) if estimate else 0
+    return start, steps
+
+def plan_joins(stmt_info, stats):
+    """
+    Plan de los JOIN: orden de ejecución (ver order_joins; con JOIN externos
+    se respeta el orden escrito) y estrategia de cada paso según las filas
+    del catálogo, los valores distintos de ANALYZE y los índices existentes:
+    - hash: construye sobre el lado menor y recorre el otro (siempre posible).
+    - index_nested_loop: una búsqueda en el índice de la columna derecha por
+      cada fila de la izquierda; conviene cuando la izquierda es chica.
+    - merge: recorre a la vez los índices ordenados de las dos tablas (solo
+      en el primer paso, cuando la izquierda es todavía una tabla, y con
+      claves del mismo tipo base y collation; ver merge_serves_join).
+    Los dos últimos solo para INNER/LEFT con una única igualdad.
+    """
+    def table_meta(name, alias):
+        db, table = parse_db_table(name)
+        entry = catalog_entry(db, table) if db and is_valid_name(db) and is_valid_name(table) else None
+        return (alias or table, table, entry, stats.get(name))
+
+    sources = [(stmt_info["tables"][0], stmt_info["table_alias"])] + [(join["table"], join["alias"]) for join in stmt_info["joins"]]
+    all_relations = [table_meta(name, alias) for name, alias in sources]
+    ordered = order_joins(all_relations, stmt_info["joins"])
+    if ordered is None:
+        start = 0
+        steps = [dict(join, position=n) for n, join in enumerate(stmt_info["joins"], 1)]
+    else:
+        start, steps = ordered
+        for step in steps:
+            step["table"] = sources[step["position"]][0]
+    relations = [all_relations[start]]
+    entry = relations[0][2]
+    left_rows = entry["rows"] if entry else 0
+    plans = []
+    for n, join in enumerate(steps):
+        right = [all_relations[join["position"]]]
+        entry = right[0][2]
+        right_rows = entry["rows"] if entry else 0
+        costs = {"hash": min(left_rows, right_rows) * JOIN_COSTS["hash_build"] + max(left_rows, right_rows) * JOIN_COSTS["hash_probe"]}
+        output_rows = left_rows * right_rows if not join["on"] else max(left_rows, right_rows)
+        if join["on"] and entry is not None:
+            output_rows = left_rows * right_rows
+            for a, b in join["on"]:
+                for left_ref, right_ref in ((a, b), (b, a)):
+                    pos, left_col = _catalog_column(relations, left_ref)
+                    _, right_col = _catalog_column(right, right_ref)
+                    if left_col is not None and right_col is not None:
+                        break
+                else:
+                    output_rows = max(left_rows, right_rows)
+                    break
+                # Filas estimadas del resultado: |L|·|R| por la selectividad de cada igualdad
+                output_rows *= _join_selectivity(relations[pos], left_col["name"], right[0], right_col["name"])
+            output_rows = int(output_rows)
+            if len(join["on"]) == 1 and left_col is not None and right_col is not None:
+                if join["kind"] in ("INNER", "LEFT") and index_serves_join(left_col, right_col):
+                    if _column_index(entry, right_col["name"]):
+                        costs["index_nested_loop"] = left_rows * JOIN_COSTS["index_probe"]
+                    left_entry = relations[pos][2]
+                    if (n == 0 and index_serves_join(right_col, left_col) and merge_serves_join(left_col, right_col)
+                            and _column_index(left_entry, left_col["name"], ("btree",))
+                            and _column_index(entry, right_col["name"], ("btree",))):
+                        costs["merge"] = (left_rows + right_rows) * JOIN_COSTS["merge"]
+        strategy = min(costs, key=costs.get)
+        plans.append({
+            "table": join["table"],
+            "alias": join["alias"] or right[0][1],
+            "kind": join["kind"],
+            "on": join["on"],
+            "position": join["position"],
+            "strategy": strategy,
+            "costs": {name: round(cost) for name, cost in costs.items()},
+            "estimated_rows": output_rows
+        })
+        relations.extend(right)
+        left_rows = output_rows
+    return {"start": start, "steps": plans}
+
+def optimizer(stmt_type, query, stmt_info=None):
+    """
+    Etapa 3: Optimizer/Planner - Usa caché para SELECT, plan simple para otros.
+    El plan incluye las estadísticas (ANALYZE) de las tablas involucradas y,
+    si hay JOIN, la estrategia elegida para cada uno (ver plan_joins).
+    """
     if stmt_type == "SELECT" and query in query_cache:
         return {"plan": "cache", "cached_result": query_cache[query]}
-    return {"plan": "execute", "query": query}
+    plan = {"plan": "execute", "query": query}
+    if stmt_type == "SELECT" and stmt_info:
+        tables = stmt_info["tables"] + [join["table"] for join in stmt_info["joins"]]
+        plan["stats"] = {name: table_stats(*parse_db_table(name)) for name in tables}
+        if stmt_info["joins"]:
+            join_plan = plan_joins(stmt_info, plan["stats"])
+            plan["join_start"] = join_plan["start"]
+            plan["joins"] = join_plan["steps"]
+    return plan
 
 def executor(plan, stmt_type, query, data, stmt_info):
     """Etapa 4: Executor - Ejecuta el plan (toda tu lógica real aquí)."""
@@ -175,97 +3950,187 @@ def executor(plan, stmt_type, query, data, stmt_info):
 
     # --- Lógica para SELECT usando stmt_info ---
     if stmt_type == "SELECT":
-        # JOIN simple
+        # JOIN: un paso por tabla en el orden del plan (hash, merge o index nested loop)
         if stmt_info["joins"]:
-            main_table = stmt_info["tables"][0]
-            join = stmt_info["joins"][0]
-            join_table = join["table"]
-            left_col = join["on_left"].split(".")[-1]
-            right_col = join["on_right"].split(".")[-1]
-            db1, t1 = parse_db_table(main_table)
-            db2, t2 = parse_db_table(join_table)
-            rows1 = load_table(db1, t1)["rows"]
-            rows2 = load_table(db2, t2)["rows"]
-            joined = join_tables(rows1, rows2, left_col, right_col)
-
-            # Si hay GROUP BY, agrupa sobre el resultado del JOIN
-            if stmt_info["group_by"]:
-                group_cols = [col for col in stmt_info["group_by"]]
-                result = []
-                groups = {}
-                for row in joined:
-                    key = tuple(row[col.split(".")[-1]] for col in group_cols)
-                    groups.setdefault(key, []).append(row)
-                for key, group_rows in groups.items():
-                    result_row = {col.split(".")[-1]: val for col, val in zip(group_cols, key)}
-                    for agg in stmt_info["aggregates"]:
-                        agg_func = agg["func"]
-                        agg_col = agg["col"].split(".")[-1]
-                        alias = agg["alias"] or f"{agg_func.lower()}_{agg_col}"
-                        if agg_func == "SUM":
-                            agg_value = sum(float(r.get(agg_col, 0)) for r in group_rows)
-                        elif agg_func == "COUNT":
-                            agg_value = len(group_rows)
-                        else:
-                            agg_value = None
-                        result_row[alias] = agg_value
-                    result.append(result_row)
-                    # Inferir columnas a partir de las keys del primer row
+            sources = [(stmt_info["tables"][0], stmt_info["table_alias"])] + [(join["table"], join["alias"]) for join in stmt_info["joins"]]
+            join_plans = plan.get("joins") or [dict(join, position=n, strategy="hash") for n, join in enumerate(stmt_info["joins"], 1)]
+            start = plan.get("join_start", 0)
+            positions = [start]
+            db, table = parse_db_table(sources[start][0])
+            start_data = load_table_snapshot(db, table)
+            if not start_data:
+                raise ValueError(f'Tabla {table} no existe en base {db}')
+            # (alias, tabla, datos) de cada tabla; cada fila combinada es una tupla de ids
+            relations = [(sources[start][1] or table, table, start_data)]
+            joined = [(i,) for i in start_data.live_row_ids()]
+            for join in join_plans:
+                join_db, join_table = parse_db_table(join["table"])
+                join_data = load_table_snapshot(join_db, join_table)
+                if not join_data:
+                    raise ValueError(f'Tabla {join_table} no existe en base {join_db}')
+                alias = join["alias"] or join_table
+                conditions = join_conditions(relations, alias, join_table, join_data, join["on"])
+                # Estrategia elegida por el optimizer; si el índice ya no está, hash join
+                strategy = join["strategy"]
+                if strategy == "index_nested_loop" and join_data.index_on(conditions[0][1]) is not None:
+                    joined = index_nested_loop_join(joined, relations, join_data, conditions[0],
+                                                    join_data.index_on(conditions[0][1]), join["kind"])
+                elif (strategy == "merge" and _ordered_index(start_data, conditions[0][0][1]) is not None
+                        and merge_serves_join(start_data.column_schema(conditions[0][0][1]),
+                                              join_data.column_schema(conditions[0][1]))
+                        and _ordered_index(join_data, conditions[0][1]) is not None):
+                    joined = merge_join(start_data, _ordered_index(start_data, conditions[0][0][1]),
+                                        join_data, _ordered_index(join_data, conditions[0][1]), join["kind"])
+                else:
+                    joined = hash_join(joined, relations, join_data, conditions, join["kind"])
+                relations.append((alias, join_table, join_data))
+                positions.append(join["position"])
+            join_order = [alias for alias, _, _ in relations]
+            if positions != sorted(positions):
+                # Se vuelve al orden escrito: los nombres sin calificar se resuelven igual que sin reordenar
+                order = [positions.index(p) for p in range(len(positions))]
+                relations = [relations[i] for i in order]
+                joined = [tuple(row[i] for i in order) for row in joined]
+            if stmt_info["where"]:
+                joined = join_where(relations, joined, stmt_info["where"])
+
+            # Si hay GROUP BY (o solo agregados), agrega en una pasada sobre el resultado del JOIN
+            if stmt_info["group_by"] or (stmt_info["aggregates"] and not stmt_info["columns"]):
+                group_sources, agg_sources = join_group_sources(relations, stmt_info["group_by"], stmt_info["aggregates"])
+                result = grouped_rows(joined, group_sources, agg_sources)
+                result = sort_result_rows(apply_having(result, stmt_info["aggregates"], stmt_info["having"]),
+                                          stmt_info["order_by"], sort_limit(stmt_info))
+                result = list(limit_rows(result, stmt_info["limit"], stmt_info["offset"]))
                 columns = list(result[0].keys()) if result else []
 
                 return {
                     "source": "executed",
                     "columns": columns,
-                    "rows": result
+                    "rows": result,
+                    "plan": {"order": join_order, "joins": join_plans}
                 }
 
 
             else:
-                # Si no hay GROUP BY, solo selecciona columnas del JOIN
-                result = []
-                for row in joined:
-                    result_row = {}
-                    for col in stmt_info["columns"]:
-                        if "." in col:
-                            _, real_col = col.split(".", 1)
-                        else:
-                            real_col = col
-                        result_row[col] = row.get(real_col)
-                    for agg in stmt_info["aggregates"]:
-                        alias = agg["alias"] or f"{agg['func'].lower()}_{agg['col']}"
-                        if agg["func"] == "SUM":
-                            result_row[alias] = float(row.get(agg["col"], 0))
-                        elif agg["func"] == "COUNT":
-                            result_row[alias] = 1
-                    result.append(result_row)
-
-                # Aquí infieres las columnas
-                columns = list(result[0].keys()) if result else []
+                # Si no hay GROUP BY, proyecta las columnas del JOIN a medida que se escriben
+                sources, agg_sources = join_projection(relations, stmt_info["columns"], stmt_info["column_refs"], stmt_info["aggregates"])
+                columns = list(dict.fromkeys([source[0] for source in sources] + [source[0] for source in agg_sources]))
+                if stmt_info["order_by"]:
+                    joined = join_ordered_rows(relations, joined, stmt_info["order_by"], sort_limit(stmt_info))
+                joined = limit_rows(joined, stmt_info["limit"], stmt_info["offset"])
 
-                # Y las devuelves
                 return {
                     "source": "executed",
                     "columns": columns,
-                    "rows": result
+                    "rows": project_join_rows(joined, sources, agg_sources),
+                    "plan": {"order": join_order, "joins": join_plans}
                 }
 
 
-        # SELECT simple (sin JOIN ni GROUP BY)
+        # SELECT simple (sin JOIN)
         if stmt_info["tables"]:
             db, table = parse_db_table(stmt_info["tables"][0])
-            table_data = load_table(db, table)
+            if (stmt_info["limit"] is not None and stmt_info["limit"] <= QUERY_CACHE_MAX_ROWS and not stmt_info["where"]
+                    and not stmt_info["order_by"] and not stmt_info["group_by"] and not stmt_info["aggregates"]):
+                # Primera página (p. ej. la vista previa de una tabla): sin cargar la tabla si no está en memoria
+                page = read_table_page(db, table, stmt_info["columns"], stmt_info["limit"], stmt_info["offset"] or 0)
+                if page is not None:
+                    column_names, result = page
+                    query_cache[query] = {"columns": column_names, "rows": result}
+                    return {"source": "executed", "columns": column_names, "rows": result}
+            table_data = load_table_snapshot(db, table)
             if not table_data:
                 raise ValueError(f'Tabla {table} no existe en base {db}')
-            if stmt_info["columns"] == ["*"]:
-                # Devuelve todas las columnas
-                result = [row for row in table_data["rows"]]
-                column_names = [col['name'] for col in table_data["columns"]]
-            else:
-                result = [{col: row.get(col) for col in stmt_info["columns"]} for row in table_data["rows"]]
-                column_names = stmt_info["columns"]
-            query_cache[query] = {"columns": column_names, "rows": result}
+            where = stmt_info["where"]
+            order_by = stmt_info["order_by"]
+            for col in ([leaf["col"] for leaf in where_leaves(where)] if where else []) + ([] if stmt_info["group_by"] or stmt_info["aggregates"] else [item["col"] for item in order_by]):
+                if col not in table_data.data:
+                    raise ValueError(f'Columna {col} no existe en la tabla {table}')
+            if stmt_info["group_by"] or (stmt_info["aggregates"] and not stmt_info["columns"]):
+                # GROUP BY (o agregados sin GROUP BY: una sola fila) en una pasada sobre las filas
+                if stmt_info["group_by"]:
+                    group_sources, agg_sources = table_group_sources(table_data, stmt_info["group_by"], stmt_info["aggregates"])
+                    result = grouped_batches(filtered_batches(table_data, where), group_sources, agg_sources)
+                else:
+                    result = [table_aggregates(table_data, stmt_info["aggregates"], where)]
+                result = sort_result_rows(apply_having(result, stmt_info["aggregates"], stmt_info["having"]),
+                                          order_by, sort_limit(stmt_info))
+                result = list(limit_rows(result, stmt_info["limit"], stmt_info["offset"]))
+                column_names = list(result[0]) if result else [
+                    col.split(".")[-1] for col in stmt_info["group_by"]
+                ] + [aggregate_name(agg) for agg in stmt_info["aggregates"] if not agg.get("hidden")]
+                query_cache[query] = {"columns": column_names, "rows": result}
+                return {"source": "executed", "columns": column_names, "rows": result}
+            # scan (o índice) -> filtro -> sort -> limit -> proyección, sin materializar las filas
+            column_names = table_data.column_names if stmt_info["columns"] == ["*"] else stmt_info["columns"]
+            rows = filtered_rows(table_data, where) if where else None
+            if order_by:
+                rows = ordered_rows(table_data, order_by, rows, sort_limit(stmt_info))
+            if rows is None and (stmt_info["limit"] is not None or stmt_info["offset"]):
+                # El OFFSET se resuelve en el scan, que además se detiene al juntar el LIMIT
+                rows = limit_rows(table_data.iter_live_row_ids(stmt_info["offset"] or 0), stmt_info["limit"])
+            elif rows is not None:
+                rows = limit_rows(rows, stmt_info["limit"], stmt_info["offset"])
+            result = cached_rows(query, column_names, project_rows(table_data, rows, column_names))
             return {"source": "executed", "columns": column_names, "rows": result}
     
+    # ANALYZE
+    if query.lower().startswith("analyze"):
+        match = re.match(r"analyze (?:table )?(\w+\.\w+)$", query.rstrip(";").strip(), re.IGNORECASE)
+        if not match:
+            raise ValueError('Sintaxis inválida para ANALYZE. Usa ANALYZE db.tabla')
+        db, table = parse_db_table(match.group(1))
+        if not is_valid_name(db) or not is_valid_name(table):
+            raise ValueError('Nombre de base de datos o tabla inválido')
+        stats = analyze_table(db, table)
+        if stats is None:
+            raise ValueError(f'Tabla {table} no existe en base {db}')
+        return {'message': f'Estadísticas de {table} actualizadas ({stats["rows"]} filas)', 'stats': stats}
+
+    # CREATE INDEX
+    if query.lower().startswith("create index"):
+        match = re.match(r"create index (\w+) on (\w+\.\w+)\s*\(\s*(\w+)\s*\)\s*(?:using (hash|btree))?\s*;?$", query.strip(), re.IGNORECASE)
+        if not match:
+            raise ValueError('Sintaxis inválida para CREATE INDEX. Usa CREATE INDEX nombre ON db.tabla(columna) [USING HASH|BTREE]')
+        index_name, full_table, column, kind = match.groups()
+        db, table = parse_db_table(full_table)
+        if not is_valid_name(db) or not is_valid_name(table) or not is_valid_name(index_name):
+            raise ValueError('Nombre de base de datos, tabla o índice inválido')
+        with table_write(db, table):
+            table_data = load_table(db, table)
+            if not table_data:
+                raise ValueError(f'Tabla {table} no existe en base {db}')
+            if column not in table_data.data:
+                raise ValueError(f'Columna {column} no existe en la tabla {table}')
+            if index_name in table_data.indexes:
+                raise ValueError(f'El índice {index_name} ya existe en la tabla {table}')
+            table_data.add_index(INDEX_KINDS[(kind or "hash").lower()](index_name, column))
+            save_table(db, table, table_data)
+        return {'message': f'Índice {index_name} creado en {table}({column})'}
+
+    # DROP INDEX
+    if query.lower().startswith("drop index"):
+        # DROP INDEX nombre ON db.tabla, o DROP INDEX db.tabla.nombre
+        match = re.match(r"drop index (\w+) on (\w+)\.(\w+)\s*;?$", query.strip(), re.IGNORECASE)
+        if match:
+            index_name, db, table = match.groups()
+        else:
+            match = re.match(r"drop index (\w+)\.(\w+)\.(\w+)\s*;?$", query.strip(), re.IGNORECASE)
+            if not match:
+                raise ValueError('Sintaxis inválida para DROP INDEX. Usa DROP INDEX nombre ON db.tabla')
+            db, table, index_name = match.groups()
+        with table_write(db, table):
+            table_data = load_table(db, table)
+            if not table_data:
+                raise ValueError(f'Tabla {table} no existe en base {db}')
+            if index_name not in table_data.indexes:
+                raise ValueError(f'El índice {index_name} no existe en la tabla {table}')
+            if table_data.indexes[index_name].unique:
+                raise ValueError(f'El índice {index_name} respalda una restricción PRIMARY KEY/UNIQUE y no se puede eliminar')
+            del table_data.indexes[index_name]
+            save_table(db, table, table_data)
+        return {'message': f'Índice {index_name} eliminado de {table}'}
+
     # CREATE DATABASE
     if query.lower().startswith("create database"):
         match = re.match(r"create database (\w+)", query, re.IGNORECASE)
@@ -278,13 +4143,13 @@ def executor(plan, stmt_type, query, data, stmt_info):
         if os.path.exists(db_path):
             raise ValueError(f'La base de datos {db_name} ya existe')
         os.makedirs(db_path, exist_ok=True)
+        register_database(db_name)
         query_cache.clear()
         return {'message': f'Base de datos {db_name} creada'}
     
     # SHOW DATABASES
     if query.lower().startswith("show databases"):
-        dbs = [d for d in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, d))]
-        return {'databases': dbs}
+        return {'databases': database_names()}
     
     # RENAME DATABASE
     if query.lower().startswith("rename database"):
@@ -301,6 +4166,7 @@ def executor(plan, stmt_type, query, data, stmt_info):
         if os.path.exists(new_path):
             raise ValueError(f'La base de datos {new_db} ya existe')
         os.rename(old_path, new_path)
+        forget_table_state(old_db)
         query_cache.clear()
         return {'message': f'Base de datos {old_db} renombrada a {new_db}'}
     
@@ -316,6 +4182,7 @@ def executor(plan, stmt_type, query, data, stmt_info):
         if not os.path.exists(db_path):
             raise ValueError(f'La base de datos {db_name} no existe')
         shutil.rmtree(db_path)
+        forget_table_state(db_name)
         query_cache.clear()
         return {'message': f'Base de datos {db_name} eliminada'}
 
@@ -338,28 +4205,62 @@ def executor(plan, stmt_type, query, data, stmt_info):
             'JSON', 'XML', 'GEOMETRY'
         ]
         columns_list = []
+        # Restricciones de tabla: PRIMARY KEY (col) / UNIQUE (col)
+        table_constraints = []
         for col_def in columns.replace('\n', '').split(','):
             col_def = col_def.strip().strip(',')
             if not col_def:
                 continue
+            constraint = re.match(r'^(primary\s+key|unique)\s*\(\s*(\w+)\s*\)$', col_def, re.IGNORECASE)
+            if constraint:
+                table_constraints.append((constraint.group(2), constraint.group(1)))
+                continue
             parts = col_def.split()
             if len(parts) < 2:
                 raise ValueError('Cada columna debe tener nombre y tipo, por ejemplo: id INT')
             col_name = parts[0]
             col_type = ' '.join(parts[1:]).upper()
+            column = {"name": col_name}
+            constraint = re.search(r'\s+(PRIMARY\s+KEY|UNIQUE)$', col_type)
+            if constraint:
+                col_type = col_type[:constraint.start()]
+                column["primary_key" if constraint.group(1) != "UNIQUE" else "unique"] = True
+            collation = re.search(r'\s+COLLATE\s+(\w+)$', col_type)
+            if collation:
+                col_type = col_type[:collation.start()]
+                if collation.group(1).lower() not in COLLATIONS:
+                    raise ValueError(f'Collation no soportada: {collation.group(1)}. Usa {", ".join(COLLATIONS)}')
+                if not re.match(r'^(VARCHAR|CHAR|NVARCHAR|TEXT)\b', col_type):
+                    raise ValueError(f'COLLATE solo se admite en columnas de texto: {col_name}')
+                if collation.group(1).lower() != "cs_as":
+                    column["collation"] = collation.group(1).lower()
             # Permitir tipos con parámetros, como VARCHAR(50)
             base_type = re.match(r'^\w+', col_type)
             if not is_valid_name(col_name):
                 raise ValueError(f'Nombre de columna inválido: {col_name}')
             if not base_type or base_type.group(0) not in allowed_types:
                 raise ValueError(f'Tipo de columna no soportado: {col_type}')
-            columns_list.append({"name": col_name, "type": col_type})
+            column["type"] = col_type
+            columns_list.append(column)
         if len(set(col['name'] for col in columns_list)) != len(columns_list):
             raise ValueError('No puede haber columnas repetidas')
-        table_path = os.path.join(DATA_DIR, db, f"{table}.json")
-        if os.path.exists(table_path):
+        for col_name, constraint in table_constraints:
+            column = next((col for col in columns_list if col["name"] == col_name), None)
+            if column is None:
+                raise ValueError(f'Columna {col_name} no existe en la tabla {table}')
+            column["primary_key" if constraint.upper() != "UNIQUE" else "unique"] = True
+        if sum(1 for col in columns_list if col.get("primary_key")) > 1:
+            raise ValueError('Solo puede haber una PRIMARY KEY')
+        if table_exists(db, table):
             raise ValueError(f'La tabla {table} ya existe en base {db}')
-        save_table(db, table, {"columns": columns_list, "rows": []})
+        table_data = TableData(columns_list)
+        # Cada restricción se respalda con un índice hash que verifica duplicados en O(1)
+        for col in columns_list:
+            if col.get("primary_key"):
+                table_data.add_index(HashIndex(f"pk_{table}", col["name"], unique=True))
+            elif col.get("unique"):
+                table_data.add_index(HashIndex(f"uq_{table}_{col['name']}", col["name"], unique=True))
+        save_table(db, table, table_data)
         query_cache.clear()
         return {'message': f'Tabla {table} creada en base {db} con columnas {columns_list}'}
 
@@ -373,10 +4274,14 @@ def executor(plan, stmt_type, query, data, stmt_info):
         db, table = parse_db_table(full_table)
         if not db or not is_valid_name(db) or not is_valid_name(table):
             raise ValueError('Nombre de base de datos o tabla inválido')
-        table_path = os.path.join(DATA_DIR, db, f"{table}.json")
-        if not os.path.exists(table_path):
+        if not table_exists(db, table):
             raise ValueError(f'La tabla {table} no existe en base {db}')
-        os.remove(table_path)
+        with table_write(db, table):
+            # Si la tabla ya tiene respaldos, su último estado queda como versión restaurable
+            table_id = _log_state(db, table)["table_id"]
+            if table_id and os.path.isdir(os.path.join(backup_root(db, table), table_id)):
+                backup_table(db, table, load_table(db, table))
+            drop_table_files(db, table)
         query_cache.clear()
         return {'message': f'Tabla {table} eliminada de la base {db}'}
 
@@ -390,13 +4295,18 @@ def executor(plan, stmt_type, query, data, stmt_info):
         db_new, table_new = parse_db_table(full_new)
         if not db or not db_new or db != db_new or not is_valid_name(table_new):
             raise ValueError('Ambas tablas deben estar en la misma base de datos y tener nombres válidos')
-        old_path = os.path.join(DATA_DIR, db, f"{table}.json")
-        new_path = os.path.join(DATA_DIR, db, f"{table_new}.json")
-        if not os.path.exists(old_path):
+        if not table_exists(db, table):
             raise ValueError(f'La tabla {table} no existe en base {db}')
-        if os.path.exists(new_path):
+        if table_exists(db, table_new):
             raise ValueError(f'La tabla {table_new} ya existe en base {db}')
-        os.rename(old_path, new_path)
+        rename_table_files(db, table, table_new)
+        # Los respaldos acompañan a la tabla
+        if os.path.isdir(backup_root(db, table)):
+            os.makedirs(backup_root(db, table_new), exist_ok=True)
+            for chain in _chain_dirs(db, table):
+                os.rename(chain, os.path.join(backup_root(db, table_new), os.path.basename(chain)))
+            os.rmdir(backup_root(db, table))
+            _backup_states.clear()
         query_cache.clear()
         return {'message': f'Tabla {table} renombrada a {table_new} en base {db}'}
 
@@ -411,48 +4321,26 @@ def executor(plan, stmt_type, query, data, stmt_info):
             raise ValueError('Nombre de base de datos o tabla inválido')
         columns = [c.strip() for c in columns.split(',')]
         values = [v.strip().strip("'") for v in values.split(',')]
-        table_data = load_table(db, table)
-        if not table_data:
+        # Solo hace falta el esquema: la fila se agrega al log sin leer la tabla
+        table_schema = load_table_schema(db, table)
+        if not table_schema:
             raise ValueError(f'Tabla {table} no existe en base {db}')
         # Validar columnas
-        table_columns = [col['name'] for col in table_data["columns"]]
+        table_columns = [col['name'] for col in table_schema]
         print(f"columns: {columns}")
         print(f"table_columns: {table_columns}")
         if set(columns) != set(table_columns):
             raise ValueError('Debes insertar todas las columnas de la tabla y en el mismo orden')
-        # Validar tipos
-        for i, col in enumerate(table_data["columns"]):
-            col_name = col["name"]
-            col_type = col["type"].upper()
-            val = values[i]
-            base_type = re.match(r'^([A-Z]+)', col_type).group(1)
-            if base_type in ['INT', 'BIGINT']:
-                if not re.match(r'^-?\d+$', val):
-                    raise ValueError(f'El valor para {col_name} debe ser un entero')
-            elif base_type in ['DECIMAL', 'FLOAT', 'NUMERIC']:
-                if not re.match(r'^-?\d+(\.\d+)?$', val):
-                    raise ValueError(f'El valor para {col_name} debe ser numérico')
-            elif base_type in ['BIT']:
-                if val not in ['0', '1', 'True', 'False', 'true', 'false']:
-                    raise ValueError(f'El valor para {col_name} debe ser booleano (0/1 o True/False)')
-            elif base_type in ['DATE', 'DATETIME', 'TIMESTAMP']:
-                try:
-                    datetime.datetime.fromisoformat(val)
-                except Exception:
-                    raise ValueError(f'El valor para {col_name} debe ser una fecha válida (YYYY-MM-DD o similar)')
-            elif base_type in ['VARCHAR', 'CHAR', 'NVARCHAR']:
-                # Extraer longitud si existe, por ejemplo VARCHAR(20)
-                length_match = re.search(r'\((\d+)\)', col_type)
-                if length_match:
-                    max_len = int(length_match.group(1))
-                    if len(val) > max_len:
-                        raise ValueError(f'El valor para {col_name} excede la longitud máxima de {max_len} caracteres')
-                if base_type == 'CHAR' and length_match:
-                    if len(val) != max_len:
-                        raise ValueError(f'El valor para {col_name} debe tener exactamente {max_len} caracteres')
-        row = dict(zip(columns, values))
-        table_data["rows"].append(row)
-        save_table(db, table, table_data)
+        # Validar tipos y convertir cada valor a su tipo nativo una sola vez
+        raw_row = dict(zip(columns, values))
+        row = {col["name"]: coerce_value(col, raw_row[col["name"]]) for col in table_schema}
+        if any(column_constraint(col) for col in table_schema):
+            # Con PRIMARY KEY/UNIQUE la verificación y el insert van bajo el mismo lock
+            with table_write(db, table):
+                load_table(db, table).check_unique([row])
+                append_log(db, table, [{"op": "insert", "row": row}])
+        else:
+            append_log(db, table, [{"op": "insert", "row": row}])
         query_cache.clear()
         return {'message': f'Dato insertado en {table} de {db}', 'row': row}
 
@@ -466,76 +4354,56 @@ def executor(plan, stmt_type, query, data, stmt_info):
         db, table = parse_db_table(full_table)
         if not db or not is_valid_name(db) or not is_valid_name(table):
             raise ValueError('Nombre de base de datos o tabla inválido')
-        table_data = load_table(db, table)
-        if not table_data:
-            raise ValueError(f'Tabla {table} no existe en base {db}')
-        backup_table(db, table, table_data)
-        set_col, set_val = [x.strip() for x in set_part.split('=')]
-        where_col, where_val = [x.strip() for x in where_part.split('=')]
-        set_val = set_val.strip("'")
-        where_val = where_val.strip("'")
-        column_names = [col["name"] for col in table_data["columns"]]
-        if set_col not in column_names:
-            raise ValueError(f'Columna {set_col} no existe en la tabla {table}')
-        if where_col not in column_names:
-            raise ValueError(f'Columna {where_col} no existe en la tabla {table}')
-        updated = 0
-        for row in table_data["rows"]:
-            if str(row.get(where_col)) == where_val:
-                row[set_col] = set_val
-                updated += 1
-        save_table(db, table, table_data)
-        query_cache.clear()
-        return {'message': f'{updated} filas actualizadas en {table} de {db}'}
+        with table_write(db, table):
+            table_data = load_table(db, table)
+            if not table_data:
+                raise ValueError(f'Tabla {table} no existe en base {db}')
+            set_col, set_val = [x.strip() for x in set_part.split('=', 1)]
+            set_val = set_val.strip("'")
+            column_names = table_data.column_names
+            if set_col not in column_names:
+                raise ValueError(f'Columna {set_col} no existe en la tabla {table}')
+            for leaf in where_leaves(stmt_info["where"]):
+                if leaf["col"] not in column_names:
+                    raise ValueError(f'Columna {leaf["col"]} no existe en la tabla {table}')
+            # Valor nuevo y literales del WHERE se convierten una sola vez al tipo de su columna
+            set_val = coerce_value(table_data.column_schema(set_col), set_val)
+            matched = where_rows(table_data, stmt_info["where"])
+            table_data.check_unique_update(set_col, matched, set_val)
+            backup_table(db, table, table_data)
+            updated = len(matched)
+            if matched:
+                append_log(db, table, [{"op": "update", "ids": matched, "col": set_col, "value": set_val}])
+            query_cache.clear()
+            return {'message': f'{updated} filas actualizadas en {table} de {db}'}
 
     # DELETE
     if query.lower().startswith("delete from"):
-        match = re.match(r"delete from (\w+\.\w+|\w+) where (\w+)\s*(=|<|>|<=|>=|!=)\s*(.+)", query, re.IGNORECASE)
+        match = re.match(r"delete from (\w+\.\w+|\w+) where (.+)", query, re.IGNORECASE)
         if not match:
             raise ValueError('Sintaxis inválida para DELETE')
-        full_table, where_col, operator, where_val = match.groups()
+        full_table = match.group(1)
         db, table = parse_db_table(full_table)
         if not db or not is_valid_name(db) or not is_valid_name(table):
             raise ValueError('Nombre de base de datos o tabla inválido')
-        table_data = load_table(db, table)
-        if not table_data:
-            raise ValueError(f'Tabla {table} no existe en base {db}')
-        backup_table(db, table, table_data)
-        where_val = where_val.strip("'")
-        column_names = [col["name"] for col in table_data["columns"]]
-        if where_col not in column_names:
-            raise ValueError(f'Columna {where_col} no existe en la tabla {table}')
-
-        def compare(val1, op, val2):
-            try:
-                val1 = float(val1)
-                val2 = float(val2)
-            except:
-                pass  # si no son numéricos, se comparan como strings
-            if op == "=":
-                return val1 == val2
-            elif op == ">":
-                return val1 > val2
-            elif op == "<":
-                return val1 < val2
-            elif op == ">=":
-                return val1 >= val2
-            elif op == "<=":
-                return val1 <= val2
-            elif op == "!=":
-                return val1 != val2
-            else:
-                raise ValueError("Operador desconocido")
-
-        before = len(table_data["rows"])
-        table_data["rows"] = [
-            row for row in table_data["rows"]
-            if not compare(row.get(where_col), operator, where_val)
-        ]
-        deleted = before - len(table_data["rows"])
-        save_table(db, table, table_data)
-        query_cache.clear()
-        return {'message': f'{deleted} filas eliminadas de {table} en {db}'}
+        with table_write(db, table):
+            table_data = load_table(db, table)
+            if not table_data:
+                raise ValueError(f'Tabla {table} no existe en base {db}')
+            column_names = table_data.column_names
+            for leaf in where_leaves(stmt_info["where"]):
+                if leaf["col"] not in column_names:
+                    raise ValueError(f'Columna {leaf["col"]} no existe en la tabla {table}')
+            # Una comparación solo recorre los grupos de filas cuyo zone map la admite
+            matched = where_rows(table_data, stmt_info["where"])
+            backup_table(db, table, table_data)
+            deleted = len(matched)
+            if matched:
+                # Solo se marcan las filas en el log; el vacuum las elimina del archivo más tarde
+                append_log(db, table, [{"op": "tombstone", "ids": matched}])
+                schedule_vacuum(db, table, load_table(db, table))
+            query_cache.clear()
+            return {'message': f'{deleted} filas eliminadas de {table} en {db}'}
 
 
     raise ValueError('Solo se soportan CREATE TABLE, INSERT, SELECT, UPDATE y DELETE básicos con db.tabla')
@@ -544,6 +4412,48 @@ def executor(plan, stmt_type, query, data, stmt_info):
 # ENDPOINT PRINCIPAL: EJECUCIÓN DE SQL (modularizado)
 # ==========================
 
+# Filas por fragmento de la respuesta en streaming
+STREAM_CHUNK_ROWS = 500
+_stream_encoder = json.JSONEncoder(default=json_default, sort_keys=True, separators=(",", ":"))
+
+def stream_result(result, started):
+    """
+    Respuesta de un SELECT cuyas filas llegan de un generador: el JSON se
+    escribe por fragmentos a medida que el pipeline produce las filas, así ni
+    el resultado ni su serialización completa quedan en memoria. El conteo de
+    filas y el tiempo de ejecución van al final del objeto.
+    El primer fragmento se produce antes de responder: el sort y la agregación
+    terminan antes de la primera fila, así que si fallan el error sale con el
+    400 habitual (lo lanza esta función).
+    """
+    rows = iter(result.pop("rows"))
+    first = list(itertools.islice(rows, STREAM_CHUNK_ROWS))
+    encode = _stream_encoder.encode
+    def generate():
+        yield '{"rows": ['
+        count = 0
+        chunk = []
+        try:
+            # Cada fragmento se codifica de una vez (una lista JSON sin los corchetes)
+            for row in itertools.chain(first, rows):
+                chunk.append(row)
+                if len(chunk) == STREAM_CHUNK_ROWS:
+                    yield ("," if count else "") + encode(chunk)[1:-1]
+                    count += len(chunk)
+                    chunk = []
+            if chunk:
+                yield ("," if count else "") + encode(chunk)[1:-1]
+                count += len(chunk)
+        except Exception as e:
+            # El estado HTTP ya se envió: el error va dentro del objeto (el frontend lo revisa)
+            result["error"] = str(e)
+        result["rows_affected"] = count
+        result["execution_time"] = time.time() - started
+        print(f"Consulta ejecutada en {result['execution_time']:.4f} segundos")
+        print(f"{count}")
+        yield "], " + encode(result)[1:]
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
 @app.route('/execute', methods=['POST'])
 def execute_sql():
     """
@@ -559,12 +4469,15 @@ def execute_sql():
         # 2. Algebrizer
         stmt_info = algebrizer(stmt)
         stmt_type = stmt_info["type"]
-        if stmt_type not in ['SELECT', 'INSERT', 'UPDATE', 'DELETE', 'CREATE', 'DROP', 'COMMAND']:
+        if stmt_type not in ['SELECT', 'INSERT', 'UPDATE', 'DELETE', 'CREATE', 'DROP', 'COMMAND', 'ANALYZE']:
             return jsonify({'error': f'Tipo de consulta no soportado: {stmt_type}'}), 400
         # 3. Optimizer/Planner (incluye caché)
-        plan = optimizer(stmt_type, query)
+        plan = optimizer(stmt_type, query, stmt_info)
         # 4. Executor
         result = executor(plan, stmt_type, query, data, stmt_info)
+        if "rows" in result and not isinstance(result["rows"], list):
+            # SELECT en pipeline: las filas se producen mientras se envía la respuesta
+            return stream_result(result, tiempo_inicio)
         tiempo_ejecucion = time.time()-tiempo_inicio
         print("Data:", result)
         result['execution_time'] = tiempo_ejecucion # TIEMPO DE EJECUCIÓN
@@ -687,11 +4600,15 @@ def list_backups():
     """Lista los respaldos de una tabla."""
     db = request.args.get('db')
     table = request.args.get('table')
+    if not db or not table or not is_valid_name(db) or not is_valid_name(table):
+        return jsonify({'error': 'Nombre de base de datos o tabla inválido'}), 400
     backup_dir = os.path.join(DATA_DIR, db, "backups")
     if not os.path.exists(backup_dir):
-        return jsonify({'backups': []})
-    files = [f for f in os.listdir(backup_dir) if f.startswith(table)]
-    return jsonify({'backups': files})
+        return jsonify({'backups': [], 'versions': []})
+    # Respaldos completos del formato anterior ("<tabla>_<fecha>.json")
+    files = sorted(f for f in os.listdir(backup_dir) if f.startswith(f"{table}_") and f.endswith(".json"))
+    versions = list_backup_versions(db, table)
+    return jsonify({'backups': files + [v["name"] for v in versions], 'versions': versions})
 
 @app.route('/restore_backup', methods=['POST'])
 def restore_backup():
@@ -699,20 +4616,39 @@ def restore_backup():
     data = request.json
     db = data.get('db')
     table = data.get('table')
-    backup_file = data.get('backup_file')
-    backup_path = os.path.join(DATA_DIR, db, "backups", backup_file)
-    if not os.path.exists(backup_path):
-        return jsonify({'error': 'Backup no encontrado'}), 404
-    with open(backup_path, "r") as f:
-        backup_data = json.load(f)
-    save_table(db, table, backup_data)
+    backup_file = data.get('backup_file') or ''
+    version = data.get('version')
+    if not db or not table or not is_valid_name(db) or not is_valid_name(table):
+        return jsonify({'error': 'Nombre de base de datos o tabla inválido'}), 400
+    match = re.match(rf'^{re.escape(table)}_v(\d+)_', backup_file)
+    if version is None and match:
+        version = match.group(1)
+    if version is not None:
+        restored = rebuild_backup_version(db, table, int(version))
+        if restored is None:
+            return jsonify({'error': 'Backup no encontrado'}), 404
+    else:
+        backup_path = os.path.join(DATA_DIR, db, "backups", os.path.basename(backup_file))
+        if not backup_file or not os.path.exists(backup_path):
+            return jsonify({'error': 'Backup no encontrado'}), 404
+        with open(backup_path, "r") as f:
+            backup_data = json.load(f)
+        restored = TableData.from_rows(backup_data["columns"], backup_data["rows"])
+    with table_write(db, table):
+        current = load_table(db, table)
+        if current:
+            # La restauración también se puede deshacer
+            backup_table(db, table, current)
+            restored.table_id = current.table_id
+        save_table(db, table, restored)
+        journal_restore(db, table, restored)
+    query_cache.clear()
     return jsonify({'message': f'Respaldo restaurado para {table} en {db}'})
 
 @app.route('/databases', methods=['GET'])
 def list_databases():
     """Lista todas las bases de datos."""
-    dbs = [d for d in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, d))]
-    return jsonify({'databases': dbs})
+    return jsonify({'databases': database_names()})
 
 @app.route('/drop_database', methods=['POST'])
 def drop_database():
@@ -725,6 +4661,7 @@ def drop_database():
     if not os.path.exists(db_path):
         return jsonify({'error': f'La base de datos {db} no existe'}), 400
     shutil.rmtree(db_path)
+    forget_table_state(db)
     query_cache.clear()
     return jsonify({'message': f'Base de datos {db} eliminada'})
 
@@ -732,13 +4669,12 @@ def drop_database():
 def list_tables():
     """Lista todas las tablas de una base de datos."""
     db = request.args.get('db')
-    db_path = os.path.join(DATA_DIR, db)
     if not db or not is_valid_name(db):
         return jsonify({'error': 'Nombre de base de datos inválido'}), 400
-    if not os.path.exists(db_path):
+    tables = database_catalog(db)
+    if tables is None:
         return jsonify({'error': f'La base de datos {db} no existe'}), 400
-    tables = [f[:-5] for f in os.listdir(db_path) if f.endswith('.json') and f != "backups"]
-    return jsonify({'tables': tables})
+    return jsonify({'tables': sorted(tables)})
 
 @app.route('/columns', methods=['GET'])
 def get_columns():
@@ -746,10 +4682,14 @@ def get_columns():
     table = request.args.get('table')
     if not db or not table:
         return jsonify({'error': 'Faltan parámetros'}), 400
-    table_data = load_table(db, table)
-    if not table_data or "columns" not in table_data:
+    if not is_valid_name(db) or not is_valid_name(table):
+        return jsonify({'error': 'Nombre de base de datos o tabla inválido'}), 400
+    # Se responde desde el catálogo, sin cargar los datos de la tabla
+    entry = catalog_entry(db, table)
+    if entry is None:
         return jsonify({'error': 'Tabla no encontrada'}), 404
-    return jsonify({'columns': table_data["columns"]})
+    return jsonify({'columns': entry["columns"], 'rows': entry["rows"], 'size': entry["size"],
+                    'indexes': entry.get("indexes", [])})
 
 # ==========================
 # ENDPOINT DE REGISTRO DE USUARIO
@@ -790,30 +4730,60 @@ def upload_csv():
     db_path = os.path.join(DATA_DIR, db)
     if not os.path.exists(db_path):
         os.makedirs(db_path)  # Crea la base si no existe
+        register_database(db)
 
-    table_path = os.path.join(db_path, f"{table}.json")
-    if os.path.exists(table_path):
-        table_data = load_table(db, table)
-    else:
-        # Si la tabla no existe, crea una nueva con columnas del CSV (tipo VARCHAR por defecto)
-        reader = csv.DictReader(StringIO(file.read().decode('utf-8')))
-        columns = reader.fieldnames
-        table_data = {
-            "columns": [{"name": col, "type": "VARCHAR(255)"} for col in columns],
-            "rows": []
-        }
-        file.seek(0)  # Regresa el puntero para volver a leer
-
-    reader = csv.DictReader(StringIO(file.read().decode('utf-8')))
-    count = 0
-    for row in reader:
-        filtered_row = {col["name"]: row[col["name"]] for col in table_data["columns"] if col["name"] in row}
-        table_data["rows"].append(filtered_row)
-        count += 1
-    save_table(db, table, table_data)
+    content = file.read().decode('utf-8')
+    with table_write(db, table):
+        if table_exists(db, table):
+            table_data = load_table(db, table)
+        else:
+            # Si la tabla no existe, crea una nueva con columnas del CSV y el tipo inferido de sus valores
+            reader = csv.DictReader(StringIO(content))
+            rows = list(reader)
+            table_data = TableData([
+                {"name": col, "type": infer_column_type([row.get(col) for row in rows])}
+                for col in reader.fieldnames
+            ])
+
+        # Se convierten todas las filas antes de tocar la tabla
+        reader = csv.DictReader(StringIO(content))
+        typed_rows = []
+        try:
+            for row in reader:
+                typed_rows.append({
+                    col["name"]: coerce_csv_value(col, row[col["name"]])
+                    for col in table_data.columns if col["name"] in row
+                })
+        except ValueError as e:
+            return jsonify({'error': f'Fila {len(typed_rows) + 1} del CSV: {e}'}), 400
+        try:
+            table_data.check_unique(typed_rows)
+        except ValueError as e:
+            return jsonify({'error': f'CSV: {e}'}), 400
+        if not table_exists(db, table):
+            save_table(db, table, table_data)
+        count = len(typed_rows)
+        if typed_rows:
+            append_log(db, table, [{"op": "insert", "row": row} for row in typed_rows])
+    query_cache.clear()
     return jsonify({'message': f'{count} filas agregadas a {table} en {db} desde CSV'})
 
 
+@app.route('/stats', methods=['GET'])
+def engine_stats():
+    """Métricas internas del motor de almacenamiento."""
+    return jsonify({
+        'buffer_pool': buffer_pool.stats(),
+        'group_commit': group_commit_stats(),
+        'recovery': recovery_stats,
+        'checkpoint': {
+            'interval_seconds': CHECKPOINT_INTERVAL,
+            'max_log_records': LOG_COMPACT_RECORDS,
+            # Registros que habría que reaplicar si el proceso se cayera ahora
+            'pending_records': sum(state["records"] for state in list(_log_states.values()))
+        }
+    })
+
 @app.route('/health', methods=['GET'])
 def health():
     """Endpoint de salud para verificar si el backend está corriendo."""
@@ -822,5 +4792,7 @@ def health():
 # ==========================
 # INICIO DE LA APP
 # ==========================
+recover_storage()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
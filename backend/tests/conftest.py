@@ -0,0 +1,51 @@
+import itertools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_names = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    # DATA_DIR es relativo al directorio de trabajo: las pruebas usan uno vacío
+    os.chdir(tmp_path_factory.mktemp("datos"))
+    import app as module
+    module.print = lambda *args, **kwargs: None
+    return module
+
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+
+@pytest.fixture
+def db(app, client):
+    name = f"prueba{next(_names)}"
+    assert "error" not in run(client, f"CREATE DATABASE {name}")
+    return name
+
+
+def run(client, sql):
+    """Ejecuta una consulta por /execute y devuelve la respuesta completa (también si se transmite)."""
+    response = client.post("/execute", json={"query": sql})
+    return response.get_json()
+
+
+def start(app, sql):
+    """Ejecuta una consulta hasta el executor, sin consumir las filas del resultado."""
+    stmt_info = app.algebrizer(app.parser(sql))
+    plan = app.optimizer(stmt_info["type"], sql, stmt_info)
+    return app.executor(plan, stmt_info["type"], sql, {}, stmt_info)
+
+
+def fill(app, db, table, rows):
+    """Carga filas directamente en una tabla ya creada."""
+    data = app.load_table(db, table)
+    for row in rows:
+        data.append(row)
+    app.save_table(db, table, data)
@@ -0,0 +1,27 @@
+from conftest import fill, run
+
+
+def test_sum_without_values_is_null(app, client, db):
+    run(client, f"CREATE TABLE {db}.a (id INT, g INT, v INT)")
+    assert run(client, f"SELECT SUM(v) FROM {db}.a")["rows"] == [{"sum_v": None}]
+    fill(app, db, "a", [{"id": 1, "g": 1, "v": None}, {"id": 2, "g": 1, "v": None},
+                        {"id": 3, "g": 2, "v": 5}, {"id": 4, "g": 2, "v": None}])
+    assert run(client, f"SELECT SUM(v) FROM {db}.a WHERE id > 10")["rows"] == [{"sum_v": None}]
+    rows = run(client, f"SELECT g, SUM(v), COUNT(v) FROM {db}.a GROUP BY g")["rows"]
+    assert sorted(rows, key=lambda row: row["g"]) == [{"g": 1, "sum_v": None, "count_v": 0},
+                                                      {"g": 2, "sum_v": 5, "count_v": 1}]
+    # Un grupo cuya suma es NULL no cumple ninguna comparación del HAVING
+    assert run(client, f"SELECT g FROM {db}.a GROUP BY g HAVING SUM(v) < 10")["rows"] == [{"g": 2}]
+    assert run(client, f"SELECT g FROM {db}.a GROUP BY g HAVING SUM(v) != 5")["rows"] == []
+
+
+def test_having_compiled_once(app, client, db, monkeypatch):
+    run(client, f"CREATE TABLE {db}.a (id INT, g INT)")
+    fill(app, db, "a", ({"id": i, "g": i % 300} for i in range(3000)))
+    calls = []
+    make_predicate = app.make_predicate
+    monkeypatch.setattr(app, "make_predicate", lambda *args: calls.append(args) or make_predicate(*args))
+    rows = run(client, f"SELECT g, COUNT(*) FROM {db}.a GROUP BY g HAVING COUNT(*) >= 10 AND SUM(id) >= 15500")["rows"]
+    assert sorted(row["g"] for row in rows) == list(range(200, 300))
+    assert all(row["count_*"] == 10 and "sum_id" not in row for row in rows)
+    assert len([args for args in calls if args[0] in (">=", ">")]) == 2
@@ -0,0 +1,38 @@
+import os
+
+from conftest import fill, run
+
+
+def rows(data):
+    return sorted(data.iter_rows(), key=lambda row: row["id"]) if data is not None else None
+
+
+def test_backup_rebase_runs_in_background(app, client, db, monkeypatch):
+    monkeypatch.setattr(app, "BACKUP_MAX_VERSIONS", 2)
+    scheduled = []
+    monkeypatch.setattr(app, "schedule_maintenance", lambda task, *table: scheduled.append((task, *table)))
+    run(client, f"CREATE TABLE {db}.a (id INT, v INT)")
+    fill(app, db, "a", ({"id": i, "v": 0} for i in range(100)))
+    for step in range(6):
+        assert "error" not in run(client, f"UPDATE {db}.a SET v = {step + 1} WHERE id < {step * 10 + 10}")
+        assert "error" not in run(client, f"INSERT INTO {db}.a (id, v) VALUES ({1000 + step}, {step})")
+    chain = app._chain_dirs(db, "a")[0]
+    base = os.path.join(chain, "base.qct")
+    before = os.stat(base).st_mtime_ns
+    versions = [v["version"] for v in app.list_backup_versions(db, "a")]
+    expected = {version: rows(app.rebuild_backup_version(db, "a", version)) for version in versions}
+    # La escritura solo encola la consolidación: la base sigue intacta
+    assert (app.rebase_backups, db, "a") in scheduled
+    assert os.stat(base).st_mtime_ns == before
+
+    app.rebase_backups(db, "a")
+    kept = [v["version"] for v in app.list_backup_versions(db, "a")]
+    assert kept == versions[-2:]
+    for version in kept:
+        assert rows(app.rebuild_backup_version(db, "a", version)) == expected[version]
+    assert app.rebuild_backup_version(db, "a", versions[0]) is None
+    # Los cambios posteriores se siguen registrando sobre la base nueva
+    assert "error" not in run(client, f"DELETE FROM {db}.a WHERE id < 50")
+    assert "error" not in run(client, f"UPDATE {db}.a SET v = 99 WHERE id = 99")
+    latest = app.list_backup_versions(db, "a")[-1]["version"]
+    assert {row["id"] for row in rows(app.rebuild_backup_version(db, "a", latest))} == set(range(50, 100)) | set(range(1000, 1006))
@@ -0,0 +1,36 @@
+import datetime
+
+import pytest
+
+from conftest import fill, run
+
+
+def join_strategy(app, sql):
+    stmt_info = app.algebrizer(app.parser(sql))
+    return app.optimizer(stmt_info["type"], sql, stmt_info)["joins"][0]["strategy"]
+
+
+@pytest.mark.parametrize("key_type, value", [
+    ("INT", lambda i: i),
+    ("DATE", lambda i: datetime.date(2024, 1, 1) + datetime.timedelta(days=i)),
+    ("VARCHAR(10)", lambda i: str(i)),
+])
+def test_merge_join_requires_same_key_type(app, client, db, key_type, value):
+    run(client, f"CREATE TABLE {db}.a (id INT, k INT)")
+    run(client, f"CREATE TABLE {db}.b (id INT, k {key_type})")
+    fill(app, db, "a", ({"id": i, "k": i} for i in range(2000)))
+    fill(app, db, "b", ({"id": i, "k": value(i)} for i in range(2000)))
+    for table in ("a", "b"):
+        assert "error" not in run(client, f"CREATE INDEX ix_{table} ON {db}.{table}(k) USING BTREE")
+    sql = f"SELECT a.id, b.id FROM {db}.a JOIN {db}.b ON a.k = b.k"
+    strategy = join_strategy(app, sql)
+    result = run(client, sql)
+    assert "error" not in result
+    if key_type == "INT":
+        assert strategy == "merge"
+        assert len(result["rows"]) == 2000
+    else:
+        # Claves de tipos distintos: nunca merge, que compararía INT con DATE/TEXT
+        assert strategy != "merge"
+        # Con texto la clave del JOIN es el valor como texto (collation por defecto)
+        assert len(result["rows"]) == (2000 if key_type.startswith("VARCHAR") else 0)
@@ -0,0 +1,37 @@
+import os
+import time
+
+from conftest import fill, run
+
+
+def test_recovery_does_not_rewrite_table(app, client, db, monkeypatch):
+    run(client, f"CREATE TABLE {db}.a (id INT, v VARCHAR(10))")
+    fill(app, db, "a", ({"id": i, "v": f"v{i}"} for i in range(50000)))
+    assert "error" not in run(client, f"INSERT INTO {db}.a (id, v) VALUES (-1, 'nuevo')")
+    path = app.table_path(db, "a")
+    before = os.stat(path).st_mtime_ns
+    # Reinicio: sin estado en memoria y con una línea cortada al final del log
+    app.forget_table_state(db, "a")
+    with open(app.log_path(db, "a"), "ab") as f:
+        f.write(b'{"lsn": 99, "op": "ins')
+    scheduled = []
+    monkeypatch.setattr(app, "schedule_compaction", lambda *table: scheduled.append(table))
+    started = time.perf_counter()
+    assert app.recover_table(db, "a") == 1
+    assert time.perf_counter() - started < 0.5
+    assert os.stat(path).st_mtime_ns == before
+    assert scheduled == [(db, "a")]
+    # El registro se aplica al cargar la tabla
+    assert run(client, f"SELECT id, v FROM {db}.a WHERE id = -1")["rows"] == [{"id": -1, "v": "nuevo"}]
+    assert run(client, f"SELECT COUNT(*) FROM {db}.a")["rows"] == [{"count_*": 50001}]
+
+
+def test_recovery_removes_empty_log(app, client, db):
+    run(client, f"CREATE TABLE {db}.a (id INT)")
+    fill(app, db, "a", ({"id": i} for i in range(10)))
+    with open(app.log_path(db, "a"), "wb") as f:
+        f.write(b'{"lsn": 1, "op"')
+    app.forget_table_state(db, "a")
+    assert app.recover_table(db, "a") == 0
+    assert not os.path.exists(app.log_path(db, "a"))
+    assert len(run(client, f"SELECT id FROM {db}.a")["rows"]) == 10
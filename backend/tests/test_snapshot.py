@@ -0,0 +1,48 @@
+from conftest import fill, run, start
+
+N = 5000
+
+
+def _table(app, client, db):
+    run(client, f"CREATE TABLE {db}.a (id INT, v INT)")
+    fill(app, db, "a", ({"id": i, "v": i % 5} for i in range(N)))
+
+
+def test_stream_survives_delete_and_vacuum(app, client, db):
+    _table(app, client, db)
+    query = f"SELECT id, v FROM {db}.a WHERE v = 3"
+    result = start(app, query)
+    rows = iter(result["rows"])
+    first = [next(rows), next(rows)]
+    assert "error" not in run(client, f"DELETE FROM {db}.a WHERE id < 4000")
+    app.vacuum_table(db, "a")
+    got = first + list(rows)
+    assert got == [{"id": i, "v": 3} for i in range(N) if i % 5 == 3]
+    # El resultado ya no es el vigente: no queda en caché
+    assert query not in app.query_cache
+    assert run(client, query)["rows"] == [{"id": i, "v": 3} for i in range(4000, N) if i % 5 == 3]
+
+
+def test_stream_does_not_see_update_or_insert(app, client, db):
+    _table(app, client, db)
+    result = start(app, f"SELECT id, v FROM {db}.a")
+    rows = iter(result["rows"])
+    first = next(rows)
+    assert "error" not in run(client, f"UPDATE {db}.a SET v = 9 WHERE id > 10")
+    assert "error" not in run(client, f"INSERT INTO {db}.a (id, v) VALUES (-1, 9)")
+    got = [first] + list(rows)
+    assert got == [{"id": i, "v": i % 5} for i in range(N)]
+    assert run(client, f"SELECT COUNT(*) FROM {db}.a WHERE v = 9")["rows"] == [{"count_*": N - 11 + 1}]
+
+
+def test_stream_with_index_survives_vacuum(app, client, db):
+    _table(app, client, db)
+    assert "error" not in run(client, f"CREATE INDEX idx_v ON {db}.a (v) USING BTREE")
+    result = start(app, f"SELECT id FROM {db}.a ORDER BY v DESC")
+    rows = iter(result["rows"])
+    first = next(rows)
+    run(client, f"DELETE FROM {db}.a WHERE v = 4")
+    app.vacuum_table(db, "a")
+    got = [first] + list(rows)
+    assert sorted(row["id"] for row in got) == list(range(N))
+    assert [row["id"] % 5 for row in got] == sorted((i % 5 for i in range(N)), reverse=True)
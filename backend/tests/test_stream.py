@@ -0,0 +1,36 @@
+import pytest
+
+from conftest import fill, run
+
+
+def failing_rows(count):
+    for i in range(count):
+        yield {"id": i}
+    raise ValueError("fallo en el pipeline")
+
+
+@pytest.fixture
+def stream(app, monkeypatch):
+    """Hace que el executor devuelva filas de un generador que falla tras `count` filas."""
+    def set_rows(count):
+        monkeypatch.setattr(app, "executor", lambda *args: {"rows": failing_rows(count)})
+    return set_rows
+
+
+def test_stream_error_before_first_chunk_is_400(app, client, db, stream):
+    run(client, f"CREATE TABLE {db}.a (id INT)")
+    fill(app, db, "a", ({"id": i} for i in range(10)))
+    stream(3)
+    response = client.post("/execute", json={"query": f"SELECT id FROM {db}.a ORDER BY id"})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "fallo en el pipeline"}
+
+
+def test_stream_error_after_first_chunk_is_reported(app, client, db, stream):
+    run(client, f"CREATE TABLE {db}.a (id INT)")
+    stream(app.STREAM_CHUNK_ROWS + 10)
+    response = client.post("/execute", json={"query": f"SELECT id FROM {db}.a"})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["error"] == "fallo en el pipeline"
+    assert data["rows_affected"] == app.STREAM_CHUNK_ROWS
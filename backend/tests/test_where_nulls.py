@@ -0,0 +1,55 @@
+import pytest
+
+from conftest import fill, run
+
+ROWS = [{"id": i, "v": None if i % 4 == 0 else i % 7, "t": None if i % 5 == 0 else f"s{i % 3}"} for i in range(60)]
+
+# Cada forma negada contra NULL: solo IS [NOT] NULL cumple con un valor NULL
+CASES = [
+    ("v != 5", lambda r: r["v"] is not None and r["v"] != 5),
+    ("v <> 5", lambda r: r["v"] is not None and r["v"] != 5),
+    ("NOT v = 5", lambda r: r["v"] is not None and r["v"] != 5),
+    ("NOT v < 5", lambda r: r["v"] is not None and r["v"] >= 5),
+    ("NOT (v >= 5)", lambda r: r["v"] is not None and r["v"] < 5),
+    ("NOT v BETWEEN 2 AND 4", lambda r: r["v"] is not None and not 2 <= r["v"] <= 4),
+    ("v NOT IN (5, 6)", lambda r: r["v"] is not None and r["v"] not in (5, 6)),
+    ("NOT v IN (5)", lambda r: r["v"] is not None and r["v"] != 5),
+    ("v IN (5, NULL)", lambda r: r["v"] == 5),
+    ("v NOT IN (5, NULL)", lambda r: False),
+    ("v = NULL", lambda r: False),
+    ("v != NULL", lambda r: False),
+    ("NOT v = NULL", lambda r: False),
+    ("v IS NOT NULL", lambda r: r["v"] is not None),
+    ("NOT v IS NULL", lambda r: r["v"] is not None),
+    ("NOT (v = 5 OR v IS NULL)", lambda r: r["v"] is not None and r["v"] != 5),
+    ("NOT (v = 5 AND t = 's1')",
+     lambda r: (r["v"] is not None and r["v"] != 5) or (r["t"] is not None and r["t"] != "s1")),
+    ("t != 's1'", lambda r: r["t"] is not None and r["t"] != "s1"),
+    ("NOT t = 's1'", lambda r: r["t"] is not None and r["t"] != "s1"),
+    ("t NOT LIKE 's1%'", lambda r: r["t"] is not None and not r["t"].startswith("s1")),
+    ("NOT t IN ('s0', 's2')", lambda r: r["t"] is not None and r["t"] not in ("s0", "s2")),
+]
+
+
+@pytest.fixture(params=[False, True], ids=["scan", "indice"])
+def table(request, app, client, db):
+    run(client, f"CREATE TABLE {db}.a (id INT, v INT, t VARCHAR(5))")
+    fill(app, db, "a", ROWS)
+    if request.param:
+        assert "error" not in run(client, f"CREATE INDEX idx_v ON {db}.a (v) USING BTREE")
+    return f"{db}.a"
+
+
+@pytest.mark.parametrize("where, expected", CASES, ids=[case[0] for case in CASES])
+def test_negated_forms_exclude_null(client, table, where, expected):
+    result = run(client, f"SELECT id FROM {table} WHERE {where}")
+    assert [row["id"] for row in result["rows"]] == [r["id"] for r in ROWS if expected(r)]
+
+
+def test_update_and_delete_follow_the_same_logic(client, table):
+    run(client, f"UPDATE {table} SET t = 'x' WHERE v != 5")
+    assert [row["id"] for row in run(client, f"SELECT id FROM {table} WHERE t = 'x'")["rows"]] == \
+        [r["id"] for r in ROWS if r["v"] is not None and r["v"] != 5]
+    run(client, f"DELETE FROM {table} WHERE NOT v = 5")
+    assert [row["id"] for row in run(client, f"SELECT id FROM {table}")["rows"]] == \
+        [r["id"] for r in ROWS if r["v"] is None or r["v"] == 5]
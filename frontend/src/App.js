@@ -331,7 +331,8 @@ const refreshDatabases = async (dbToRefresh = null) => {
           body: JSON.stringify({ query: q })
         });
         const data = await response.json();
-        if (!response.ok) {
+        // Un SELECT en streaming que falla a mitad de camino responde 200 con "error"
+        if (!response.ok || data.error) {
           setError(data.error || 'Error desconocido');
           break; // Detén si hay error
         } else {